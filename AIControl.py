@@ -1,21 +1,74 @@
 from dotenv import load_dotenv; load_dotenv()
-from google import genai
+from typing import Dict, List, Optional, Tuple
 import asyncio
+import copy
 import json
 import os
+import threading
+import time
+from promptTemplates import get_template, PromptLedger, format_report, RESPONSE_SCHEMA
+from sessionPool import SessionPool, make_client
 
+MODEL = 'gemini-2.0-flash-thinking-exp'
+# The briefing comes from a versioned template; FAKEWORLD_PROMPT_VERSION and FAKEWORLD_SCENARIO pick it
+template = get_template(os.environ.get("FAKEWORLD_PROMPT_VERSION"), os.environ.get("FAKEWORLD_SCENARIO"))
+# With FAKEWORLD_STRUCTURED=1 the API enforces the response schema and answers with bare JSON,
+# so the briefing leaves the schema out
+STRUCTURED = os.environ.get("FAKEWORLD_STRUCTURED") == "1"
+BRIEFING = template.render(include_schema=not STRUCTURED)
+# Used for batched requests: several independent worlds in, one JSON array of responses out
+BATCH_BRIEFING = template.render(batch=True, include_schema=not STRUCTURED)
+# A response that doesn't parse is asked for again this many times
+MAX_PARSE_RETRIES = 1
+# Chat turns kept after the briefing; older ones are dropped so the history sent with every
+# message stops growing on long runs (0 keeps everything)
+MAX_HISTORY_TURNS = int(os.environ.get("FAKEWORLD_MAX_HISTORY_TURNS", "20"))
+# decisions asked for, and how many of them shared a request already in flight
+stats = {"requests": 0, "parse_failures": 0, "decisions": 0, "coalesced": 0}
+# Concurrent identical observations for the same session share one request; FAKEWORLD_COALESCE=0 turns it off
+COALESCE = os.environ.get("FAKEWORLD_COALESCE", "1") != "0"
 
-# print("Connecting to Google AI Studio...")
-client = genai.Client(api_key=os.environ.get("GOOGLE_GENAI_API_KEY"), http_options={'api_version':'v1alpha'})
-# print("Connected to Google AI Studio.")
-# print("Creating chat session...")
+
+def response_config(structured: bool, batch: bool = False) -> Optional[dict]:
+    """Generation config asking the API for JSON matching the AIResponse schema"""
+    if not structured:
+        return None
+    schema = {"type": "array", "items": RESPONSE_SCHEMA} if batch else RESPONSE_SCHEMA
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+# Tokens sent per prompt component, see ledger.report()
+ledger = PromptLedger()
+
+# One client for every chat, so they all share its pooled connections (FAKEWORLD_MAX_CONNECTIONS,
+# FAKEWORLD_MAX_KEEPALIVE, FAKEWORLD_KEEPALIVE_EXPIRY)
+client = make_client()
 chat = client.aio.chats.create(
-    model='gemini-2.0-flash-thinking-exp',
+    model=MODEL,
+    config=response_config(STRUCTURED),
 )
-# print("Chat session created.")
+
+# The client's keep-alive connections belong to the event loop that opened them, and callers come
+# from many loops (asyncio.run in scripts, AISession's private loop, headlessRender's), some of them
+# closed later. So every request runs on this one loop, which lives as long as the process.
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name="ai-loop", daemon=True).start()
+
+
+def run_blocking(coroutine):
+    """Run a coroutine on the AI loop and wait for its result, from a thread not running that loop"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
+
+
+def _on_ai_loop(coroutine):
+    """Await a coroutine on the AI loop from any other loop"""
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, _loop))
+
 
 print('Sending AI basic briefing...')
-asyncio.run(chat.send_message('you are connected to a robot you have multipule sensors and other AI systems working in conjunction with you. some of which can act as your motor control, an object detection model to serve as your eyes and much more. you will be given what you see in JSON format and therefore you respond in the following json schema:{"$schema": "http://json-schema.org/draft-04/schema#","type": "object","properties": {"focusObject": {"type": "string"},"movementDirectionObject": {"type": "string"},"interactions": {"type": "array","items": [{"type": "object","properties": {"with_": {"type": "string"},"type": {"type": "string"}, "extraData":{"type":"string"}},"required": ["with_","type"]}]}},"required": ["focusObject","movementDirectionObject","interactions"]}. also when you respond with the object to interact with you MUST use the full name given to you of the object or the movement core will not work. Also the extra parameters for interaction is used for what to say when talking so when you respond put what you would say in that field. The extraData is STRICTLY only for use when needed such as when talking or specifically requested by the interaction. PLEASE RESPOND EXCLUSIVELY IN JSON FORMAT.'))
+ledger.start_session(BRIEFING, run_blocking(chat.send_message(BRIEFING)).text)
+# Chat sessions for callers that pass a session key (an agent, a scenario), started from this briefing
+sessions = SessionPool(client, MODEL, response_config(STRUCTURED), briefing_history=chat.get_history()[:2],
+                       briefing=BRIEFING)
 
 
 def solve_fast(s):
@@ -23,13 +76,268 @@ def solve_fast(s):
     ind2 = s.rfind('\n')
     return s[ind1+1:ind2]
 
-async def transmitAndPost(tosend: dict):
-    tosend = json.dumps(tosend)
+def parse_response(text: str, structured: bool = STRUCTURED):
+    # Structured responses are bare JSON; prose ones come in a code fence
+    return json.loads(text if structured else solve_fast(text))
+
+async def send_observation(session, tosend: dict, structured: bool, session_ledger: PromptLedger):
+    """Send one observation to a chat session, asking again if the answer doesn't parse"""
+    message = json.dumps(tosend)
+    for attempt in range(MAX_PARSE_RETRIES + 1):
+        response = await session.send_message(message)
+        stats["requests"] += 1
+        session_ledger.record(tosend, response.text)
+        try:
+            return parse_response(response.text, structured)
+        except ValueError:
+            stats["parse_failures"] += 1
+            if attempt == MAX_PARSE_RETRIES:
+                raise
+
+def compact_history(session, session_ledger: PromptLedger, structured: bool = STRUCTURED,
+                    keep: int = MAX_HISTORY_TURNS):
+    """The session, or a new one holding only its briefing exchange and last `keep` turns"""
+    if keep <= 0:
+        return session
+    history = session.get_history()
+    if len(history) <= 2 * (keep + 1):
+        return session
+    session_ledger.compact(keep)
+    return client.aio.chats.create(model=MODEL, config=response_config(structured),
+                                   history=history[:2] + history[-2 * keep:])
+
+def canonical(observation: dict) -> str:
+    """The observation as text that is the same for equal observations, whatever their key order"""
+    return json.dumps(observation, sort_keys=True, separators=(",", ":"))
+
+
+# (session, canonical observation) -> the request answering it
+_in_flight: Dict[Tuple[Optional[str], str], asyncio.Task] = {}
+
+
+async def transmitAndPost(tosend: dict, session: Optional[str] = None):
+    """The AI's decision for an observation, in the default chat or the pooled session for `session`
+
+    A request for the same observation and session that is already on its way is
+    awaited instead of sending another; every caller gets its own copy of the answer.
+    """
+    if asyncio.get_running_loop() is not _loop:
+        return await _on_ai_loop(transmitAndPost(tosend, session))
+    stats["decisions"] += 1
+    if not COALESCE:
+        return await _transmit(tosend, session)
+    key = (session, canonical(tosend))
+    request = _in_flight.get(key)
+    if request is not None and request.get_loop() is asyncio.get_running_loop():
+        stats["coalesced"] += 1
+    else:
+        request = asyncio.ensure_future(_transmit(tosend, session))
+        _in_flight[key] = request
+        request.add_done_callback(lambda done: _in_flight.pop(key, None) if _in_flight.get(key) is done else None)
+    # Shielded so one caller giving up doesn't cancel the request for the others
+    return copy.deepcopy(await asyncio.shield(request))
+
+
+async def _transmit(tosend: dict, session: Optional[str]):
+    global chat
+    if batcher is not None:
+        return await batcher.submit(tosend)
     # print("Received JSON: ", tosend)
     # print("Sending JSON to AI...")
-    # print("JSON sent to AI.")
-    response = await chat.send_message(tosend)
-    # print("AI response received.")
-    trimedResponse = solve_fast(response.text)
-    print("Trimmed AI response: ", trimedResponse)
-    return json.loads(trimedResponse)
+    if session is None:
+        chat = compact_history(chat, ledger)
+        result = await send_observation(chat, tosend, STRUCTURED, ledger)
+    else:
+        pooled = await sessions.get(session)
+        pooled.chat = compact_history(pooled.chat, pooled.ledger)
+        result = await send_observation(pooled.chat, tosend, STRUCTURED, pooled.ledger)
+    print("AI response: ", json.dumps(result))
+    return result
+
+
+async def transmitBatch(observations: List[dict]) -> List[dict]:
+    """Send several independent observations in one stateless request and split the responses back out"""
+    if asyncio.get_running_loop() is not _loop:
+        return await _on_ai_loop(transmitBatch(observations))
+    request = json.dumps({"observations": observations})
+    response = await client.aio.models.generate_content(
+        model=MODEL,
+        contents=request,
+        config={'system_instruction': BATCH_BRIEFING, **(response_config(STRUCTURED, batch=True) or {})}
+    )
+    ledger.record({
+        "objects": [observation.get("objects", []) for observation in observations],
+        "interactionsWithYou": [observation.get("interactionsWithYou", []) for observation in observations],
+    }, response.text, stateless_briefing=BATCH_BRIEFING, observations=len(observations))
+    results = parse_response(response.text)
+    if not isinstance(results, list) or len(results) != len(observations):
+        raise ValueError(f"Expected {len(observations)} responses in the batch, got: {results}")
+    return results
+
+
+class MicroBatcher:
+    """Collects concurrent observations and sends them together
+
+    A batch goes out once it holds max_batch_size observations, or max_wait seconds
+    after its first observation arrived, whichever comes first. Batched observations
+    are answered statelessly, without the chat history.
+    """
+
+    def __init__(self, max_batch_size: int = 8, max_wait: float = 0.05):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, observation: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((observation, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    async def _send(self, batch):
+        try:
+            results = await transmitBatch([observation for observation, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+batcher: Optional[MicroBatcher] = None
+
+
+def enable_batching(max_batch_size: int = 8, max_wait: float = 0.05):
+    """Opt in to batching: transmitAndPost calls are then packed together by a MicroBatcher"""
+    global batcher
+    batcher = MicroBatcher(max_batch_size, max_wait)
+
+
+def disable_batching():
+    global batcher
+    batcher = None
+
+
+async def benchmark_batching(decisions: int = 32, batch_sizes=(1, 4, 8, 16)):
+    """Measure decisions per second for one request per decision and for each batch size"""
+    global COALESCE
+    observation = {
+        "objects": [{"name": "Dog", "object_type": "Living", "interactions": {"pet": "Pet the dog"}}],
+        "interactionsWithYou": []
+    }
+    results = {}
+    # Every call sends the same observation, which coalescing would turn into one request
+    enabled, COALESCE = COALESCE, False
+    try:
+        disable_batching()
+        started = time.perf_counter()
+        for _ in range(decisions):
+            await transmitAndPost(observation)
+        results["single"] = decisions / (time.perf_counter() - started)
+
+        for batch_size in batch_sizes:
+            enable_batching(max_batch_size=batch_size)
+            started = time.perf_counter()
+            await asyncio.gather(*(transmitAndPost(observation) for _ in range(decisions)))
+            results[f"batch_{batch_size}"] = decisions / (time.perf_counter() - started)
+    finally:
+        disable_batching()
+        COALESCE = enabled
+    return results
+
+
+async def benchmark_structured(decisions: int = 50):
+    """Compare prose prompting with structured output: output tokens, parse failures and latency"""
+    from worldGenerator import WorldGenerator
+    from worldStore import observation
+
+    world = WorldGenerator(seed=0).generate(10)
+    results = {}
+    for mode, structured in (("prose", False), ("structured", True)):
+        session = client.aio.chats.create(model=MODEL, config=response_config(structured))
+        briefing = template.render(include_schema=not structured)
+        session_ledger = PromptLedger()
+        session_ledger.start_session(briefing, (await session.send_message(briefing)).text)
+        requests, failures = stats["requests"], stats["parse_failures"]
+        latencies = []
+        failed = 0
+        for i in range(decisions):
+            pending = [{"from": world[i % len(world)].name, "type": "talk", "description": "They say hello to you"}]
+            started = time.perf_counter()
+            try:
+                await send_observation(session, observation(world, pending), structured, session_ledger)
+            except ValueError:
+                failed += 1
+            latencies.append(time.perf_counter() - started)
+        report = session_ledger.report()
+        latencies.sort()
+        results[mode] = {
+            "output_tokens_per_decision": report["total"]["output"] / decisions,
+            "briefing_tokens": report["per_decision"]["briefing"],
+            "parse_failure_rate": (stats["parse_failures"] - failures) / (stats["requests"] - requests),
+            "failed_decisions": failed,
+            "mean_latency_s": sum(latencies) / len(latencies),
+            "p95_latency_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        }
+    return results
+
+
+async def benchmark_coalescing(callers: int = 16, distinct: int = 4, rounds: int = 5):
+    """Rounds of `callers` concurrent requests over `distinct` different observations, with and without coalescing"""
+    global COALESCE
+    observations = [{
+        "objects": [{"name": f"Dog {i}", "object_type": "Living", "interactions": {"pet": "Pet the dog"}}],
+        "interactionsWithYou": []
+    } for i in range(distinct)]
+    results = {}
+    enabled = COALESCE
+    try:
+        for label, coalesce in (("separate", False), ("coalesced", True)):
+            COALESCE = coalesce
+            requests, coalesced = stats["requests"], stats["coalesced"]
+            started = time.perf_counter()
+            for _ in range(rounds):
+                await asyncio.gather(*(transmitAndPost(observations[i % distinct]) for i in range(callers)))
+            decisions = callers * rounds
+            results[f"{label}_decisions_per_s"] = decisions / (time.perf_counter() - started)
+            results[f"{label}_requests"] = stats["requests"] - requests
+            results[f"{label}_shared"] = stats["coalesced"] - coalesced
+    finally:
+        COALESCE = enabled
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the AI connection")
+    parser.add_argument("benchmark", nargs="?", choices=["batching", "structured", "coalescing"], default="batching")
+    args = parser.parse_args()
+    # On the AI loop, like every request (benchmark_structured uses the client directly)
+    if args.benchmark == "coalescing":
+        for name, value in run_blocking(benchmark_coalescing()).items():
+            print(f"{name:>18}: {value:.2f}")
+    elif args.benchmark == "structured":
+        for mode, result in run_blocking(benchmark_structured()).items():
+            print(f"{mode:>10}: " + "  ".join(f"{key} {value:.3f}" for key, value in result.items()))
+    else:
+        for mode, rate in run_blocking(benchmark_batching()).items():
+            print(f"{mode:>10}: {rate:8.2f} decisions/s")
+        print(format_report(ledger.report()))
@@ -0,0 +1,195 @@
+"""Frame based action timelines for agents
+
+An AI decision becomes a list of actions (move, wait until arrived, speak, interact)
+that the simulation advances one frame at a time, so nothing ever sleeps or blocks
+and a new decision can preempt whatever the agent is still doing.
+"""
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+from collections import deque
+
+FPS = 60
+
+
+class Action:
+    """A step in an agent's timeline; update() returns True once the step is finished"""
+
+    def start(self, agent):
+        pass
+
+    def update(self, agent) -> bool:
+        return True
+
+    def cancel(self, agent):
+        pass
+
+
+class MoveAction(Action):
+    """Point the agent at a target; pair with WaitUntilArrivedAction to wait for it"""
+
+    def __init__(self, target):
+        self.target = target
+
+    def start(self, agent):
+        agent.move_towards(self.target)
+
+    def __repr__(self):
+        return f"MoveAction({self.target.name!r})"
+
+
+class WaitUntilArrivedAction(Action):
+    """Wait until the agent reaches its target, following the target if it is dragged around"""
+
+    def __init__(self, target, timeout_frames: int = FPS * 30):
+        self.target = target
+        self.frames_left = timeout_frames
+
+    def update(self, agent) -> bool:
+        agent.move_towards(self.target)
+        self.frames_left -= 1
+        return agent.has_arrived() or self.frames_left <= 0
+
+    def __repr__(self):
+        return f"WaitUntilArrivedAction({self.target.name!r})"
+
+
+class SpeakAction(Action):
+    """Show a speech bubble for a number of frames and wait for it to finish"""
+
+    def __init__(self, text: str, frames: Optional[int] = None):
+        self.text = text
+        self.frames = frames if frames is not None else speech_frames(text)
+        self.frames_left = self.frames
+
+    def start(self, agent):
+        agent.say(self.text, self.frames)
+
+    def update(self, agent) -> bool:
+        self.frames_left -= 1
+        return self.frames_left <= 0
+
+    def cancel(self, agent):
+        agent.say("", 0)
+
+    def __repr__(self):
+        return f"SpeakAction({self.text!r}, {self.frames})"
+
+
+class InteractAction(Action):
+    """Perform an interaction with a target, reporting it through an optional callback"""
+
+    def __init__(self, interaction_type: str, target, extra_data: Optional[str] = None,
+                 on_interact: Optional[Callable] = None):
+        self.interaction_type = interaction_type
+        self.target = target
+        self.extra_data = extra_data
+        self.on_interact = on_interact
+
+    def start(self, agent):
+        if self.on_interact:
+            self.on_interact(agent, self)
+
+    def __repr__(self):
+        return f"InteractAction({self.interaction_type!r}, {self.target.name!r})"
+
+
+class WaitAction(Action):
+    """Do nothing for a number of frames"""
+
+    def __init__(self, frames: int):
+        self.frames_left = frames
+
+    def update(self, agent) -> bool:
+        self.frames_left -= 1
+        return self.frames_left <= 0
+
+    def __repr__(self):
+        return f"WaitAction({self.frames_left})"
+
+
+def speech_frames(text: str) -> int:
+    """How long a speech bubble stays up: at least 3 seconds, longer for long sentences"""
+    return max(FPS * 3, len(text) * 4)
+
+
+class Timeline:
+    """The queue of actions for a single agent"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.actions: Deque[Action] = deque()
+        self.current: Optional[Action] = None
+
+    @property
+    def idle(self) -> bool:
+        return self.current is None and not self.actions
+
+    def extend(self, actions: Iterable[Action]):
+        self.actions.extend(actions)
+
+    def replace(self, actions: Iterable[Action]):
+        """Preempt the running action and everything queued behind it"""
+        if self.current is not None:
+            self.current.cancel(self.agent)
+            self.current = None
+        self.actions.clear()
+        self.actions.extend(actions)
+
+    def tick(self):
+        # Actions that finish instantly (like MoveAction) hand over to the next one in the same frame
+        while True:
+            if self.current is None:
+                if not self.actions:
+                    return
+                self.current = self.actions.popleft()
+                self.current.start(self.agent)
+            if not self.current.update(self.agent):
+                return
+            self.current = None
+
+
+class Scheduler:
+    """Per agent timelines advanced once per simulation frame"""
+
+    def __init__(self):
+        self.timelines: Dict[int, Timeline] = {}
+
+    def timeline(self, agent) -> Timeline:
+        timeline = self.timelines.get(id(agent))
+        if timeline is None:
+            timeline = self.timelines[id(agent)] = Timeline(agent)
+        return timeline
+
+    def submit(self, agent, actions: Iterable[Action], preempt: bool = True):
+        """Queue actions for an agent; by default a new decision replaces the old one"""
+        timeline = self.timeline(agent)
+        if preempt:
+            timeline.replace(actions)
+        else:
+            timeline.extend(actions)
+
+    def tick(self):
+        for timeline in self.timelines.values():
+            timeline.tick()
+
+
+def plan_actions(result, resolve: Callable[[str], Optional[object]],
+                 on_interact: Optional[Callable] = None) -> List[Action]:
+    """Turn an AIResponse into timeline actions
+
+    `resolve` maps a name from the response to a world object, or None if nothing matches.
+    """
+    actions: List[Action] = []
+    focus = resolve(result['focusObject'])
+    if focus is not None:
+        actions += [MoveAction(focus), WaitUntilArrivedAction(focus)]
+
+    for interaction in result['interactions']:
+        target = resolve(interaction['with_'])
+        if target is None:
+            continue
+        actions += [MoveAction(target), WaitUntilArrivedAction(target)]
+        extra_data = interaction.get('extraData')
+        if extra_data:
+            actions.append(SpeakAction(extra_data))
+        actions.append(InteractAction(interaction['type'], target, extra_data, on_interact))
+    return actions
@@ -0,0 +1,456 @@
+"""Columnar storage and analysis of AI decisions from large experiment runs
+
+Decisions are written in chunks to a results directory as two tables:
+
+    decisions     scenario, seed, decision, focus_object, movement_object, interactions, talks
+    interactions  row (index of its decision in its run), scenario, type, with_, extra_data
+
+Parquet is used when pyarrow is installed, compressed .npz when only numpy is, and
+gzipped CSV otherwise. Text columns are dictionary encoded (an integer code per row and
+a list of distinct values), so counting decisions per scenario and per value is a
+single bincount over integer codes instead of a loop over strings.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+import csv
+import glob
+import gzip
+import math
+import os
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+DECISION_COLUMNS = ("scenario", "seed", "decision", "focus_object", "movement_object", "interactions", "talks")
+INTERACTION_COLUMNS = ("row", "scenario", "type", "with_", "extra_data")
+TEXT_COLUMNS = {"scenario", "focus_object", "movement_object", "type", "with_", "extra_data"}
+
+
+def default_format() -> str:
+    if pq is not None:
+        return "parquet"
+    if np is not None:
+        return "npz"
+    return "csv"
+
+
+@dataclass
+class Categorical:
+    """A dictionary encoded text column"""
+    codes: Any  # numpy int array, or a list of ints without numpy
+    values: List[str]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def decode(self) -> List[str]:
+        values = self.values
+        return [values[code] for code in self.codes]
+
+
+class _Encoder:
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+        self.codes: List[int] = []
+
+    def append(self, value: str):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+
+class ResultWriter:
+    """Buffers decisions and writes them out in chunks of chunk_rows
+
+    A directory that already holds results is refused unless `existing` is "append" (new
+    parts and rows are numbered after the ones there) or "overwrite" (they are deleted).
+    """
+
+    def __init__(self, directory: str, format: Optional[str] = None, chunk_rows: int = 250_000,
+                 existing: str = "refuse"):
+        if existing not in ("refuse", "append", "overwrite"):
+            raise ValueError(f"Unknown mode for existing results: {existing!r}")
+        self.directory = directory
+        self.format = format or default_format()
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._parts = 0
+        os.makedirs(directory, exist_ok=True)
+        parts = glob.glob(os.path.join(directory, "decisions-*")) + glob.glob(os.path.join(directory, "interactions-*"))
+        if parts:
+            if existing == "refuse":
+                raise FileExistsError(f"{directory} already holds results; append to or overwrite them")
+            if existing == "overwrite":
+                for path in parts:
+                    os.remove(path)
+            else:
+                # Interaction rows point at decisions by row number, so those carry on too
+                self._parts = 1 + max(int(re.search(r"-(\d+)", os.path.basename(path)).group(1)) for path in parts)
+                self.rows = len(load_results(directory)[0]["seed"])
+        self._new_chunk()
+
+    def _new_chunk(self):
+        self._decisions = {name: _Encoder() if name in TEXT_COLUMNS else [] for name in DECISION_COLUMNS}
+        self._interactions = {name: _Encoder() if name in TEXT_COLUMNS else [] for name in INTERACTION_COLUMNS}
+
+    def add(self, scenario: str, seed: int, decision: int, result: Dict[str, Any]):
+        """Record one AIResponse"""
+        interactions = result.get("interactions") or []
+        columns = self._decisions
+        columns["scenario"].append(scenario)
+        columns["seed"].append(seed)
+        columns["decision"].append(decision)
+        columns["focus_object"].append(result.get("focusObject") or "")
+        columns["movement_object"].append(result.get("movementDirectionObject") or "")
+        columns["interactions"].append(len(interactions))
+        columns["talks"].append(sum(1 for interaction in interactions if interaction.get("extraData")))
+        row = self.rows
+        columns = self._interactions
+        for interaction in interactions:
+            columns["row"].append(row)
+            columns["scenario"].append(scenario)
+            columns["type"].append(interaction.get("type") or "")
+            columns["with_"].append(interaction.get("with_") or "")
+            columns["extra_data"].append(interaction.get("extraData") or "")
+        self.rows += 1
+        if len(self._decisions["seed"]) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._decisions["seed"]:
+            return
+        for table, columns in (("decisions", self._decisions), ("interactions", self._interactions)):
+            _write_part(os.path.join(self.directory, f"{table}-{self._parts:05d}"), columns, self.format)
+        self._parts += 1
+        self._new_chunk()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _write_part(base: str, columns: Dict[str, Any], format: str):
+    if format == "parquet":
+        arrays = {}
+        for name, column in columns.items():
+            if isinstance(column, _Encoder):
+                arrays[name] = pa.DictionaryArray.from_arrays(pa.array(column.codes, pa.int32()),
+                                                              pa.array(column.values, pa.string()))
+            else:
+                arrays[name] = pa.array(column, pa.int64())
+        pq.write_table(pa.table(arrays), base + ".parquet")
+    elif format == "npz":
+        arrays = {}
+        for name, column in columns.items():
+            if isinstance(column, _Encoder):
+                arrays[name + "__codes"] = np.asarray(column.codes, dtype=np.int32)
+                arrays[name + "__values"] = np.asarray(column.values, dtype=str)
+            else:
+                arrays[name] = np.asarray(column, dtype=np.int64)
+        np.savez_compressed(base + ".npz", **arrays)
+    elif format == "csv":
+        names = list(columns)
+        decoded = [[column.values[code] for code in column.codes] if isinstance(column, _Encoder) else column
+                   for column in columns.values()]
+        with gzip.open(base + ".csv.gz", "wt", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            writer.writerows(zip(*decoded))
+    else:
+        raise ValueError(f"Unknown format {format!r}")
+
+
+def _read_part(path: str) -> Dict[str, Any]:
+    """One part file as columns; text columns come back as (codes, values)"""
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise ImportError("pyarrow is needed to read Parquet results")
+        columns = {}
+        table = pq.read_table(path)
+        for name, column in zip(table.column_names, table.columns):
+            if pa.types.is_dictionary(column.type):
+                column = column.combine_chunks()
+                columns[name] = (column.indices.to_numpy(zero_copy_only=False) if np is not None
+                                 else column.indices.to_pylist(), column.dictionary.to_pylist())
+            else:
+                columns[name] = column.to_numpy() if np is not None else column.to_pylist()
+        return columns
+    if path.endswith(".npz"):
+        columns = {}
+        with np.load(path) as data:
+            for key in data.files:
+                if key.endswith("__codes"):
+                    name = key[:-len("__codes")]
+                    columns[name] = (data[key], data[name + "__values"].tolist())
+                elif not key.endswith("__values"):
+                    columns[key] = data[key]
+        return columns
+    with gzip.open(path, "rt", newline="") as f:
+        reader = csv.reader(f)
+        names = next(reader)
+        rows = list(reader)
+    columns = {}
+    for i, name in enumerate(names):
+        column = [row[i] for row in rows]
+        if name in TEXT_COLUMNS:
+            encoder = _Encoder()
+            for value in column:
+                encoder.append(value)
+            columns[name] = (encoder.codes, encoder.values)
+        else:
+            columns[name] = [int(value) for value in column]
+    return columns
+
+
+def _concat(parts: List[Dict[str, Any]], names: Sequence[str]) -> Dict[str, Any]:
+    table = {}
+    for name in names:
+        if name in TEXT_COLUMNS:
+            # Each part has its own dictionary; remap every part's codes onto one shared dictionary
+            index: Dict[str, int] = {}
+            values: List[str] = []
+            codes = []
+            for part in parts:
+                part_codes, part_values = part[name]
+                mapping = []
+                for value in part_values:
+                    if value not in index:
+                        index[value] = len(values)
+                        values.append(value)
+                    mapping.append(index[value])
+                if np is not None:
+                    mapping = np.asarray(mapping, dtype=np.int32)
+                    codes.append(mapping[np.asarray(part_codes, dtype=np.int64)] if len(part_codes) else
+                                 np.zeros(0, dtype=np.int32))
+                else:
+                    codes.extend(mapping[code] for code in part_codes)
+            if np is not None:
+                codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int32)
+            table[name] = Categorical(codes, values)
+        else:
+            columns = [part[name] for part in parts]
+            if np is not None:
+                table[name] = np.concatenate([np.asarray(column, dtype=np.int64) for column in columns]) \
+                    if columns else np.zeros(0, dtype=np.int64)
+            else:
+                table[name] = [value for column in columns for value in column]
+    return table
+
+
+def load_results(*directories: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """The decisions and interactions tables of one or more results directories, e.g. one per scenario"""
+    def parts(table):
+        return [path for directory in directories
+                for path in sorted(glob.glob(os.path.join(directory, f"{table}-*")))]
+
+    return (_concat([_read_part(path) for path in parts("decisions")], DECISION_COLUMNS),
+            _concat([_read_part(path) for path in parts("interactions")], INTERACTION_COLUMNS))
+
+
+# Statistics
+
+def wilson_interval(successes, trials, z: float = 1.96):
+    """95% Wilson score interval for a proportion; works on numbers or numpy arrays"""
+    if np is not None and (isinstance(successes, np.ndarray) or isinstance(trials, np.ndarray)):
+        trials = np.asarray(trials, dtype=float)
+        safe = np.where(trials > 0, trials, 1)
+        p = successes / safe
+        denominator = 1 + z * z / safe
+        center = (p + z * z / (2 * safe)) / denominator
+        margin = z * np.sqrt(p * (1 - p) / safe + z * z / (4 * safe * safe)) / denominator
+        return np.where(trials > 0, center - margin, 0.0), np.where(trials > 0, center + margin, 1.0)
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return center - margin, center + margin
+
+
+def _grouped_counts(groups: Categorical, values: Categorical):
+    """Counts as a (groups x values) matrix"""
+    width = len(values.values)
+    if np is not None:
+        flat = np.asarray(groups.codes, dtype=np.int64) * width + np.asarray(values.codes, dtype=np.int64)
+        return np.bincount(flat, minlength=len(groups.values) * width).reshape(len(groups.values), width)
+    counts = [[0] * width for _ in groups.values]
+    for group, value in zip(groups.codes, values.codes):
+        counts[group][value] += 1
+    return counts
+
+
+def distribution(table: Dict[str, Any], column: str, by: str = "scenario", top: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+    """The most common values of a text column per group, with shares and 95% intervals"""
+    groups, values = table[by], table[column]
+    counts = _grouped_counts(groups, values)
+    result = {}
+    for g, group in enumerate(groups.values):
+        row = counts[g]
+        total = int(sum(row))
+        if np is not None:
+            order = np.argsort(-row, kind="stable")[:top]
+        else:
+            order = sorted(range(len(row)), key=lambda i: -row[i])[:top]
+        entries = []
+        for v in order:
+            count = int(row[v])
+            if count == 0:
+                break
+            low, high = wilson_interval(count, total)
+            entries.append({"value": values.values[v], "count": count, "share": count / total,
+                            "low": float(low), "high": float(high)})
+        result[group] = entries
+    return result
+
+
+def compare(table: Dict[str, Any], column: str, value: str, by: str = "scenario",
+            baseline: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Share of rows where column == value per group, with intervals and a test against the baseline group"""
+    groups, values = table[by], table[column]
+    counts = _grouped_counts(groups, values)
+    if value in values.values:
+        v = values.values.index(value)
+        hits = [int(row[v]) for row in counts]
+    else:
+        hits = [0] * len(groups.values)
+    totals = [int(sum(row)) for row in counts]
+    baseline = baseline if baseline is not None else (groups.values[0] if groups.values else None)
+    result = {}
+    for g, group in enumerate(groups.values):
+        low, high = wilson_interval(hits[g], totals[g])
+        entry = {"count": hits[g], "total": totals[g], "share": hits[g] / totals[g] if totals[g] else 0.0,
+                 "low": float(low), "high": float(high)}
+        if baseline in groups.values and group != baseline:
+            b = groups.values.index(baseline)
+            entry["p_value"] = two_proportion_p(hits[g], totals[g], hits[b], totals[b])
+        result[group] = entry
+    return result
+
+
+def two_proportion_p(hits_a: int, total_a: int, hits_b: int, total_b: int) -> float:
+    """Two-sided p-value of a two proportion z-test"""
+    if not total_a or not total_b:
+        return 1.0
+    pooled = (hits_a + hits_b) / (total_a + total_b)
+    error = math.sqrt(pooled * (1 - pooled) * (1 / total_a + 1 / total_b))
+    if error == 0:
+        return 1.0
+    z = (hits_a / total_a - hits_b / total_b) / error
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def extra_data_summary(interactions: Dict[str, Any], by: str = "scenario") -> Dict[str, Dict[str, float]]:
+    """Per group: how often interactions carry extraData and how long it is"""
+    groups, extra = interactions[by], interactions["extra_data"]
+    lengths = [len(value) for value in extra.values]
+    if np is not None:
+        group_codes = np.asarray(groups.codes, dtype=np.int64)
+        row_lengths = np.asarray(lengths, dtype=np.int64)[np.asarray(extra.codes, dtype=np.int64)] \
+            if len(extra) else np.zeros(0, dtype=np.int64)
+        totals = np.bincount(group_codes, minlength=len(groups.values))
+        with_data = np.bincount(group_codes, weights=row_lengths > 0, minlength=len(groups.values))
+        characters = np.bincount(group_codes, weights=row_lengths, minlength=len(groups.values))
+    else:
+        totals = [0] * len(groups.values)
+        with_data = [0] * len(groups.values)
+        characters = [0] * len(groups.values)
+        for group, code in zip(groups.codes, extra.codes):
+            totals[group] += 1
+            with_data[group] += lengths[code] > 0
+            characters[group] += lengths[code]
+    result = {}
+    for g, group in enumerate(groups.values):
+        total, talking = int(totals[g]), int(with_data[g])
+        low, high = wilson_interval(talking, total)
+        result[group] = {
+            "interactions": total,
+            "with_extra_data": talking / total if total else 0.0,
+            "low": float(low),
+            "high": float(high),
+            "mean_length": float(characters[g]) / talking if talking else 0.0,
+        }
+    return result
+
+
+def summarize(directories: Sequence[str], top: int = 5) -> Dict[str, Any]:
+    decisions, interactions = load_results(*directories)
+    return {
+        "decisions": len(decisions["seed"]),
+        "interactions": len(interactions["row"]),
+        "focus_objects": distribution(decisions, "focus_object", top=top),
+        "interaction_types": distribution(interactions, "type", top=top),
+        "extra_data": extra_data_summary(interactions),
+    }
+
+
+def benchmark(decisions: int = 1_000_000, directory: str = "analytics_benchmark", format: Optional[str] = None):
+    """Write `decisions` synthetic decisions, then time loading and summarizing them"""
+    import random
+    import shutil
+    import time
+
+    rng = random.Random(0)
+    scenarios = ["best_friend", "fat_man", "generated"]
+    names = [f"Object {i}" for i in range(200)]
+    types = ["talk", "pet", "push", "wave", "pull lever"]
+    started = time.perf_counter()
+    with ResultWriter(directory, format, existing="overwrite") as writer:
+        for i in range(decisions):
+            focus = rng.choice(names)
+            interactions = [{"with_": focus, "type": rng.choice(types),
+                             "extraData": "Hello there" if rng.random() < 0.4 else None}
+                            for _ in range(rng.randrange(3))]
+            writer.add(scenarios[i % 3], i % 64, i, {"focusObject": focus, "movementDirectionObject": focus,
+                                                     "interactions": interactions})
+    written = time.perf_counter() - started
+    size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, "*")))
+    started = time.perf_counter()
+    summary = summarize([directory])
+    summarized = time.perf_counter() - started
+    shutil.rmtree(directory)
+    return {"format": writer.format, "write_s": written, "summarize_s": summarized, "bytes": size,
+            "decisions": summary["decisions"]}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Summarize the AI decisions in results directories")
+    parser.add_argument("directories", nargs="*", help="results written by parallelRunner.py --results")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--compare", nargs=2, metavar=("COLUMN", "VALUE"),
+                        help="compare how often COLUMN (focus_object or type) equals VALUE across scenarios")
+    parser.add_argument("--baseline", help="scenario to test the others against")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="time writing and summarizing N synthetic decisions")
+    parser.add_argument("--format", choices=["parquet", "npz", "csv"])
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark, format=args.format), indent=2))
+    elif args.compare:
+        column, value = args.compare
+        decisions, interactions = load_results(*args.directories)
+        table = interactions if column in INTERACTION_COLUMNS else decisions
+        print(json.dumps(compare(table, column, value, baseline=args.baseline), indent=2))
+    elif args.directories:
+        print(json.dumps(summarize(args.directories, args.top), indent=2))
+    else:
+        parser.error("give a results directory or --benchmark")
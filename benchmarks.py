@@ -0,0 +1,327 @@
+"""Reproducible benchmarks for rendering, simulation, serialization and the AI pipeline
+
+Every case runs on seeded worlds, without a display and against the mock model with its
+fake latency turned off, so runs on the same machine can be compared. Results are
+written as JSON together with the commit they were measured at:
+
+    python benchmarks.py                              # everything, to bench-results/<commit>.json
+    python benchmarks.py --quick --only render        # smaller worlds, only cases starting with "render"
+    python benchmarks.py --compare bench-results/a1b2c3d.json bench-results/e4f5a6b.json
+
+Each measurement is the best of several repeats; --compare flags the ones that got
+worse by more than --threshold and exits with status 1 if any did.
+"""
+from typing import Any, Callable, Dict, List, Optional
+import gc
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Set before anything imports AIControl, pygame or the mock model
+os.environ["FAKEWORLD_BACKEND"] = "mock"
+os.environ["FAKEWORLD_MOCK_OVERHEAD"] = "0"
+os.environ["FAKEWORLD_MOCK_PER_DECISION"] = "0"
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+# Lower is better for times, higher is better for rates
+UNITS = {"ms": False, "us": False, "per_s": True}
+
+CASES: Dict[str, Callable[[bool], List[Dict[str, Any]]]] = {}
+
+
+def case(name: str):
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int = 5) -> List[float]:
+    """Seconds per call of func for each repeat, with the garbage collector paused like timeit"""
+    func()  # Warm up caches
+    timings = []
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - started) / number)
+    finally:
+        if enabled:
+            gc.enable()
+    return timings
+
+
+def result(name: str, params: Dict[str, Any], unit: str, timings: List[float], scale: float = 1.0) -> Dict[str, Any]:
+    """A measurement from per-call timings; rates are operations (times scale) per second
+
+    The value is the best repeat, like timeit: slower repeats measure other load on the
+    machine more than the code.
+    """
+    timings = sorted(timings)
+    if UNITS[unit]:
+        values = [scale / timing for timing in timings]
+    else:
+        values = [timing * {"ms": 1e3, "us": 1e6}[unit] for timing in timings]
+    return {
+        "name": name,
+        "params": params,
+        "unit": unit,
+        "value": values[0],
+        "median": values[len(values) // 2],
+        "worst": values[-1],
+        "repeats": len(values),
+    }
+
+
+def _world(size: int, factory=None):
+    """A seeded world with a constant density, so an 800x600 view always holds about the same number of objects"""
+    from worldGenerator import WorldGenerator
+    side = 800 * math.sqrt(size / 1_000)
+    kwargs = {"factory": factory} if factory is not None else {}
+    return WorldGenerator(seed=size, width=side, height=side, **kwargs).generate(size), side
+
+
+def _ai_control():
+    """AIControl, without its briefing message in the output"""
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        import AIControl
+    return AIControl
+
+
+def _sizes(quick: bool):
+    return (100, 1_000) if quick else (100, 1_000, 10_000)
+
+
+@case("render")
+def bench_render(quick: bool) -> List[Dict[str, Any]]:
+    import pygame
+    from pygameWorld import GameObject, AIAgent
+    from worldRenderer import Camera, WorldRenderer
+    from worldQuery import WorldIndex
+
+    pygame.init()
+    screen = pygame.Surface((800, 600))
+    results = []
+    for size in _sizes(quick):
+        objects, side = _world(size, GameObject)
+        frames = max(1, 2_000 // size)
+
+        def draw_objects():
+            screen.fill((32, 32, 32))
+            for obj in objects:
+                obj.draw(screen)
+        results.append(result("render.game_object_draw", {"objects": size}, "ms", measure(draw_objects, frames)))
+
+        index = WorldIndex(objects)
+        camera = Camera(800, 600)
+        camera.center_on(side / 2, side / 2)
+        renderer = WorldRenderer()
+
+        def draw_view():
+            screen.fill((32, 32, 32))
+            renderer.draw(screen, camera, index)
+        results.append(result("render.world_renderer", {"objects": size}, "ms", measure(draw_view, 20)))
+
+    agent = AIAgent()
+    agent.say("Hello there, I am walking over to the tree to see what it is")
+    results.append(result("render.agent_draw", {"speaking": True}, "us", measure(lambda: agent.draw(screen), 2_000)))
+    pygame.quit()
+    return results
+
+
+@case("simulation")
+def bench_simulation(quick: bool) -> List[Dict[str, Any]]:
+    from simulation import Agent
+
+    agent = Agent()
+
+    def steps():
+        # Far enough away that the agent walks every step
+        agent.x, agent.y = 0.0, 0.0
+        agent.target_x, agent.target_y = 1e6, 1e6
+        for _ in range(1_000):
+            agent.update()
+    return [result("simulation.agent_update", {}, "per_s", measure(steps, 20), scale=1_000)]
+
+
+@case("hit_test")
+def bench_hit_test(quick: bool) -> List[Dict[str, Any]]:
+    import random
+    from pygameWorld import GameObject
+    from worldQuery import WorldIndex
+
+    results = []
+    for size in _sizes(quick) + (() if quick else (100_000,)):
+        objects, side = _world(size, GameObject)
+        index = WorldIndex(objects)
+        rng = random.Random(size)
+        clicks = [(rng.uniform(0, side), rng.uniform(0, side)) for _ in range(1_000)]
+
+        def clicks_indexed():
+            # As run_pygame finds what is under the cursor
+            for x, y in clicks:
+                [obj for obj in index.within_radius(x, y, 30) if obj.contains_point(x, y)]
+        results.append(result("hit_test.within_radius", {"objects": size}, "per_s",
+                              measure(clicks_indexed, 3), scale=len(clicks)))
+    return results
+
+
+@case("payload")
+def bench_payload(quick: bool) -> List[Dict[str, Any]]:
+    from mockModel import decide
+    from worldStore import observation
+
+    solve_fast = _ai_control().solve_fast
+    results = []
+    for size in (10, 100) if quick else (10, 100, 1_000):
+        objects, _ = _world(size)
+        seen = observation(objects, [{"from": objects[0].name, "type": "talk", "description": "They say hello"}])
+        text = json.dumps(seen)
+        reply = "```json\n" + json.dumps(decide(seen)) + "\n```"
+        body = solve_fast(reply)
+        number = max(10, 20_000 // size)
+        params = {"objects": size}
+        results.append(result("payload.json_dumps", params, "us", measure(lambda: json.dumps(seen), number)))
+        results.append(result("payload.json_loads", params, "us", measure(lambda: json.loads(text), number)))
+    results.append(result("payload.solve_fast", {}, "us", measure(lambda: solve_fast(reply), 100_000)))
+    results.append(result("payload.parse_reply", {}, "us", measure(lambda: json.loads(solve_fast(reply)), 50_000)))
+    results.append(result("payload.reply_loads", {}, "us", measure(lambda: json.loads(body), 50_000)))
+    return results
+
+
+@case("ai")
+def bench_ai(quick: bool) -> List[Dict[str, Any]]:
+    import asyncio
+    import contextlib
+    import io
+    from worldStore import observation
+
+    AIControl = _ai_control()
+    objects, _ = _world(100)
+    seen = observation(objects, [{"from": objects[0].name, "type": "talk", "description": "They say hello"}])
+    decisions = 50 if quick else 200
+
+    async def sequential():
+        for _ in range(decisions):
+            await AIControl.transmitAndPost(seen)
+
+    async def concurrent():
+        await asyncio.gather(*(AIControl.transmitAndPost(seen) for _ in range(decisions)))
+
+    results = []
+    # The concurrent calls all send the same observation, which coalescing would turn into one request
+    coalesce, AIControl.COALESCE = AIControl.COALESCE, False
+    try:
+        # transmitAndPost prints every response
+        with contextlib.redirect_stdout(io.StringIO()):
+            for label, run in (("sequential", sequential), ("concurrent", concurrent)):
+                # On the AI loop itself, so the time is transmitAndPost's and not the hop to that loop
+                timings = measure(lambda: AIControl.run_blocking(run()), 1, repeat=3)
+                results.append(result("ai.transmit_and_post", {"mode": label, "objects": 100}, "per_s",
+                                      timings, scale=decisions))
+    finally:
+        AIControl.COALESCE = coalesce
+    return results
+
+
+def _commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(only: Optional[List[str]] = None, quick: bool = False) -> Dict[str, Any]:
+    results = []
+    for name, func in CASES.items():
+        if only and not any(name.startswith(prefix) or prefix.startswith(name) for prefix in only):
+            continue
+        print(f"{name}...", file=sys.stderr)
+        results.extend(measurement for measurement in func(quick)
+                       if not only or any(measurement["name"].startswith(prefix) for prefix in only))
+    return {
+        "commit": _commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "quick": quick,
+        "results": results,
+    }
+
+
+def _key(measurement: Dict[str, Any]) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(measurement["params"].items()))
+    return f"{measurement['name']}[{params}]" if params else measurement["name"]
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.15) -> List[Dict[str, Any]]:
+    """Each measurement in both runs with how much worse (positive) or better it got"""
+    before = {_key(measurement): measurement for measurement in old["results"]}
+    rows = []
+    for measurement in new["results"]:
+        previous = before.get(_key(measurement))
+        if previous is None or not previous["value"] or not measurement["value"]:
+            continue
+        if UNITS[measurement["unit"]]:
+            change = previous["value"] / measurement["value"] - 1
+        else:
+            change = measurement["value"] / previous["value"] - 1
+        rows.append({"key": _key(measurement), "unit": measurement["unit"], "old": previous["value"],
+                     "new": measurement["value"], "worse_by": change, "regression": change > threshold})
+    return rows
+
+
+def format_results(report: Dict[str, Any]) -> str:
+    lines = [f"commit {report['commit']}, python {report['python']}, {report['platform']}"]
+    for measurement in report["results"]:
+        lines.append(f"{_key(measurement):>48} {measurement['value']:>12.3f} {measurement['unit']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the benchmarks, or compare two result files")
+    parser.add_argument("--only", nargs="+", metavar="PREFIX", help=f"cases to run: {', '.join(CASES)}")
+    parser.add_argument("--quick", action="store_true", help="smaller worlds and fewer decisions")
+    parser.add_argument("--out", help="result file (default bench-results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.15, help="how much worse counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        print(f"{old['commit']} -> {new['commit']}")
+        rows = compare(old, new, args.threshold)
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['key']:>48} {row['old']:>12.3f} -> {row['new']:>12.3f} {row['unit']:<6} "
+                  f"{-row['worse_by']:+7.1%}{flag}")
+        sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+    report = run(args.only, args.quick)
+    print(format_results(report))
+    path = args.out or os.path.join("bench-results", f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {path}", file=sys.stderr)
@@ -0,0 +1,300 @@
+"""Local decisions for when the model is slow or unavailable
+
+A policy is any callable taking an observation and returning an AIResponse. Two are
+here, both answering in microseconds:
+
+    RulePolicy    answers whoever is talking to the AI, otherwise heads for the nearest
+                  Living object
+    LookupPolicy  does what the model did most often in the same situation in recorded
+                  sessions (worldEvents logs), and asks another policy otherwise
+
+PendingDecision puts one in front of a model request: if the model hasn't answered by the
+deadline (or fails) the policy's answer is used, and when the model's answer arrives
+late it preempts the fallback's plan unless both chose the same thing.
+
+    python fallbackPolicy.py --train session.jsonl other.jsonl --out lookup.json
+    python worldServer.py --policy model --fallback lookup.json --deadline 0.25
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+import json
+import time
+
+Policy = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+# What the fallback says to someone while the model thinks of a real answer
+HOLDING_REPLY = "Hmm, give me a moment."
+
+
+def _speaker(observation: Dict[str, Any]) -> Optional[str]:
+    pending = observation.get("interactionsWithYou") or []
+    return pending[0].get("from") if pending else None
+
+
+def agrees(first: Dict[str, Any], second: Dict[str, Any]) -> bool:
+    """Whether two decisions go to the same place and do the same things (what is said aside)"""
+    return (first.get("focusObject") == second.get("focusObject")
+            and [(i.get("with_"), i.get("type")) for i in first.get("interactions", [])]
+            == [(i.get("with_"), i.get("type")) for i in second.get("interactions", [])])
+
+
+class RulePolicy:
+    """Answers whoever is talking to the AI, otherwise heads for the nearest Living object
+
+    With a WorldIndex and the agent's position it picks the nearest object the AI can
+    see; without them the first one in the observation.
+    """
+
+    def __init__(self, index=None, position: Optional[Callable[[], Tuple[float, float]]] = None):
+        self.index = index
+        self.position = position
+
+    def _nearest(self, objects: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        living = [obj for obj in objects if obj.get("object_type") == "Living"]
+        candidates = living or objects
+        if not candidates:
+            return None
+        if self.index is not None and self.position is not None:
+            by_name = {obj["name"]: obj for obj in candidates}
+            x, y = self.position()
+            for obj in self.index.nearest(x, y, 8, "Living" if living else None):
+                if obj.name in by_name:
+                    return by_name[obj.name]
+        return candidates[0]
+
+    def __call__(self, observation: Dict[str, Any]) -> Dict[str, Any]:
+        pending = observation.get("interactionsWithYou") or []
+        if pending:
+            interactions = [{"with_": interaction["from"], "type": "talk", "extraData": HOLDING_REPLY}
+                            for interaction in pending]
+            focus = pending[0]["from"]
+        else:
+            nearest = self._nearest(observation.get("objects", []))
+            focus = nearest["name"] if nearest else ""
+            interactions = []
+            if nearest and nearest.get("interactions"):
+                interactions.append({"with_": focus, "type": next(iter(nearest["interactions"])), "extraData": None})
+        return {"focusObject": focus, "movementDirectionObject": focus, "interactions": interactions}
+
+
+def situation(observation: Dict[str, Any]) -> str:
+    """The lookup key: what is asking for the AI's attention"""
+    pending = observation.get("interactionsWithYou") or []
+    types = {obj["name"]: obj.get("object_type") for obj in observation.get("objects", [])}
+    if pending:
+        return f"pending|{pending[0].get('type')}|{types.get(pending[0].get('from'))}"
+    return "idle|" + ("living" if "Living" in types.values() else "nonliving")
+
+
+def _template(observation: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """A decision with its names replaced by roles ("speaker" or an object type), so it fits other worlds"""
+    speaker = _speaker(observation)
+    types = {obj["name"]: obj.get("object_type") for obj in observation.get("objects", [])}
+
+    def role(name):
+        return "speaker" if name == speaker else f"type:{types.get(name)}"
+
+    def said(text):
+        # "Hello Bob" becomes "Hello {speaker}", to greet whoever is speaking next time
+        return text.replace(speaker, "{speaker}") if text and speaker else text
+    return {
+        "focus": role(result.get("focusObject")),
+        "interactions": [[role(interaction.get("with_")), interaction.get("type"), said(interaction.get("extraData"))]
+                         for interaction in result.get("interactions", [])],
+    }
+
+
+class LookupPolicy:
+    """What the model did most often in the same situation, from recorded sessions"""
+
+    def __init__(self, table: Optional[Dict[str, Dict[str, Any]]] = None, default: Optional[Policy] = None):
+        self.table = table or {}
+        self.default = default or RulePolicy()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def train(cls, decisions: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]],
+              default: Optional[Policy] = None) -> "LookupPolicy":
+        """From (observation, decision) pairs"""
+        counts: Dict[str, Counter] = {}
+        for seen, result in decisions:
+            template = json.dumps(_template(seen, result))
+            counts.setdefault(situation(seen), Counter())[template] += 1
+        return cls({key: json.loads(templates.most_common(1)[0][0]) for key, templates in counts.items()}, default)
+
+    @classmethod
+    def from_event_logs(cls, paths: Iterable[str], default: Optional[Policy] = None) -> "LookupPolicy":
+        from worldEvents import EventLog
+
+        def decisions():
+            for path in paths:
+                for event, state in EventLog.load(path).decisions():
+                    yield state.observation(), event.data["result"]
+        return cls.train(decisions(), default)
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.table, f, indent=1)
+
+    @classmethod
+    def load(cls, path: str, default: Optional[Policy] = None) -> "LookupPolicy":
+        with open(path) as f:
+            return cls(json.load(f), default)
+
+    def __call__(self, observation: Dict[str, Any]) -> Dict[str, Any]:
+        template = self.table.get(situation(observation))
+        result = self._fill(template, observation) if template is not None else None
+        if result is None:
+            self.misses += 1
+            return self.default(observation)
+        self.hits += 1
+        return result
+
+    def _fill(self, template: Dict[str, Any], observation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        speaker = _speaker(observation)
+        first_of_type: Dict[str, str] = {}
+        for obj in observation.get("objects", []):
+            first_of_type.setdefault(f"type:{obj.get('object_type')}", obj["name"])
+
+        def name(role):
+            return speaker if role == "speaker" else first_of_type.get(role)
+        focus = name(template["focus"])
+        targets = [name(role) for role, _, _ in template["interactions"]]
+        if focus is None or None in targets:
+            return None  # The situation matches but the world doesn't have what the decision needs
+        return {
+            "focusObject": focus,
+            "movementDirectionObject": focus,
+            "interactions": [{"with_": target, "type": kind,
+                              "extraData": extra.replace("{speaker}", speaker) if extra and speaker else extra}
+                             for target, (_, kind, extra) in zip(targets, template["interactions"])],
+        }
+
+
+def load_policy(spec: str, index=None, position=None) -> Policy:
+    """"rules", or the path of a lookup table written by --train (falling back to the rules)"""
+    rules = RulePolicy(index, position)
+    return rules if spec == "rules" else LookupPolicy.load(spec, rules)
+
+
+class PendingDecision:
+    """A model request that the fallback policy answers for once it runs past its deadline
+
+    Call poll() every tick; it returns a decision to apply, or None. The fallback's answer
+    comes when the deadline passes (or straight away if the request fails first); the
+    model's comes when it arrives, unless the fallback already chose the same thing.
+    """
+
+    def __init__(self, request, observation: Dict[str, Any], policy: Optional[Policy], deadline: float,
+                 stats: Optional[Dict[str, int]] = None):
+        self.request = request  # An asyncio task or future for the model's decision
+        self.observation = observation
+        self.policy = policy
+        self.deadline_at = time.monotonic() + deadline
+        self.stats = stats if stats is not None else {}
+        self.fallback: Optional[Dict[str, Any]] = None
+        self.finished = False
+
+    def _count(self, name: str):
+        self.stats[name] = self.stats.get(name, 0) + 1
+
+    def poll(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        if self.finished:
+            return None
+        if self.request.done():
+            self.finished = True
+            failed = self.request.cancelled() or self.request.exception() is not None
+            if failed:
+                self._count("model_failures")
+                if self.fallback is None and self.policy is not None:
+                    self._count("fallbacks")
+                    return self.policy(self.observation)
+                return None
+            result = self.request.result()
+            if self.fallback is None:
+                return result
+            if agrees(result, self.fallback):
+                self._count("late_agreed")
+                return None
+            self._count("preempted")
+            return result
+        if self.fallback is None and self.policy is not None and (now or time.monotonic()) >= self.deadline_at:
+            self._count("fallbacks")
+            self.fallback = self.policy(self.observation)
+            return self.fallback
+        return None
+
+
+def benchmark(policy: Policy, observations: List[Dict[str, Any]], number: int = 10_000) -> float:
+    """Microseconds per decision"""
+    started = time.perf_counter()
+    for i in range(number):
+        policy(observations[i % len(observations)])
+    return (time.perf_counter() - started) * 1e6 / number
+
+
+def benchmark_deadline(seconds: float = 10.0, latency: float = 0.5, deadline: float = 0.25,
+                       objects: int = 200) -> Dict[str, Dict[str, float]]:
+    """A served world in real time with a slow model, with and without the rule fallback
+
+    Needs FAKEWORLD_BACKEND=mock; `latency` is the mock's seconds per request.
+    """
+    import asyncio
+    import os
+    from actionTimeline import FPS
+    from simulation import Simulation
+    from worldGenerator import WorldGenerator
+    from worldServer import ServerConfig, WorldServer
+
+    os.environ["FAKEWORLD_MOCK_OVERHEAD"] = str(latency)
+    os.environ["FAKEWORLD_MOCK_PER_DECISION"] = "0"
+    results = {}
+    for label, fallback in (("model only", None), ("rules fallback", "rules")):
+        server = WorldServer(Simulation(WorldGenerator(seed=0).generate(objects)),
+                             ServerConfig(policy="model", fallback=fallback, deadline=deadline))
+        asyncio.run(server.run(int(seconds * FPS)))
+        stats = server.stats
+        results[label] = {
+            "decisions_per_s": stats["decisions"] / seconds,
+            "waiting_share": stats["waiting_frames"] / stats["frames"],
+            "late_frames": stats["late_frames"],
+            "fallbacks": stats["fallbacks"],
+            "preempted": stats["preempted"],
+        }
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from worldGenerator import WorldGenerator
+    from worldQuery import WorldIndex
+    from worldStore import observation
+
+    parser = argparse.ArgumentParser(description="Train a lookup policy from event logs, or time the policies")
+    parser.add_argument("--train", nargs="+", metavar="LOG", help="event logs from pygameWorld.py --event-log")
+    parser.add_argument("--out", default="lookup.json")
+    parser.add_argument("--table", help="a lookup table to time instead of training one")
+    parser.add_argument("--serve-benchmark", type=float, metavar="LATENCY",
+                        help="run a served world against a mock model this slow, with and without the fallback")
+    args = parser.parse_args()
+
+    if args.serve_benchmark:
+        for label, result in benchmark_deadline(latency=args.serve_benchmark).items():
+            print(f"{label:>15}: " + "  ".join(f"{key} {value:.2f}" for key, value in result.items()))
+    elif args.train:
+        policy = LookupPolicy.from_event_logs(args.train)
+        policy.save(args.out)
+        print(f"Wrote {len(policy.table)} situations to {args.out}")
+    else:
+        world = WorldGenerator(seed=0).generate(1_000)
+        index = WorldIndex(world)
+        nearby = index.within_radius(400, 300, 200)
+        seen = [observation(nearby, [{"from": nearby[i].name, "type": "talk", "description": "Hello"}] if i % 2 else [])
+                for i in range(min(20, len(nearby)))]
+        rules = RulePolicy(index, lambda: (400.0, 300.0))
+        print(f"{'rules':>8}: {benchmark(rules, seen):8.1f} us per decision")
+        from mockModel import decide
+        lookup = LookupPolicy.load(args.table, rules) if args.table else LookupPolicy.train(
+            ((seen_one, decide(seen_one)) for seen_one in seen), rules)
+        print(f"{'lookup':>8}: {benchmark(lookup, seen):8.1f} us per decision ({len(lookup.table)} situations)")
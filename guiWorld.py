@@ -1,28 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from typing import Dict, List, TypedDict, Optional
-from AIControl import transmitAndPost
-import asyncio
-
-class Object(TypedDict):
-    name: str
-    object_type: str
-    interactions: Dict[str, str]
-
-class AIInteractionResponse(TypedDict):
-    with_: str
-    type: str
-    extraData: Optional[str]
-
-class AIResponse(TypedDict):
-    focusObject: str
-    movementDirectionObject: str
-    interactions: List[AIInteractionResponse]
+from worldCore import Object, World, AISession, describe
+from listModel import ObservableList, ObservableDict, ListboxBinding, VirtualListbox
 
 class WorldGUI:
     def __init__(self):
-        self.objects: List[Object] = []
-        self.interactions: List[Dict[str, str]] = []
+        self.world = World(ObservableList(), ObservableList())
+        self.objects: ObservableList = self.world.objects
+        self.interactions: ObservableList = self.world.interactions
+        self.ai = AISession()
+        self.ai.warm_up()
         
         self.root = tk.Tk()
         self.root.title("World Simulation GUI")
@@ -45,7 +32,9 @@ class WorldGUI:
         
         # Objects List
         ttk.Label(self.left_frame, text="Objects").pack()
-        self.objects_listbox = tk.Listbox(self.left_frame, height=10)
+        self.objects_listbox = VirtualListbox(self.left_frame, self.objects,
+                                              lambda obj: f"{obj['name']} ({obj['object_type']})",
+                                              height=10)
         self.objects_listbox.pack(fill=tk.BOTH, expand=True)
         
         # Object Controls
@@ -58,6 +47,8 @@ class WorldGUI:
         ttk.Label(self.right_frame, text="Interactions").pack()
         self.interactions_listbox = tk.Listbox(self.right_frame, height=10)
         self.interactions_listbox.pack(fill=tk.BOTH, expand=True)
+        ListboxBinding(self.interactions_listbox, self.interactions,
+                       lambda interaction: f"{interaction['from']} - {interaction['type']}")
         
         # Interaction Controls
         self.interaction_controls = ttk.Frame(self.right_frame)
@@ -78,19 +69,6 @@ class WorldGUI:
         output_scrollbar = ttk.Scrollbar(self.bottom_frame, orient="vertical", command=self.output_text.yview)
         output_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.output_text.configure(yscrollcommand=output_scrollbar.set)
-        
-        self.update_lists()
-
-    def update_lists(self):
-        # Update objects listbox
-        self.objects_listbox.delete(0, tk.END)
-        for obj in self.objects:
-            self.objects_listbox.insert(tk.END, f"{obj['name']} ({obj['object_type']})")
-        
-        # Update interactions listbox
-        self.interactions_listbox.delete(0, tk.END)
-        for interaction in self.interactions:
-            self.interactions_listbox.insert(tk.END, f"{interaction['from']} - {interaction['type']}")
 
     def show_add_object_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -113,9 +91,10 @@ class WorldGUI:
         interactions_frame = ttk.Frame(dialog)
         interactions_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         
-        interactions: Dict[str, str] = {}
+        interactions: ObservableDict = ObservableDict()
         interactions_listbox = tk.Listbox(interactions_frame, height=5)
         interactions_listbox.pack(fill=tk.BOTH, expand=True)
+        ListboxBinding(interactions_listbox, interactions, lambda item: f"{item[0]}: {item[1]}")
         
         def add_interaction():
             interaction_dialog = tk.Toplevel(dialog)
@@ -134,9 +113,6 @@ class WorldGUI:
                 desc = int_desc_entry.get()
                 if name and desc:
                     interactions[name] = desc
-                    interactions_listbox.delete(0, tk.END)
-                    for k, v in interactions.items():
-                        interactions_listbox.insert(tk.END, f"{k}: {v}")
                 interaction_dialog.destroy()
             
             ttk.Button(interaction_dialog, text="Save", command=save_interaction).pack(pady=5)
@@ -150,10 +126,9 @@ class WorldGUI:
                 new_object: Object = {
                     "name": name,
                     "object_type": obj_type,
-                    "interactions": interactions
+                    "interactions": dict(interactions)
                 }
                 self.objects.append(new_object)
-                self.update_lists()
                 dialog.destroy()
         
         ttk.Button(dialog, text="Save", command=save_object).pack(pady=10)
@@ -163,7 +138,6 @@ class WorldGUI:
         if selection:
             index = selection[0]
             self.objects.pop(index)
-            self.update_lists()
 
     def show_add_interaction_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -193,46 +167,28 @@ class WorldGUI:
                     "description": desc
                 }
                 self.interactions.append(interaction)
-                self.update_lists()
                 dialog.destroy()
         
         ttk.Button(dialog, text="Save", command=save_interaction).pack(pady=10)
 
-    async def _send_to_ai(self):
-        data = {
-            "objects": self.objects,
-            "interactionsWithYou": self.interactions
-        }
-        result = await transmitAndPost(data)
-        return result
-
     def send_to_ai(self):
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        result = loop.run_until_complete(self._send_to_ai())
+        result = self.ai.decide_blocking(self.world.observation())
         
         # Clear previous output and enable text widget for updating
         self.output_text.config(state=tk.NORMAL)
         self.output_text.delete(1.0, tk.END)
         
         # Insert new AI response
-        self.output_text.insert(tk.END, f"The AI Moves toward {result['focusObject']}\n\n")
-        for interaction in result['interactions']:
-            if interaction['extraData']:
-                self.output_text.insert(tk.END, f"The AI chooses to use '{interaction['type']}' toward {interaction['with_']} and says {interaction['extraData']}\n")
-            else:
-                self.output_text.insert(tk.END, f"The AI chooses to {interaction['type']} with {interaction['with_']}\n")
+        movement, *interactions = describe(result)
+        self.output_text.insert(tk.END, movement + "\n\n")
+        for line in interactions:
+            self.output_text.insert(tk.END, line + "\n")
         
         # Disable text widget to prevent user editing
         self.output_text.config(state=tk.DISABLED)
         
         # Clear interactions after processing
-        self.interactions = []
-        self.update_lists()
+        self.interactions.clear()
 
     def run(self):
         self.root.mainloop()
@@ -0,0 +1,222 @@
+"""Render autonomous sessions without a display, as fast as the CPU allows
+
+The world is stepped at a fixed 60 frames per simulated second no matter how long a frame
+takes to draw, so the output is the same on every machine. Frames are drawn to an
+off-screen surface with SDL's dummy video driver and handed to a writer thread through a
+bounded queue; when the disk or encoder falls behind, rendering waits instead of piling
+frames up in memory.
+
+Two outputs are supported:
+
+    --format png   a numbered PNG sequence in a directory
+    --format raw   raw RGB24 frames to a file, or to stdout with --out -, e.g.
+
+        python headlessRender.py --duration 3600 --out - | \\
+            ffmpeg -f rawvideo -pix_fmt rgb24 -s 800x600 -r 60 -i - session.mp4
+"""
+from typing import Any, Dict, Optional
+from dataclasses import dataclass
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+# Its banner would land in a raw video stream on stdout
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import pygame
+
+from actionTimeline import FPS
+from simulation import Simulation
+from worldRenderer import Camera, WorldRenderer
+
+BACKGROUND = (32, 32, 32)
+_tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+_frombytes = getattr(pygame.image, "frombytes", None) or pygame.image.fromstring
+
+
+@dataclass
+class RenderConfig:
+    width: int = 800
+    height: int = 600
+    duration: float = 60.0  # Simulated seconds
+    output_fps: int = FPS  # Frames written per simulated second; lower it to skim long sessions
+    zoom: float = 1.0
+    follow: bool = True  # Keep the camera centered on the AI
+    policy: str = "local"  # "local" decides with the mock rules, "model" asks AIControl
+    seed: int = 0
+    queue_size: int = 32  # Frames buffered for the writer thread at most
+
+
+class FrameWriter(threading.Thread):
+    """Writes frames handed over by the render loop, on its own thread"""
+
+    def __init__(self, path: str, format: str, size, queue_size: int = 32):
+        super().__init__(name="frame-writer", daemon=True)
+        self.path = path
+        self.format = format
+        self.size = size
+        self.frames: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.blocked_seconds = 0.0  # Time the render loop spent waiting on a full queue
+        self.error: Optional[BaseException] = None
+        if format == "png":
+            os.makedirs(path, exist_ok=True)
+            self._stream = None
+        elif path == "-":
+            # The real stdout, even while prints are redirected away from it
+            self._stream = sys.__stdout__.buffer
+        else:
+            self._stream = open(path, "wb")
+
+    def put(self, frame: bytes):
+        if self.error is not None:
+            raise RuntimeError("frame writer failed") from self.error
+        started = time.perf_counter()
+        self.frames.put(frame)  # Blocks while the queue is full
+        self.blocked_seconds += time.perf_counter() - started
+
+    def close(self):
+        self.frames.put(None)
+        self.join()
+        if self._stream is not None:
+            self._stream.flush()
+            if self._stream is not sys.__stdout__.buffer:
+                self._stream.close()
+        if self.error is not None:
+            raise RuntimeError("frame writer failed") from self.error
+
+    def run(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            if self.error is not None:
+                continue  # Keep draining so the render loop never blocks forever
+            try:
+                if self._stream is not None:
+                    self._stream.write(frame)
+                else:
+                    surface = _frombytes(frame, self.size, "RGB")
+                    pygame.image.save(surface, os.path.join(self.path, f"frame_{self.written:06d}.png"))
+                self.written += 1
+            except BaseException as e:
+                self.error = e
+
+
+def render_session(simulation: Simulation, writer: Optional[FrameWriter], config: RenderConfig,
+                   decide_remote=None) -> Dict[str, Any]:
+    """Run the simulation for config.duration simulated seconds, drawing every frame that is written"""
+    import asyncio
+    from mockModel import decide
+
+    screen = pygame.Surface((config.width, config.height))
+    camera = Camera(config.width, config.height, zoom=config.zoom)
+    renderer = WorldRenderer()
+    rng = random.Random(config.seed)
+    living = [obj.name for obj in simulation.objects if obj.object_type == "Living"]
+    stride = max(1, round(FPS / config.output_fps))
+    total_frames = int(config.duration * FPS)
+
+    # One loop for the whole session so the AI client keeps its connections between decisions
+    loop = asyncio.new_event_loop() if decide_remote is not None else None
+    decisions = 0
+    draw_seconds = 0.0
+    started = time.perf_counter()
+    for frame in range(total_frames):
+        if simulation.idle:
+            observation = simulation.observation()
+            if decide_remote is not None:
+                result = loop.run_until_complete(decide_remote(observation))
+            else:
+                result = decide(observation)
+            simulation.apply(result)
+            decisions += 1
+            # Someone in the world reacts so the next decision has something new to answer
+            if living:
+                simulation.interactions = [{
+                    "from": rng.choice(living),
+                    "type": "talk",
+                    "description": "They say hello to you"
+                }]
+        simulation.step()
+
+        if frame % stride == 0:
+            draw_started = time.perf_counter()
+            if config.follow:
+                camera.center_on(simulation.agent.x, simulation.agent.y)
+            screen.fill(BACKGROUND)
+            renderer.draw(screen, camera, simulation.index, simulation.agent)
+            draw_seconds += time.perf_counter() - draw_started
+            if writer is not None:
+                writer.put(_tobytes(screen, "RGB"))
+
+    seconds = time.perf_counter() - started
+    if loop is not None:
+        loop.close()
+    return {
+        "simulated_seconds": total_frames / FPS,
+        "frames_simulated": total_frames,
+        "frames_written": (total_frames + stride - 1) // stride,
+        "decisions": decisions,
+        "wall_seconds": seconds,
+        "draw_seconds": draw_seconds,
+        "writer_blocked_seconds": writer.blocked_seconds if writer is not None else 0.0,
+        "speedup_over_realtime": (total_frames / FPS) / seconds if seconds else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import json
+    from worldGenerator import WorldGenerator, trolley_problem
+    from worldStore import load_world
+
+    parser = argparse.ArgumentParser(description="Render an autonomous session without a display")
+    parser.add_argument("--load", help="world file to render")
+    parser.add_argument("--generate", type=int, default=200, help="generate a world with this many objects")
+    parser.add_argument("--scenario", choices=["best_friend", "fat_man"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=60.0, help="simulated seconds to render")
+    parser.add_argument("--output-fps", type=int, default=FPS, help="frames written per simulated second")
+    parser.add_argument("--size", default="800x600", help="frame size as WIDTHxHEIGHT")
+    parser.add_argument("--zoom", type=float, default=1.0)
+    parser.add_argument("--policy", choices=["local", "model"], default="local")
+    parser.add_argument("--format", choices=["png", "raw"], default="png")
+    parser.add_argument("--out", help="directory for png, file or - (stdout) for raw; no output if omitted")
+    parser.add_argument("--queue-size", type=int, default=32)
+    args = parser.parse_args()
+
+    width, height = (int(part) for part in args.size.lower().split("x"))
+    config = RenderConfig(width=width, height=height, duration=args.duration, output_fps=args.output_fps,
+                          zoom=args.zoom, policy=args.policy, seed=args.seed, queue_size=args.queue_size)
+    if args.load:
+        objects, interactions = load_world(args.load)
+    elif args.scenario:
+        objects, interactions = trolley_problem(args.scenario)
+    else:
+        objects, interactions = WorldGenerator(seed=args.seed).generate(args.generate), []
+
+    # With frames on stdout, everything else printed (like AIControl's) goes to stderr
+    with contextlib.redirect_stdout(sys.stderr) if args.out == "-" else contextlib.nullcontext():
+        decide_remote = None
+        if config.policy == "model":
+            from AIControl import transmitAndPost as decide_remote
+
+        pygame.init()
+        writer = None
+        if args.out:
+            writer = FrameWriter(args.out, args.format, (width, height), config.queue_size)
+            writer.start()
+        try:
+            stats = render_session(Simulation(objects, interactions), writer, config, decide_remote)
+        finally:
+            if writer is not None:
+                writer.close()
+            pygame.quit()
+    # Frames may be going to stdout, so report on stderr
+    print(json.dumps(stats, indent=2), file=sys.stderr)
@@ -0,0 +1,425 @@
+"""Observable list/dict models and Tk widgets that apply their changes as diffs
+
+Instead of clearing and refilling a Listbox on every change, the world's lists notify
+their listeners with small diffs:
+
+    ("insert", index, items)   items were inserted starting at index
+    ("delete", index, count)   count items were removed starting at index
+    ("update", index, items)   items starting at index were replaced or edited in place
+    ("reset", 0, None)         anything else; listeners should redraw from scratch
+
+Models only hold weak references to listeners that are methods, so a closed dialog's
+bindings don't keep it alive through a model that outlives it.
+"""
+from typing import Callable, Dict, List, Optional
+from collections import deque
+import sys
+import time
+import weakref
+import tkinter as tk
+from tkinter import ttk, font as tkfont
+
+Listener = Callable[[str, int, object], None]
+
+
+def _reference(listener: Listener):
+    # Plain functions are usually lambdas nothing else holds on to, so only methods are weak
+    if hasattr(listener, "__self__"):
+        return weakref.WeakMethod(listener)
+    return lambda: listener
+
+
+class _Observable:
+    def subscribe(self, listener: Listener):
+        self._listeners().append(_reference(listener))
+
+    def unsubscribe(self, listener: Listener):
+        listeners = self._listeners()
+        for reference in listeners:
+            if reference() == listener:
+                listeners.remove(reference)
+                return
+        raise ValueError("listener is not subscribed")
+
+    def _listeners(self) -> List[Callable[[], Optional[Listener]]]:
+        # Set lazily since list and dict subclasses are also created by copy() and pickling
+        try:
+            return self.__dict__["_listener_list"]
+        except KeyError:
+            listeners = self.__dict__["_listener_list"] = []
+            return listeners
+
+    def _notify(self, op: str, index: int, data):
+        listeners = self._listeners()
+        for reference in list(listeners):
+            listener = reference()
+            if listener is None:
+                listeners.remove(reference)  # Its owner is gone
+            else:
+                listener(op, index, data)
+
+
+class ObservableList(_Observable, list):
+    """A list that reports its changes; it is still a list, so json.dumps and friends keep working"""
+
+    def append(self, item):
+        super().append(item)
+        self._notify("insert", len(self) - 1, [item])
+
+    def extend(self, items):
+        index = len(self)
+        items = list(items)
+        super().extend(items)
+        if items:
+            self._notify("insert", index, items)
+
+    def insert(self, index, item):
+        index = min(max(index + len(self) if index < 0 else index, 0), len(self))
+        super().insert(index, item)
+        self._notify("insert", index, [item])
+
+    def pop(self, index=-1):
+        if index < 0:
+            index += len(self)
+        item = super().pop(index)
+        self._notify("delete", index, 1)
+        return item
+
+    def remove(self, item):
+        index = self.index(item)
+        super().pop(index)
+        self._notify("delete", index, 1)
+
+    def clear(self):
+        count = len(self)
+        super().clear()
+        if count:
+            self._notify("delete", 0, count)
+
+    def __setitem__(self, index, item):
+        super().__setitem__(index, item)
+        if isinstance(index, slice):
+            self._notify("reset", 0, None)
+        else:
+            self._notify("update", index % len(self), [item])
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        if isinstance(index, slice):
+            self._notify("reset", 0, None)
+        else:
+            self._notify("delete", index % (len(self) + 1), 1)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._notify("reset", 0, None)
+
+    def reverse(self):
+        super().reverse()
+        self._notify("reset", 0, None)
+
+    def refresh(self, index: int):
+        """Report that the item at index was edited in place"""
+        self._notify("update", index, [self[index]])
+
+
+class ObservableDict(_Observable, dict):
+    """A dict that reports changes as diffs of its (insertion ordered) items"""
+
+    def __setitem__(self, key, value):
+        if key in self:
+            super().__setitem__(key, value)
+            self._notify("update", list(self).index(key), [(key, value)])
+        else:
+            super().__setitem__(key, value)
+            self._notify("insert", len(self) - 1, [(key, value)])
+
+    def __delitem__(self, key):
+        index = list(self).index(key)
+        super().__delitem__(key)
+        self._notify("delete", index, 1)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        index = list(self).index(key)
+        value = super().pop(key)
+        self._notify("delete", index, 1)
+        return value
+
+
+class ActionLog(_Observable):
+    """The last `limit` lines of a log; older lines are appended to spill_path if given, or dropped
+
+    Listeners see ("insert", index, [line]) and ("delete", 0, count) like a list's.
+    """
+
+    def __init__(self, limit: int = 1000, spill_path: Optional[str] = None):
+        self.lines: deque = deque(maxlen=max(1, limit))
+        self.spilled = 0
+        self._spill = open(spill_path, "a") if spill_path else None
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def append(self, line: str):
+        if len(self.lines) == self.lines.maxlen:
+            oldest = self.lines.popleft()
+            self.spilled += 1
+            if self._spill is not None:
+                self._spill.write(oldest + "\n")
+            self._notify("delete", 0, 1)
+        self.lines.append(line)
+        self._notify("insert", len(self.lines) - 1, [line])
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+class TextBinding:
+    """Shows an ActionLog in a read-only tk.Text, one line per entry, following the end"""
+
+    def __init__(self, text: tk.Text, model: ActionLog):
+        self.text = text
+        self.model = model
+        text.binding = self  # The model only holds the binding weakly; it lives as long as the widget
+        model.subscribe(self.on_change)
+        text.bind("<Destroy>", lambda event: self.unbind(), add="+")
+
+    def on_change(self, op: str, index: int, data):
+        self.text.config(state=tk.NORMAL)
+        if op == "insert":
+            self.text.insert(tk.END, "".join(line + "\n" for line in data))
+            self.text.see(tk.END)
+        elif op == "delete":
+            self.text.delete("1.0", f"{data + 1}.0")
+        self.text.config(state=tk.DISABLED)
+
+    def unbind(self):
+        try:
+            self.model.unsubscribe(self.on_change)
+        except ValueError:
+            pass
+
+
+class ListboxBinding:
+    """Keeps a plain tk.Listbox in sync with an observable model"""
+
+    def __init__(self, listbox: tk.Listbox, model, format: Callable[[object], str]):
+        self.listbox = listbox
+        self.model = model
+        self.format = format
+        listbox.binding = self  # The model only holds the binding weakly; it lives as long as the widget
+        model.subscribe(self.on_change)
+        listbox.bind("<Destroy>", lambda event: self.unbind(), add="+")
+        self.on_change("reset", 0, None)
+
+    def _rows(self):
+        return self.model.items() if isinstance(self.model, dict) else self.model
+
+    def on_change(self, op: str, index: int, data):
+        if op == "insert":
+            self.listbox.insert(index, *[self.format(item) for item in data])
+        elif op == "delete":
+            self.listbox.delete(index, index + data - 1)
+        elif op == "update":
+            for offset, item in enumerate(data):
+                selected = self.listbox.selection_includes(index + offset)
+                self.listbox.delete(index + offset)
+                self.listbox.insert(index + offset, self.format(item))
+                if selected:
+                    self.listbox.selection_set(index + offset)
+        else:
+            self.listbox.delete(0, tk.END)
+            self.listbox.insert(tk.END, *[self.format(item) for item in self._rows()])
+
+    def unbind(self):
+        try:
+            self.model.unsubscribe(self.on_change)
+        except ValueError:
+            pass  # Already unbound
+
+
+class VirtualListbox(ttk.Frame):
+    """A Listbox for huge models that only ever holds the rows currently visible
+
+    curselection() returns indexes into the model, like a normal Listbox would.
+    """
+
+    def __init__(self, master, model: ObservableList, format: Callable[[object], str], height: int = 10, **kwargs):
+        super().__init__(master)
+        self.model = model
+        self.format = format
+        self.first = 0
+        self.rows = height
+        self.selected: Optional[int] = None
+
+        self.listbox = tk.Listbox(self, height=height, exportselection=False, **kwargs)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.line_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+
+        self.listbox.bind("<Configure>", self._on_resize)
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", self._on_wheel)
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(3))
+        # Keyboard scrolling would move the real listbox past its few rows, so page the model instead
+        self.listbox.bind("<Up>", lambda e: self._move_selection(-1))
+        self.listbox.bind("<Down>", lambda e: self._move_selection(1))
+
+        model.subscribe(self.on_change)
+        self.render()
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def see(self, index: int):
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + self.rows:
+            self.first = index - self.rows + 1
+        self.render()
+
+    def scroll(self, rows: int):
+        self.first = max(0, min(self.first + rows, max(0, len(self.model) - self.rows)))
+        self.render()
+        return "break"
+
+    def render(self):
+        self.first = max(0, min(self.first, max(0, len(self.model) - self.rows)))
+        visible = self.model[self.first:self.first + self.rows]
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *[self.format(item) for item in visible])
+        if self.selected is not None and self.first <= self.selected < self.first + len(visible):
+            self.listbox.selection_set(self.selected - self.first)
+        if self.model:
+            self.scrollbar.set(self.first / len(self.model),
+                               min(1.0, (self.first + self.rows) / len(self.model)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_change(self, op: str, index: int, data):
+        # Keep the selection pointing at the same model item
+        if self.selected is not None:
+            if op == "insert" and index <= self.selected:
+                self.selected += len(data)
+            elif op == "delete" and index <= self.selected:
+                self.selected = None if self.selected < index + data else self.selected - data
+            elif op == "reset":
+                self.selected = None
+        last_visible = self.first + self.rows
+        if op == "update" and not (index < last_visible and index + len(data) > self.first):
+            return
+        if op == "insert" and index >= last_visible:
+            # Nothing visible moved, only the scrollbar needs to know the model grew
+            self.scrollbar.set(self.first / len(self.model), min(1.0, last_visible / len(self.model)))
+            return
+        self.render()
+
+    def _on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.first = int(float(args[0]) * len(self.model))
+            self.render()
+        elif action == "scroll":
+            amount, unit = int(args[0]), args[1]
+            self.scroll(amount * (self.rows if unit == "pages" else 1))
+
+    def _on_wheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_resize(self, event):
+        rows = max(1, event.height // self.line_height)
+        if rows != self.rows:
+            self.rows = rows
+            self.render()
+
+    def _on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.first + selection[0]
+
+    def _move_selection(self, step: int):
+        if not self.model:
+            return "break"
+        current = self.selected if self.selected is not None else self.first - step
+        self.selected = max(0, min(current + step, len(self.model) - 1))
+        self.see(self.selected)
+        return "break"
+
+
+def benchmark(rows: int = 10_000, operations: int = 200) -> Dict[str, Dict[str, float]]:
+    """Average milliseconds per add / remove / edit with `rows` rows, for each way of updating a Listbox"""
+    root = tk.Tk()
+    root.geometry("400x400")
+    format = str
+    results = {}
+
+    def measure(name, make_view, redraw):
+        model = ObservableList(f"Object {i}" for i in range(rows))
+        frame = ttk.Frame(root)
+        frame.pack(fill=tk.BOTH, expand=True)
+        view = make_view(frame, model)
+        root.update()
+        timings = {}
+        for label, op in (
+            ("add", lambda i: model.append(f"New {i}")),
+            ("edit", lambda i: model.__setitem__(rows // 2, f"Edited {i}")),
+            ("remove", lambda i: model.pop(rows // 2)),
+        ):
+            started = time.perf_counter()
+            for i in range(operations):
+                op(i)
+                if redraw:
+                    redraw(view, model)
+                root.update_idletasks()
+            timings[label] = (time.perf_counter() - started) * 1000 / operations
+        frame.destroy()
+        results[name] = timings
+
+    def full_rebuild(listbox, model):
+        # What update_lists used to do on every change
+        listbox.delete(0, tk.END)
+        for item in model:
+            listbox.insert(tk.END, format(item))
+
+    def plain_listbox(frame, model):
+        listbox = tk.Listbox(frame)
+        listbox.pack(fill=tk.BOTH, expand=True)
+        return listbox
+
+    def bound_listbox(frame, model):
+        listbox = plain_listbox(frame, model)
+        ListboxBinding(listbox, model, format)
+        return listbox
+
+    def virtual_listbox(frame, model):
+        view = VirtualListbox(frame, model, format)
+        view.pack(fill=tk.BOTH, expand=True)
+        return view
+
+    measure("full_rebuild", plain_listbox, full_rebuild)
+    measure("diff", bound_listbox, None)
+    measure("virtual", virtual_listbox, None)
+    root.destroy()
+    return results
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    for name, timings in benchmark(rows).items():
+        print(f"{name:>12}: " + "  ".join(f"{op} {ms:7.3f} ms" for op, ms in timings.items()))
@@ -0,0 +1,314 @@
+"""A local stand-in for the Google AI client, used for offline runs and benchmarks
+
+Select it with FAKEWORLD_BACKEND=mock. It answers with a simple rule based decision and
+simulates latency: a fixed per-request overhead (connection and model warm-up) plus a cost
+per decision and per output token, with requests served one at a time like a single chat
+connection.
+
+Like the real API, a config with a response_schema makes it answer with bare JSON that
+conforms to the schema. Without one it answers in a markdown code fence, and
+FAKEWORLD_MOCK_PROSE_ERRORS sets how often it chats around the fence instead, which
+breaks solve_fast the same way the real model sometimes does.
+
+serve_http runs the same model as a local HTTP server, and MockHttpClient talks to it
+over pooled keep-alive connections (FAKEWORLD_BACKEND=mock-http), so connection costs
+can be measured without the real API.
+"""
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import os
+import random
+from promptTemplates import count_tokens
+
+
+def decide(observation: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick a plausible AIResponse for an observation"""
+    objects = observation.get("objects", [])
+    living = [obj for obj in objects if obj.get("object_type") == "Living"]
+    focus = (living or objects or [{"name": ""}])[0]
+
+    interactions = [
+        {"with_": pending["from"], "type": "talk", "extraData": f"Hello {pending['from']}, I hear you."}
+        for pending in observation.get("interactionsWithYou", [])
+    ]
+    if not interactions and focus.get("interactions"):
+        interactions.append({"with_": focus["name"], "type": next(iter(focus["interactions"])), "extraData": None})
+
+    return {
+        "focusObject": focus["name"],
+        "movementDirectionObject": focus["name"],
+        "interactions": interactions,
+    }
+
+
+def conform(data, schema: Dict[str, Any]):
+    """Shape data to a JSON schema the way constrained decoding would; raises ValueError if it can't"""
+    kind = schema.get("type")
+    if kind == "object":
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected an object, got {data!r}")
+        properties = schema.get("properties", {})
+        required = schema.get("required", ())
+        missing = [name for name in required if data.get(name) is None]
+        if missing:
+            raise ValueError(f"Missing required properties {missing}")
+        # Unknown properties and nulls for optional ones can't be generated
+        return {name: conform(data[name], properties[name])
+                for name in properties if data.get(name) is not None}
+    if kind == "array":
+        if not isinstance(data, list):
+            raise ValueError(f"Expected an array, got {data!r}")
+        items = schema.get("items", {})
+        if isinstance(items, list):
+            items = items[0] if items else {}
+        return [conform(item, items) for item in data]
+    if kind == "string":
+        return str(data)
+    return data
+
+
+def _fenced(data) -> str:
+    # The real model wraps its JSON in a markdown code fence, which solve_fast strips
+    return "```json\n" + json.dumps(data) + "\n```"
+
+
+def _reply(data, config: Optional[Dict], server: "_Server") -> str:
+    schema = (config or {}).get("response_schema")
+    if schema is not None:
+        return json.dumps(conform(data, schema))
+    if server.rng.random() < server.prose_errors:
+        return "Here is my response:\n" + _fenced(data) + "\nLet me know if you need anything else."
+    return _fenced(data)
+
+
+class MockResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Server:
+    """Shared latency model; one request is served at a time"""
+
+    def __init__(self, overhead: float, per_decision: float, per_token: float = 0.0,
+                 prose_errors: float = 0.0, seed: int = 0):
+        self.overhead = overhead
+        self.per_decision = per_decision
+        self.per_token = per_token
+        self.prose_errors = prose_errors
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.connections = 0  # Accepted by serve_http
+        self._loop = None
+        self._lock = None
+
+    def latency(self, decisions: int, reply: str = "") -> float:
+        return (self.overhead + self.per_decision * decisions
+                + (self.per_token * count_tokens(reply) if self.per_token else 0.0))
+
+    async def serve(self, decisions: int, reply: str = ""):
+        loop = asyncio.get_running_loop()
+        # Locks belong to one event loop and the app creates more than one over its lifetime
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self.requests += 1
+            await asyncio.sleep(self.latency(decisions, reply))
+
+
+def _answer(message: str, config: Optional[Dict], server: _Server):
+    """Decisions made and the reply to one chat message"""
+    try:
+        observation = json.loads(message)
+    except ValueError:
+        # Anything that isn't an observation (like the briefing) just gets acknowledged
+        return 0, json.dumps("Understood.") if (config or {}).get("response_schema") else "Understood."
+    return 1, _reply(decide(observation), config, server)
+
+
+def _answer_batch(contents: str, config: Optional[Dict], server: _Server):
+    observations = json.loads(contents)["observations"]
+    return len(observations), _reply([decide(observation) for observation in observations], config, server)
+
+
+class MockChat:
+    def __init__(self, server: _Server, config: Optional[Dict] = None, history: Optional[List[Dict]] = None):
+        self._server = server
+        self._config = config
+        # Shaped like the API's history: alternating user and model contents
+        self.history: List[Dict] = list(history or [])
+
+    def get_history(self) -> List[Dict]:
+        return list(self.history)
+
+    async def send_message(self, message: str) -> MockResponse:
+        decisions, reply = _answer(message, self._config, self._server)
+        await self._server.serve(decisions, reply)
+        self.history.append({"role": "user", "parts": [{"text": message}]})
+        self.history.append({"role": "model", "parts": [{"text": reply}]})
+        return MockResponse(reply)
+
+
+class _MockChats:
+    def __init__(self, server: _Server):
+        self._server = server
+
+    def create(self, model: str, config: Optional[Dict] = None, history: Optional[List[Dict]] = None,
+               **kwargs) -> MockChat:
+        return MockChat(self._server, config, history)
+
+
+class _MockModels:
+    def __init__(self, server: _Server):
+        self._server = server
+
+    async def generate_content(self, model: str, contents: str, config: Optional[Dict] = None) -> MockResponse:
+        decisions, reply = _answer_batch(contents, config, self._server)
+        await self._server.serve(decisions, reply)
+        return MockResponse(reply)
+
+
+class _MockAio:
+    def __init__(self, server: _Server):
+        self.chats = _MockChats(server)
+        self.models = _MockModels(server)
+
+
+class MockClient:
+    """Mirrors the parts of genai.Client the app uses (client.aio.chats / client.aio.models)"""
+
+    def __init__(self, overhead: Optional[float] = None, per_decision: Optional[float] = None,
+                 per_token: Optional[float] = None, prose_errors: Optional[float] = None):
+        if overhead is None:
+            overhead = float(os.environ.get("FAKEWORLD_MOCK_OVERHEAD", "0.2"))
+        if per_decision is None:
+            per_decision = float(os.environ.get("FAKEWORLD_MOCK_PER_DECISION", "0.02"))
+        if per_token is None:
+            per_token = float(os.environ.get("FAKEWORLD_MOCK_PER_TOKEN", "0"))
+        if prose_errors is None:
+            prose_errors = float(os.environ.get("FAKEWORLD_MOCK_PROSE_ERRORS", "0"))
+        self.server = _Server(overhead, per_decision, per_token, prose_errors)
+        self.aio = _MockAio(self.server)
+
+
+async def serve_http(address: str, server: _Server, handshake: float = 0.0) -> asyncio.AbstractServer:
+    """Serve the mock model over HTTP/1.1 at HOST:PORT
+
+    POST /chat takes {"config", "history", "message"} and POST /generate takes {"config",
+    "contents"}; both answer {"text": reply}. Requests are served concurrently, like the
+    real API. Every new connection first waits `handshake` seconds, standing in for the TCP
+    and TLS setup a remote API costs.
+    """
+
+    async def respond(path: str, request: Dict[str, Any]) -> str:
+        if path == "/chat":
+            decisions, reply = _answer(request["message"], request.get("config"), server)
+        else:
+            decisions, reply = _answer_batch(request["contents"], request.get("config"), server)
+        server.requests += 1
+        await asyncio.sleep(server.latency(decisions, reply))
+        return reply
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        server.connections += 1
+        await asyncio.sleep(handshake)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                payload = json.dumps({"text": await respond(request_line.split()[1].decode(), json.loads(body))})
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n{payload}".encode())
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    host, port = address.rsplit(":", 1)
+    return await asyncio.start_server(handle, host, int(port))
+
+
+class HttpChat:
+    """A chat session over HTTP; like the real API, every message carries the history"""
+
+    def __init__(self, pool, config: Optional[Dict] = None, history: Optional[List[Dict]] = None):
+        self._pool = pool
+        self._config = config
+        self.history: List[Dict] = list(history or [])
+
+    def get_history(self) -> List[Dict]:
+        return list(self.history)
+
+    async def send_message(self, message: str) -> MockResponse:
+        request = {"config": self._config, "history": self.history, "message": message}
+        reply = json.loads(await self._pool.request("/chat", json.dumps(request).encode()))["text"]
+        self.history.append({"role": "user", "parts": [{"text": message}]})
+        self.history.append({"role": "model", "parts": [{"text": reply}]})
+        return MockResponse(reply)
+
+
+class _HttpChats:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def create(self, model: str, config: Optional[Dict] = None, history: Optional[List[Dict]] = None,
+               **kwargs) -> HttpChat:
+        return HttpChat(self._pool, config, history)
+
+
+class _HttpModels:
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def generate_content(self, model: str, contents: str, config: Optional[Dict] = None) -> MockResponse:
+        request = {"config": config, "contents": contents}
+        return MockResponse(json.loads(await self._pool.request("/generate", json.dumps(request).encode()))["text"])
+
+
+class _HttpAio:
+    def __init__(self, pool):
+        self.chats = _HttpChats(pool)
+        self.models = _HttpModels(pool)
+
+
+class MockHttpClient:
+    """Like MockClient, but every session talks to a serve_http server through one shared HttpPool"""
+
+    def __init__(self, address: str, limits=None):
+        from sessionPool import HttpPool
+        self.pool = HttpPool(address, limits)
+        self.aio = _HttpAio(self.pool)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the mock model over HTTP for FAKEWORLD_BACKEND=mock-http")
+    parser.add_argument("--address", default="127.0.0.1:8770")
+    parser.add_argument("--handshake", type=float, default=0.0, help="seconds every new connection waits first")
+    args = parser.parse_args()
+
+    async def main():
+        # Latency comes from the same FAKEWORLD_MOCK_* variables as the in-process mock
+        http = await serve_http(args.address, MockClient().server, args.handshake)
+        print(f"Serving the mock model on {args.address}")
+        async with http:
+            await http.serve_forever()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
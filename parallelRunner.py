@@ -0,0 +1,207 @@
+"""Run many independent headless worlds in parallel across processes
+
+Each scenario seed runs in a worker process that owns its own simulation and, with the
+"model" policy, its own AI session (AIControl is imported per process). Workers stream
+every decision back through a multiprocessing queue and the parent merges them into
+one report while the run is still going, optionally writing every decision to a results
+directory for analytics.py.
+"""
+from typing import Any, Dict, List, Optional
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, asdict, replace
+from queue import Empty
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import time
+
+
+@dataclass
+class RunConfig:
+    objects: int = 1000
+    decisions: int = 20
+    policy: str = "local"  # "local" decides with the mock rules in process, "model" asks AIControl
+    scenario: Optional[str] = None  # A trolley problem variant instead of a generated world
+    max_frames: int = 60 * 60  # Frames to simulate per decision at most
+    results: Optional[str] = None  # Directory to write every decision to, see analytics.py
+    existing_results: str = "refuse"  # Or "append" to, or "overwrite", results already in that directory
+
+
+_channel = None
+
+
+def _init_worker(channel):
+    global _channel
+    _channel = channel
+
+
+def run_shard(seed: int, config: RunConfig) -> Dict[str, Any]:
+    """Worker entry point: simulate one seed and stream its decisions to the parent"""
+    decide_remote = None
+    if config.policy == "model":
+        # Importing AIControl here gives every worker process its own client and chat session.
+        # It briefs the AI with asyncio.run on import, so it must happen outside the shard's loop.
+        from AIControl import transmitAndPost as decide_remote
+    return asyncio.run(_run_shard(seed, config, decide_remote))
+
+
+async def _run_shard(seed: int, config: RunConfig, decide_remote=None) -> Dict[str, Any]:
+    from simulation import Simulation
+    from worldGenerator import WorldGenerator, trolley_problem
+    from mockModel import decide
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    if config.scenario:
+        objects, interactions = trolley_problem(config.scenario)
+    else:
+        objects = WorldGenerator(seed=seed).generate(config.objects)
+        interactions = []
+    simulation = Simulation(objects, interactions)
+    living = [obj.name for obj in simulation.objects if obj.object_type == "Living"]
+
+    frames = 0
+    payload_bytes = 0
+    for decision in range(config.decisions):
+        observation = simulation.observation()
+        if decide_remote is not None:
+            result = await decide_remote(observation)
+        else:
+            # Encode the payload anyway so the local policy costs the same CPU work as a real request
+            payload_bytes += len(json.dumps(observation))
+            result = decide(observation)
+        simulation.apply(result)
+        decision_frames = simulation.run_until_idle(config.max_frames)
+        frames += decision_frames
+        if _channel is not None:
+            _channel.put(("decision", seed, {
+                "decision": decision,
+                "focusObject": result["focusObject"],
+                "movementDirectionObject": result.get("movementDirectionObject"),
+                "interactions": result["interactions"],
+                "frames": decision_frames,
+            }))
+        # Someone in the world reacts so the next decision has something new to answer
+        if living:
+            simulation.interactions = [{
+                "from": rng.choice(living),
+                "type": "talk",
+                "description": "They say hello to you"
+            }]
+
+    stats = {
+        "seed": seed,
+        "pid": os.getpid(),
+        "decisions": config.decisions,
+        "frames": frames,
+        "payload_bytes": payload_bytes,
+        "seconds": time.perf_counter() - started,
+    }
+    if _channel is not None:
+        _channel.put(("done", seed, stats))
+    return stats
+
+
+class Report:
+    """Aggregates the records streamed back from all workers"""
+
+    def __init__(self, writer=None, scenario: str = "generated"):
+        self.writer = writer  # An analytics.ResultWriter that gets every decision
+        self.scenario = scenario
+        self.decisions = 0
+        self.frames = 0
+        self.focus_counts: Counter = Counter()
+        self.interaction_counts: Counter = Counter()
+        self.shards: List[Dict[str, Any]] = []
+
+    def merge(self, record):
+        kind, seed, data = record
+        if kind == "decision":
+            self.decisions += 1
+            self.frames += data["frames"]
+            self.focus_counts[data["focusObject"]] += 1
+            self.interaction_counts.update(interaction["type"] for interaction in data["interactions"])
+            if self.writer is not None:
+                self.writer.add(self.scenario, seed, data["decision"], data)
+        elif kind == "done":
+            self.shards.append(data)
+
+    def to_dict(self, wall_seconds: float) -> Dict[str, Any]:
+        return {
+            "decisions": self.decisions,
+            "frames": self.frames,
+            "wall_seconds": wall_seconds,
+            "decisions_per_second": self.decisions / wall_seconds if wall_seconds else 0.0,
+            "top_focus_objects": self.focus_counts.most_common(10),
+            "interaction_counts": dict(self.interaction_counts),
+            "shards": sorted(self.shards, key=lambda shard: shard["seed"]),
+        }
+
+
+def run_parallel(seeds: List[int], config: RunConfig, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Shard the seeds over a process pool and return the merged report"""
+    context = multiprocessing.get_context()
+    channel = context.Queue()
+    writer = None
+    if config.results:
+        from analytics import ResultWriter
+        writer = ResultWriter(config.results, existing=config.existing_results)
+    report = Report(writer, config.scenario or "generated")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(channel,)) as pool:
+        pending = {pool.submit(run_shard, seed, config) for seed in seeds}
+        while pending:
+            # Merge streamed records while shards are still running
+            while True:
+                try:
+                    report.merge(channel.get_nowait())
+                except Empty:
+                    break
+            done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()  # Re-raise worker errors
+    # Shards put their last records before returning, so drain whatever is left
+    while len(report.shards) < len(seeds):
+        report.merge(channel.get(timeout=5))
+    if writer is not None:
+        writer.close()
+    return report.to_dict(time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run headless worlds in parallel")
+    parser.add_argument("--seeds", type=int, default=8, help="number of worlds, seeded 0..N-1")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--objects", type=int, default=1000)
+    parser.add_argument("--decisions", type=int, default=20)
+    parser.add_argument("--policy", choices=["local", "model"], default="local")
+    parser.add_argument("--scenario", choices=["best_friend", "fat_man"])
+    parser.add_argument("--out", help="write the report as JSON to this file")
+    parser.add_argument("--results", help="write every decision to this directory (see analytics.py)")
+    existing = parser.add_mutually_exclusive_group()
+    existing.add_argument("--append", action="store_const", dest="existing_results", const="append",
+                          default="refuse", help="add to the results already in the --results directory")
+    existing.add_argument("--overwrite", action="store_const", dest="existing_results", const="overwrite",
+                          help="replace the results already in the --results directory")
+    parser.add_argument("--compare", action="store_true", help="also run with one worker and print the speedup")
+    args = parser.parse_args()
+
+    config = RunConfig(objects=args.objects, decisions=args.decisions, policy=args.policy, scenario=args.scenario,
+                       results=args.results, existing_results=args.existing_results)
+    seeds = list(range(args.seeds))
+    report = run_parallel(seeds, config, args.workers)
+    print(f"{report['decisions']} decisions in {report['wall_seconds']:.2f}s "
+          f"({report['decisions_per_second']:.1f}/s) with {args.workers} workers")
+    if args.compare:
+        baseline = run_parallel(seeds, replace(config, results=None), 1)
+        print(f"1 worker: {baseline['decisions_per_second']:.1f}/s, "
+              f"speedup {report['decisions_per_second'] / baseline['decisions_per_second']:.2f}x")
+    if args.out:
+        report["config"] = asdict(config)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,369 @@
+"""Profiling a running app: per-frame phase timings and a profiler that can be switched on and off
+
+FrameTimer splits every frame into named phases (events, queue, update, draw, flip) and
+keeps the last few thousand frames. Profiler runs either cProfile or a sampling profiler
+on the threads that opt in, and writes what it found when it is stopped:
+
+    <dir>/<name>.prof        cProfile stats, for pstats, snakeviz or gprof2dot
+    <dir>/<name>.collapsed   sampled stacks as "thread;file:function;... count" lines, for
+                             flamegraph.pl or speedscope
+    <dir>/<name>-frames.json the frame timings, with a per phase summary
+
+Both cost one attribute check per call while they are off, so the hooks can stay in the
+hot loops. MemoryTracker is for long unattended runs: it reports the lines whose
+allocations grew the most since its last report.
+"""
+from typing import Any, Dict, List, Optional
+from collections import Counter, deque
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+PHASES = ("events", "queue", "update", "draw", "flip")
+
+
+class FrameTimer:
+    """Per-frame time spent in each phase
+
+    Call start() at the top of the frame, then mark(phase) as each phase finishes: the
+    time since the previous mark goes to that phase.
+    """
+
+    def __init__(self, phases=PHASES, frames: int = 3600):
+        self.phases = tuple(phases)
+        self.enabled = False
+        self.frames: deque = deque(maxlen=frames)
+        self._current: List[float] = []
+        self._last = 0.0
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._current = [0.0] * len(self.phases)
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        if not self.enabled or not self._current:
+            return
+        now = time.perf_counter()
+        self._current[self.phases.index(phase)] += now - self._last
+        self._last = now
+
+    def end(self):
+        if not self.enabled or not self._current:
+            return
+        self.frames.append(self._current)
+        self._current = []
+
+    def toggle(self) -> bool:
+        self.enabled = not self.enabled
+        self._current = []
+        return self.enabled
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Mean, 95th percentile and worst milliseconds per phase, and for whole frames"""
+        if not self.frames:
+            return {}
+        columns = list(zip(*self.frames))
+        columns.append(tuple(sum(frame) for frame in self.frames))
+        summary = {}
+        for name, values in zip(self.phases + ("frame",), columns):
+            ordered = sorted(values)
+            summary[name] = {
+                "mean_ms": 1000 * sum(ordered) / len(ordered),
+                "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_ms": 1000 * ordered[-1],
+            }
+        return summary
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "phases": self.phases,
+                "summary": self.summary(),
+                "frames_ms": [[round(1000 * value, 3) for value in frame] for frame in self.frames],
+            }, f)
+
+
+def format_summary(summary: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"{'phase':>8} {'mean ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+    for name, stats in summary.items():
+        lines.append(f"{name:>8} {stats['mean_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['max_ms']:>8.2f}")
+    return "\n".join(lines)
+
+
+class _Sampler(threading.Thread):
+    """Records the stacks of the watched threads every interval"""
+
+    def __init__(self, threads: Dict[int, str], interval: float):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.threads = threads
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, name in list(self.threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Profiler:
+    """cProfile ("cprofile") or stack sampling ("sample") over the threads that call sync() or section()
+
+    start() and stop() can come from any thread (a hotkey, say). A cProfile profile can
+    only be switched on and off by the thread it profiles, so each thread joins or leaves
+    a session at its next sync(); call it once per frame. section() profiles a block of
+    work on any thread, e.g. an AI request on a worker thread, while profiling is on.
+    """
+
+    def __init__(self, mode: str = "cprofile", directory: str = "profiles", interval: float = 0.005):
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"Unknown profiler mode {mode!r}")
+        self.mode = mode
+        self.directory = directory
+        self.interval = interval
+        self.active = False
+        self._generation = 0  # Bumped on every start and stop so threads notice at their next sync
+        self._session = 0
+        self._lock = threading.Lock()
+        self._running: Dict[int, Any] = {}  # Thread ident -> (session, profile) for threads that synced in
+        self._finished: List[cProfile.Profile] = []
+        self._synced: Dict[int, int] = {}
+        self._threads: Dict[int, str] = {}  # Thread ident -> name, the threads that are sampled
+        self._sampler: Optional[_Sampler] = None
+        self.skipped = 0  # Threads and sections left out because another profiler was already active
+
+    def start(self):
+        with self._lock:
+            if self.active:
+                return
+            self.active = True
+            self._generation += 1
+            self._session += 1
+            self._finished = []
+            self.skipped = 0
+            if self.mode == "sample":
+                self._sampler = _Sampler(self._threads, self.interval)
+                self._sampler.start()
+
+    def stop(self, timer: Optional[FrameTimer] = None, wait: float = 0.5) -> List[str]:
+        """Stop and write the results; returns the files written
+
+        Waits up to `wait` seconds for the other profiled threads to sync and hand their
+        profiles over.
+        """
+        with self._lock:
+            if not self.active:
+                return []
+            self.active = False
+            self._generation += 1
+            sampler, self._sampler = self._sampler, None
+        if sampler is not None:
+            sampler.stop()
+        if threading.get_ident() in self._running:
+            self._sync(None)
+        deadline = time.monotonic() + wait
+        while self._running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with self._lock:
+            profiles, self._finished = self._finished, []
+        return self.dump(profiles, sampler, timer)
+
+    def toggle(self, timer: Optional[FrameTimer] = None) -> List[str]:
+        if self.active:
+            return self.stop(timer)
+        self.start()
+        return []
+
+    def sync(self, name: Optional[str] = None):
+        """Join or leave the current profiling session from this thread"""
+        if self._synced.get(threading.get_ident()) == self._generation:
+            return
+        self._sync(name)
+
+    def _sync(self, name: Optional[str]):
+        ident = threading.get_ident()
+        with self._lock:
+            self._synced[ident] = self._generation
+            self._threads[ident] = name or self._threads.get(ident) or threading.current_thread().name
+            running = self._running.pop(ident, None)
+            if running is not None:
+                session, profile = running
+                if self.active and session == self._session:
+                    self._running[ident] = running
+                else:
+                    profile.disable()
+                    if session == self._session:
+                        self._finished.append(profile)
+            if self.active and self.mode == "cprofile" and ident not in self._running:
+                profile = cProfile.Profile()
+                if self._enable(profile):
+                    self._running[ident] = (self._session, profile)
+
+    def _enable(self, profile: cProfile.Profile) -> bool:
+        """Switch a profile on for this thread, or count it as skipped when that isn't allowed"""
+        try:
+            profile.enable()
+        except ValueError:
+            # From Python 3.12 only one profiler can be active in the interpreter at a time
+            self.skipped += 1
+            return False
+        return True
+
+    def section(self, name: Optional[str] = None):
+        return _Section(self, name)
+
+    def dump(self, profiles: List[cProfile.Profile], sampler: Optional[_Sampler],
+             timer: Optional[FrameTimer]) -> List[str]:
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, time.strftime("%Y%m%d-%H%M%S") + f"-{self.mode}")
+        written = []
+        if profiles:
+            stats = pstats.Stats(*profiles)
+            stats.dump_stats(base + ".prof")
+            written.append(base + ".prof")
+        if sampler is not None and sampler.stacks:
+            with open(base + ".collapsed", "w") as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            written.append(base + ".collapsed")
+        if timer is not None and timer.frames:
+            timer.dump(base + "-frames.json")
+            written.append(base + "-frames.json")
+        return written
+
+
+class _Section:
+    def __init__(self, profiler: Profiler, name: Optional[str]):
+        self.profiler = profiler
+        self.name = name
+        self.profile: Optional[cProfile.Profile] = None
+        self.session = 0
+        self.sampled = False
+
+    def __enter__(self):
+        profiler = self.profiler
+        if not profiler.active:
+            return self
+        ident = threading.get_ident()
+        with profiler._lock:
+            self.session = profiler._session
+            if profiler.mode == "sample" and ident not in profiler._threads:
+                profiler._threads[ident] = self.name or threading.current_thread().name
+                self.sampled = True
+            elif profiler.mode == "cprofile" and ident not in profiler._running:
+                self.profile = cProfile.Profile()
+        if self.profile is not None and not profiler._enable(self.profile):
+            self.profile = None  # The block still runs, just unprofiled
+        return self
+
+    def __exit__(self, *exc):
+        profiler = self.profiler
+        if self.profile is not None:
+            self.profile.disable()
+            with profiler._lock:
+                if profiler._session == self.session:
+                    profiler._finished.append(self.profile)
+        if self.sampled:
+            profiler._threads.pop(threading.get_ident(), None)
+        return False
+
+
+class MemoryTracker(threading.Thread):
+    """Reports the top memory growth sites every interval, using tracemalloc
+
+    tracemalloc slows every allocation down, so this is a mode to run in, not a hook.
+    """
+
+    def __init__(self, interval: float = 60.0, top: int = 10, frames: int = 1, report=None):
+        super().__init__(name="memory-tracker", daemon=True)
+        self.interval = interval
+        self.top = top
+        self.frames = frames
+        self.report = report or (lambda text: print(text, file=sys.stderr))
+        self._stopped = threading.Event()
+
+    def run(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        started = time.monotonic()
+        previous = tracemalloc.take_snapshot()
+        while not self._stopped.wait(self.interval):
+            snapshot = tracemalloc.take_snapshot()
+            self.report(self.growth(snapshot, previous, time.monotonic() - started))
+            previous = snapshot
+
+    def growth(self, snapshot, previous, elapsed: float) -> str:
+        # Leave out tracemalloc's own bookkeeping
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        snapshot, previous = snapshot.filter_traces(filters), previous.filter_traces(filters)
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"memory after {elapsed:.0f}s: {current / 2**20:.1f} MiB traced, peak {peak / 2**20:.1f} MiB"]
+        for stat in snapshot.compare_to(previous, "lineno")[:self.top]:
+            if stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size_diff / 1024:>+10.1f} KiB {stat.count_diff:>+7} blocks  "
+                         f"{os.path.basename(frame.filename)}:{frame.lineno}")
+        return "\n".join(lines)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        tracemalloc.stop()
+
+
+def overhead(frames: int = 100_000) -> Dict[str, float]:
+    """Nanoseconds a frame's timing hooks cost while off and while on"""
+    timer = FrameTimer()
+    profiler = Profiler()
+    results = {}
+    for label, enabled in (("disabled_ns", False), ("enabled_ns", True)):
+        timer.enabled = enabled
+        started = time.perf_counter()
+        for _ in range(frames):
+            profiler.sync()
+            timer.start()
+            for phase in PHASES:
+                timer.mark(phase)
+            timer.end()
+        results[label] = (time.perf_counter() - started) * 1e9 / frames
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarize a profile, or time the hooks themselves")
+    parser.add_argument("path", nargs="?", help="a .prof or -frames.json file written by the profiler")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    if args.path is None:
+        for name, value in overhead().items():
+            print(f"{name:>12}: {value:.0f}")
+    elif args.path.endswith(".json"):
+        with open(args.path) as f:
+            print(format_summary(json.load(f)["summary"]))
+    else:
+        pstats.Stats(args.path).sort_stats("cumulative").print_stats(args.top)
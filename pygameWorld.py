@@ -1,8 +1,16 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-from typing import Dict, List, TypedDict, Optional
-from AIControl import transmitAndPost
-import asyncio
+from tkinter import ttk, messagebox, scrolledtext, filedialog
+from typing import Dict, List, Optional
+from worldCore import Object, World, AISession, dispatch
+from actionTimeline import Scheduler
+from worldStore import save_world, load_world, object_dict, MappedWorld, BINARY_SUFFIX
+from worldGenerator import WorldGenerator, trolley_problem
+from simulation import Agent
+from listModel import ObservableList, ObservableDict, ListboxBinding, VirtualListbox, ActionLog, TextBinding
+from worldQuery import WorldIndex
+from worldRenderer import Camera, WorldRenderer, SpriteCache, draw_agent
+from worldEvents import EventLog
+from profiling import Profiler, FrameTimer, MemoryTracker, format_summary
 import pygame
 import threading
 import math
@@ -10,21 +18,6 @@ import time
 from dataclasses import dataclass
 from queue import Queue
 
-class Object(TypedDict):
-    name: str
-    object_type: str
-    interactions: Dict[str, str]
-
-class AIInteractionResponse(TypedDict):
-    with_: str
-    type: str
-    extraData: Optional[str]
-
-class AIResponse(TypedDict):
-    focusObject: str
-    movementDirectionObject: str
-    interactions: List[AIInteractionResponse]
-
 @dataclass
 class GameObject:
     name: str
@@ -71,69 +64,43 @@ class GameObject:
         text = font.render(self.name, True, (255, 255, 255))
         screen.blit(text, (self.x - text.get_width() // 2, self.y - 30))
 
-class AIAgent:
-    def __init__(self):
-        self.x = 400
-        self.y = 300
-        self.target_x = 400
-        self.target_y = 300
-        self.speed = 2
-        self.current_text = ""
-        self.text_timer = 0
-        self.stopping_distance = 50  # Distance at which AI stops from target
-        
-    def move_towards(self, target_obj: GameObject):
-        self.target_x = target_obj.x
-        self.target_y = target_obj.y
-        
-    def update(self):
-        dx = self.target_x - self.x
-        dy = self.target_y - self.y
-        distance = math.sqrt(dx * dx + dy * dy)
-        
-        # Only move if we're further than the stopping distance
-        if distance > self.stopping_distance:
-            # Calculate movement while maintaining speed
-            move_distance = min(self.speed, distance - self.stopping_distance)
-            self.x += (dx / distance) * move_distance
-            self.y += (dy / distance) * move_distance
-            
-        if self.text_timer > 0:
-            self.text_timer -= 1
-            
-    def say(self, text: str):
-        self.current_text = text
-        self.text_timer = 180  # Show text for 3 seconds (60 fps * 3)
-        
-    def draw(self, screen):
-        # Draw AI as a blue pentagon
-        points = []
-        radius = 20
-        for i in range(5):
-            angle = math.radians(i * 72 - 90)
-            points.append((
-                self.x + radius * math.cos(angle),
-                self.y + radius * math.sin(angle)
-            ))
-        pygame.draw.polygon(screen, (0, 128, 255), points)
-        
-        # Draw speech bubble if text is active
-        if self.text_timer > 0:
-            font = pygame.font.Font(None, 24)
-            text = font.render(self.current_text, True, (255, 255, 255))
-            pygame.draw.rect(screen, (0, 0, 0), 
-                           (self.x - text.get_width()//2 - 5, 
-                            self.y - 60, 
-                            text.get_width() + 10, 
-                            30))
-            screen.blit(text, (self.x - text.get_width()//2, self.y - 55))
+class AIAgent(Agent):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sprites = SpriteCache()
+
+    def draw(self, screen, camera: Optional[Camera] = None):
+        draw_agent(screen, self, self._sprites, camera)
 
 class WorldGUI:
-    def __init__(self):
-        self.objects: List[Object] = []
+    def __init__(self, event_log: Optional[str] = None, profile: Optional[str] = None, frame_times: bool = False,
+                 profile_dir: str = "profiles", action_lines: int = 1000, action_log: Optional[str] = None,
+                 history: int = 100_000):
+        self.world = World(ObservableList(), ObservableList())
+        self.objects: ObservableList = self.world.objects
         self.game_objects: List[GameObject] = []
-        self.interactions: List[Dict[str, str]] = []
+        self.interactions: ObservableList = self.world.interactions
+        self.ai = AISession()
+        self.ai.warm_up()
         self.ai_agent = AIAgent()
+        self.scheduler = Scheduler()
+        # Name and position lookups over game_objects; keep it updated whenever they change
+        self.world_index = WorldIndex()
+        self._load_generation = 0  # Bumped by every load, so batches of an earlier one stop
+        # When set, the AI is only shown objects within this many pixels of it
+        self.perception_radius: Optional[float] = None
+        # Every change to the world, so the view can be rewound to any decision
+        self.events = EventLog(event_log, max_events=history)
+        self.replay_seq: Optional[int] = None  # The decision event shown while rewinding
+        self.replay_index: Optional[WorldIndex] = None
+        self.replay_agent: Optional[AIAgent] = None
+        
+        # F9 starts and stops the profiler, F10 the per-frame timings; off, they cost next to nothing
+        self.profiler = Profiler(profile or "cprofile", profile_dir)
+        self.frame_timer = FrameTimer()
+        self.frame_timer.enabled = frame_times
+        if profile:
+            self.profiler.start()
         
         # Add running flag for clean shutdown
         self.running = True
@@ -147,6 +114,11 @@ class WorldGUI:
         self.last_click_time = 0
         self.last_clicked_object = None
         
+        # The view onto the world; objects keep world coordinates whatever the window size
+        self.camera = Camera(800, 600)
+        self.renderer = WorldRenderer()
+        self.panning = False
+        
         # Initialize Pygame in a separate thread
         self.pygame_queue = Queue()
         self.pygame_thread = threading.Thread(target=self.run_pygame)
@@ -167,7 +139,10 @@ class WorldGUI:
         
         # Objects List
         ttk.Label(self.main_container, text="Objects").pack()
-        self.objects_listbox = tk.Listbox(self.main_container, height=8)  # Reduced height
+        # Only the visible rows are ever in the widget, so huge worlds stay fast
+        self.objects_listbox = VirtualListbox(self.main_container, self.objects,
+                                              lambda obj: f"{obj['name']} ({obj['object_type']})",
+                                              height=8)  # Reduced height
         self.objects_listbox.pack(fill=tk.BOTH, expand=True)
         
         # Object Controls
@@ -180,6 +155,8 @@ class WorldGUI:
         ttk.Label(self.main_container, text="Interactions").pack()
         self.interactions_listbox = tk.Listbox(self.main_container, height=8)  # Reduced height
         self.interactions_listbox.pack(fill=tk.BOTH, expand=True)
+        ListboxBinding(self.interactions_listbox, self.interactions,
+                       lambda interaction: f"{interaction['from']} - {interaction['type']}")
         
         # Interaction Controls
         self.interaction_controls = ttk.Frame(self.main_container)
@@ -188,11 +165,20 @@ class WorldGUI:
         ttk.Button(self.interaction_controls, text="Remove Interaction", command=self.remove_interaction).pack(side=tk.LEFT)
         ttk.Button(self.interaction_controls, text="Send to AI", command=self.send_to_ai).pack(side=tk.LEFT)
         
+        # World file controls
+        self.world_controls = ttk.Frame(self.main_container)
+        self.world_controls.pack(fill=tk.X, pady=5)
+        ttk.Button(self.world_controls, text="Save World", command=self.save_world_file).pack(side=tk.LEFT)
+        ttk.Button(self.world_controls, text="Load World", command=self.load_world_file).pack(side=tk.LEFT)
+        
         # AI Action History
         ttk.Label(self.main_container, text="AI Actions").pack()
         self.action_text = scrolledtext.ScrolledText(self.main_container, height=12, wrap=tk.WORD)
         self.action_text.pack(fill=tk.BOTH, expand=True, pady=5)
         self.action_text.config(state=tk.DISABLED)  # Make read-only
+        # Only the latest actions stay in the panel; older ones go to the action log file, if there is one
+        self.action_log = ActionLog(action_lines, action_log)
+        TextBinding(self.action_text, self.action_log)
         
         # Close button frame
         close_frame = ttk.Frame(self.main_container)
@@ -217,26 +203,13 @@ class WorldGUI:
             ("Pink", (255, 192, 203)),
             ("Cyan", (0, 255, 255))
         ]
-        
-        self.update_lists()
 
     def generate_random_position(self):
-        """Generate a random position within the current window bounds"""
+        """Generate a random position within the part of the world currently in view"""
         import random
-        # Get current window size
-        window_size = pygame.display.get_surface().get_size()
-        return random.randint(50, window_size[0] - 50), random.randint(50, window_size[1] - 50)
-
-    def update_lists(self):
-        # Update objects listbox
-        self.objects_listbox.delete(0, tk.END)
-        for obj in self.objects:
-            self.objects_listbox.insert(tk.END, f"{obj['name']} ({obj['object_type']})")
-        
-        # Update interactions listbox
-        self.interactions_listbox.delete(0, tk.END)
-        for interaction in self.interactions:
-            self.interactions_listbox.insert(tk.END, f"{interaction['from']} - {interaction['type']}")
+        # Keep new objects 50 screen pixels away from the window edges
+        left, top, right, bottom = self.camera.visible_rect(margin=-50 / self.camera.zoom)
+        return random.uniform(left, max(left, right)), random.uniform(top, max(top, bottom))
 
     def show_add_object_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -284,9 +257,10 @@ class WorldGUI:
         interactions_frame = ttk.LabelFrame(container, text="Interactions", padding="5")
         interactions_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         
-        interactions: Dict[str, str] = {}
+        interactions: ObservableDict = ObservableDict()
         interactions_listbox = tk.Listbox(interactions_frame, height=8)
         interactions_listbox.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ListboxBinding(interactions_listbox, interactions, lambda item: f"{item[0]}: {item[1]}")
         
         # Scrollbar for interactions listbox
         scrollbar = ttk.Scrollbar(interactions_frame, orient="vertical", command=interactions_listbox.yview)
@@ -325,9 +299,6 @@ class WorldGUI:
                 desc = int_desc_entry.get()
                 if name and desc:
                     interactions[name] = desc
-                    interactions_listbox.delete(0, tk.END)
-                    for k, v in interactions.items():
-                        interactions_listbox.insert(tk.END, f"{k}: {v}")
                 interaction_dialog.destroy()
             
             def cancel_interaction():
@@ -345,14 +316,9 @@ class WorldGUI:
         def remove_object_interaction():
             selection = interactions_listbox.curselection()
             if selection:
-                index = selection[0]
-                selected_item = interactions_listbox.get(index)
-                interaction_name = selected_item.split(":")[0].strip()
-                if interaction_name in interactions:
-                    del interactions[interaction_name]
-                    interactions_listbox.delete(0, tk.END)
-                    for k, v in interactions.items():
-                        interactions_listbox.insert(tk.END, f"{k}: {v}")
+                # Rows follow the dict's order, so the row index picks the interaction directly
+                interaction_name = list(interactions)[selection[0]]
+                del interactions[interaction_name]
         
         # Main dialog buttons frame
         button_frame = ttk.Frame(container)
@@ -366,11 +332,12 @@ class WorldGUI:
                 # Get color tuple from selected color name
                 color = next(color_tuple for name, color_tuple in self.available_colors 
                            if name == color_var.get())
+                saved_interactions = dict(interactions)
                 
                 new_object: Object = {
                     "name": name,
                     "object_type": obj_type,
-                    "interactions": interactions
+                    "interactions": saved_interactions
                 }
                 
                 game_object = GameObject(
@@ -380,12 +347,13 @@ class WorldGUI:
                     y=y,
                     color=color,
                     shape=shape_var.get(),
-                    interactions=interactions
+                    interactions=saved_interactions
                 )
                 
                 self.objects.append(new_object)
                 self.game_objects.append(game_object)
-                self.update_lists()
+                self.world_index.add(game_object)
+                self.events.add_objects([game_object])
                 dialog.destroy()
         
         def cancel_object():
@@ -399,8 +367,9 @@ class WorldGUI:
         if selection:
             index = selection[0]
             self.objects.pop(index)
-            self.game_objects.pop(index)
-            self.update_lists()
+            game_object = self.game_objects.pop(index)
+            self.world_index.remove(game_object)
+            self.events.remove_objects([game_object])
 
     def show_add_interaction_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -448,7 +417,7 @@ class WorldGUI:
                     "description": desc
                 }
                 self.interactions.append(interaction)
-                self.update_lists()
+                self.events.add_interaction(interaction)
                 dialog.destroy()
         
         def cancel_interaction():
@@ -463,57 +432,105 @@ class WorldGUI:
         if selection:
             index = selection[0]
             self.interactions.pop(index)
-            self.update_lists()
+            self.events.remove_interaction(index)
 
-    async def _send_to_ai(self):
-        data = {
-            "objects": self.objects,
-            "interactionsWithYou": self.interactions
-        }
-        result = await transmitAndPost(data)
-        return result
+    def observation(self):
+        if self.perception_radius is None:
+            return self.world.observation()
+        nearby = self.world_index.within_radius(self.ai_agent.x, self.ai_agent.y, self.perception_radius)
+        return self.world.observation([object_dict(obj) for obj in nearby])
 
     def add_ai_action(self, text: str):
         """Add an AI action to the history with timestamp"""
-        self.action_text.config(state=tk.NORMAL)
         timestamp = time.strftime("%H:%M:%S", time.localtime())
-        self.action_text.insert(tk.END, f"[{timestamp}] {text}\n")
-        self.action_text.see(tk.END)  # Scroll to bottom
-        self.action_text.config(state=tk.DISABLED)
+        self.action_log.append(f"[{timestamp}] {text}")
 
     def send_to_ai(self):
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        result = loop.run_until_complete(self._send_to_ai())
-        
-        # Find target object and move AI towards it
-        target_obj = next((obj for obj in self.game_objects if obj.name == result['focusObject']), None)
-        if target_obj:
-            self.pygame_queue.put(('move_ai', target_obj))
-            self.add_ai_action(f"Moving toward {result['focusObject']}")
-        
-        # Process interactions
-        for interaction in result['interactions']:
-            target_obj = next((obj for obj in self.game_objects if obj.name == interaction['with_']), None)
-            if target_obj:
-                if interaction['extraData']:
-                    self.pygame_queue.put(('ai_speak', interaction['extraData']))
-                    self.add_ai_action(f"Speaking to {interaction['with_']}: {interaction['extraData']}")
-                self.pygame_queue.put(('move_ai', target_obj))
-                self.add_ai_action(f"Using '{interaction['type']}' with {interaction['with_']}")
-                time.sleep(1)  # Add delay between interactions
+        with self.profiler.section("ai"):
+            result = self.ai.decide_blocking(self.observation())
+        
+        # The pygame thread plays the actions out frame by frame, replacing any unfinished decision
+        self.pygame_queue.put(('ai_timeline', dispatch(result, self.world_index.resolve, self.add_ai_action)))
         
         # Clear interactions after processing
-        self.interactions = []
-        self.update_lists()
+        self.events.decision(result, self.ai_agent)
+        self.interactions.clear()
+
+    def save_world_file(self):
+        """Save the world to a binary world file, or JSON if a .json name is chosen"""
+        path = filedialog.asksaveasfilename(
+            parent=self.root,
+            defaultextension=BINARY_SUFFIX,
+            filetypes=[("World files", f"*{BINARY_SUFFIX}"), ("JSON", "*.json")]
+        )
+        if path:
+            save_world(path, self.game_objects, self.interactions)
+
+    def load_world_file(self, path: Optional[str] = None):
+        """Replace the world with one loaded from disk, adding objects in batches"""
+        if path is None:
+            path = filedialog.askopenfilename(
+                parent=self.root,
+                filetypes=[("World files", f"*{BINARY_SUFFIX}"), ("JSON", "*.json")]
+            )
+            if not path:
+                return
+        loaded, interactions = load_world(path, factory=GameObject)
+        self.load_objects(loaded, interactions)
+
+    def generate_world(self, count: int, seed: Optional[int] = None, scenario: Optional[str] = None):
+        """Replace the world with a procedurally generated one or a trolley problem scenario"""
+        if scenario:
+            objects, interactions = trolley_problem(scenario, factory=GameObject)
+        else:
+            objects = WorldGenerator(
+                seed=seed,
+                shapes=self.available_shapes,
+                colors=self.available_colors,
+                factory=GameObject
+            ).generate(count)
+            interactions = []
+        self.load_objects(objects, interactions)
+
+    def load_objects(self, loaded, interactions: List[Dict[str, str]]):
+        """Replace the world's objects and interactions, adding objects in batches"""
+        # Start from an empty world; a fresh list keeps the pygame thread from seeing a half cleared one
+        self.objects.clear()
+        self.game_objects = []
+        self.world_index = WorldIndex()
+        self.interactions.clear()
+        self.interactions.extend(interactions)
+        self.events.reset(interactions)
+        self._load_generation += 1
+        generation = self._load_generation
+        
+        if isinstance(loaded, MappedWorld):
+            batches = loaded.iter_batches()
+        else:
+            batches = (loaded[i:i + 4096] for i in range(0, len(loaded), 4096))
+        
+        def load_next_batch():
+            # A later load replaced the world while this one was still adding batches
+            superseded = generation != self._load_generation
+            batch = None if superseded else next(batches, None)
+            if batch is None:
+                if isinstance(loaded, MappedWorld):
+                    loaded.close()
+                return
+            self.game_objects.extend(batch)
+            self.world_index.extend(batch)
+            self.events.add_objects(batch)
+            self.objects.extend(object_dict(obj) for obj in batch)
+            # Yield to the Tk event loop between batches so the window stays responsive
+            self.root.after(1, load_next_batch)
+        
+        load_next_batch()
 
     def on_closing(self):
         """Handle window closing event"""
         self.running = False  # Signal pygame thread to stop
+        self.events.close()
+        self.action_log.close()
         self.root.quit()  # Stop tkinter mainloop
         self.root.destroy()  # Destroy the window
         pygame.quit()  # Quit pygame
@@ -568,13 +585,12 @@ class WorldGUI:
         interactions_frame = ttk.LabelFrame(container, text="Interactions", padding="5")
         interactions_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         
-        interactions: Dict[str, str] = game_object.interactions.copy()  # Copy existing interactions
+        interactions: ObservableDict = ObservableDict(game_object.interactions)  # Copy existing interactions
         interactions_listbox = tk.Listbox(interactions_frame, height=8)
         interactions_listbox.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # Pre-fill interactions listbox
-        for k, v in interactions.items():
-            interactions_listbox.insert(tk.END, f"{k}: {v}")
+        # Pre-fills the listbox and keeps it in sync
+        ListboxBinding(interactions_listbox, interactions, lambda item: f"{item[0]}: {item[1]}")
         
         # Scrollbar for interactions listbox
         scrollbar = ttk.Scrollbar(interactions_frame, orient="vertical", command=interactions_listbox.yview)
@@ -613,9 +629,6 @@ class WorldGUI:
                 desc = int_desc_entry.get()
                 if name and desc:
                     interactions[name] = desc
-                    interactions_listbox.delete(0, tk.END)
-                    for k, v in interactions.items():
-                        interactions_listbox.insert(tk.END, f"{k}: {v}")
                 interaction_dialog.destroy()
             
             def cancel_interaction():
@@ -633,14 +646,9 @@ class WorldGUI:
         def remove_object_interaction():
             selection = interactions_listbox.curselection()
             if selection:
-                index = selection[0]
-                selected_item = interactions_listbox.get(index)
-                interaction_name = selected_item.split(":")[0].strip()
-                if interaction_name in interactions:
-                    del interactions[interaction_name]
-                    interactions_listbox.delete(0, tk.END)
-                    for k, v in interactions.items():
-                        interactions_listbox.insert(tk.END, f"{k}: {v}")
+                # Rows follow the dict's order, so the row index picks the interaction directly
+                interaction_name = list(interactions)[selection[0]]
+                del interactions[interaction_name]
         
         # Main dialog buttons frame
         button_frame = ttk.Frame(container)
@@ -655,20 +663,23 @@ class WorldGUI:
                            if name == color_var.get())
                 
                 # Update the existing objects
+                saved_interactions = dict(interactions)
                 self.objects[object_index].update({
                     "name": name,
                     "object_type": obj_type,
-                    "interactions": interactions
+                    "interactions": saved_interactions
                 })
+                self.objects.refresh(object_index)
                 
                 # Update game object
                 game_object.name = name
                 game_object.object_type = obj_type
-                game_object.interactions = interactions
+                game_object.interactions = saved_interactions
                 game_object.color = color
                 game_object.shape = shape_var.get()
+                self.world_index.update(game_object)
+                self.events.edit_object(game_object)
                 
-                self.update_lists()
                 dialog.destroy()
         
         def cancel_object():
@@ -682,115 +693,171 @@ class WorldGUI:
         if messagebox.askokcancel("Close Program", "Are you sure you want to close the program?"):
             self.on_closing()
 
+    def rewind(self, step: int):
+        """Show the world as it was at an earlier decision; step moves between decisions, 0 leaves rewind"""
+        decisions = self.events.decision_seqs()
+        if step == 0 or not decisions:
+            self.replay_seq = self.replay_index = self.replay_agent = None
+            pygame.display.set_caption("World Simulation")
+            return
+        if self.replay_seq is None:
+            # Start from the latest decision
+            position = len(decisions) - 1
+        elif self.replay_seq not in decisions:
+            position = 0  # The decision shown was dropped from memory meanwhile; go to the oldest kept
+        else:
+            position = max(0, min(decisions.index(self.replay_seq) + step, len(decisions) - 1))
+        self.replay_seq = decisions[position]
+        
+        # The world as the AI saw it when it made the decision
+        state = self.events.state_at(self.replay_seq - 1)
+        event = self.events.event(self.replay_seq)
+        self.replay_index = WorldIndex(state.stored_objects())
+        self.replay_agent = AIAgent(*event.data["agent"])
+        result = event.data["result"]
+        speech = next((interaction["extraData"] for interaction in result.get("interactions", [])
+                       if interaction.get("extraData")), f"Focus: {result.get('focusObject')}")
+        self.replay_agent.say(speech, 1)
+        dropped = " (older ones dropped from memory, see --history)" if self.events.first else ""
+        pygame.display.set_caption(f"World Simulation - rewind: decision {position + 1}/{len(decisions)}{dropped} "
+                                   "([ and ] to step, Esc to return)")
+
     def run_pygame(self):
         pygame.init()
-        screen = pygame.display.set_mode((800, 600), pygame.RESIZABLE)
+        screen = pygame.display.set_mode((self.camera.width, self.camera.height), pygame.RESIZABLE)
         pygame.display.set_caption("World Simulation")
         clock = pygame.time.Clock()
         
-        # Track window size
-        window_width = 800
-        window_height = 600
-        
         while self.running:
+            self.profiler.sync("pygame")
+            self.frame_timer.start()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
                     self.root.quit()
                     break
                 elif event.type == pygame.VIDEORESIZE:
-                    # Handle window resize
-                    old_width = window_width
-                    old_height = window_height
-                    window_width = event.w
-                    window_height = event.h
-                    screen = pygame.display.set_mode((window_width, window_height), pygame.RESIZABLE)
-                    
-                    # Scale object positions to maintain relative positions
-                    scale_x = window_width / old_width
-                    scale_y = window_height / old_height
-                    for obj in self.game_objects:
-                        obj.x *= scale_x
-                        obj.y *= scale_y
-                    
-                    # Scale AI position
-                    self.ai_agent.x *= scale_x
-                    self.ai_agent.y *= scale_y
-                    self.ai_agent.target_x *= scale_x
-                    self.ai_agent.target_y *= scale_y
+                    # Objects keep their world positions; the camera just shows more or less of the world
+                    screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+                    self.camera.resize(event.w, event.h)
                     
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:  # Left mouse button
+                    if event.button == 1 and self.replay_seq is None:  # Left mouse button; the past can't be edited
                         current_time = time.time()
-                        mouse_x, mouse_y = event.pos
+                        mouse_x, mouse_y = self.camera.screen_to_world(*event.pos)
+                        
+                        # Only objects in the grid cells around the cursor can be under it
+                        hits = [obj for obj in self.world_index.within_radius(mouse_x, mouse_y, 30)
+                                if obj.contains_point(mouse_x, mouse_y)]
                         
                         # Check for double click
                         if (current_time - self.last_click_time) < 0.4:  # 400ms for double click
                             # Check if clicked on the same object
-                            for i, obj in enumerate(self.game_objects):
-                                if obj == self.last_clicked_object and obj.contains_point(mouse_x, mouse_y):
-                                    # Open edit dialog
-                                    self.show_edit_object_dialog(obj, i)
-                                    break
+                            if self.last_clicked_object in hits:
+                                # Open edit dialog
+                                obj = self.last_clicked_object
+                                self.show_edit_object_dialog(obj, self.game_objects.index(obj))
                         
                         # Update last click info
                         self.last_click_time = current_time
                         
                         # Check for dragging
-                        for obj in self.game_objects:
-                            if obj.contains_point(mouse_x, mouse_y):
-                                self.dragged_object = obj
-                                self.last_clicked_object = obj
-                                self.drag_offset_x = obj.x - mouse_x
-                                self.drag_offset_y = obj.y - mouse_y
-                                break
+                        if hits:
+                            obj = hits[0]  # Nearest to the cursor
+                            self.dragged_object = obj
+                            self.last_clicked_object = obj
+                            self.drag_offset_x = obj.x - mouse_x
+                            self.drag_offset_y = obj.y - mouse_y
+                    elif event.button in (2, 3):  # Middle or right mouse button pans
+                        self.panning = True
                 elif event.type == pygame.MOUSEBUTTONUP:
                     if event.button == 1:  # Left mouse button
+                        if self.dragged_object is not None:
+                            self.events.move_object(self.dragged_object)
                         self.dragged_object = None
+                    elif event.button in (2, 3):
+                        self.panning = False
                 elif event.type == pygame.MOUSEMOTION:
                     if self.dragged_object is not None:
-                        # Update object position, keeping it within screen bounds
-                        mouse_x, mouse_y = event.pos
-                        new_x = mouse_x + self.drag_offset_x
-                        new_y = mouse_y + self.drag_offset_y
-                        
-                        # Constrain to screen bounds with padding
-                        padding = 30  # Enough to keep object and name visible
-                        new_x = max(padding, min(window_width - padding, new_x))
-                        new_y = max(padding, min(window_height - padding, new_y))
-                        
-                        self.dragged_object.x = new_x
-                        self.dragged_object.y = new_y
+                        # Update object position in world coordinates
+                        mouse_x, mouse_y = self.camera.screen_to_world(*event.pos)
+                        self.dragged_object.x = mouse_x + self.drag_offset_x
+                        self.dragged_object.y = mouse_y + self.drag_offset_y
+                        self.world_index.move(self.dragged_object)
+                    elif self.panning:
+                        self.camera.pan(*event.rel)
+                elif event.type == pygame.MOUSEWHEEL:
+                    # Zoom around the cursor
+                    self.camera.zoom_at(*pygame.mouse.get_pos(), 1.1 ** event.y)
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_LEFT:
+                        self.camera.pan(40, 0)
+                    elif event.key == pygame.K_RIGHT:
+                        self.camera.pan(-40, 0)
+                    elif event.key == pygame.K_UP:
+                        self.camera.pan(0, 40)
+                    elif event.key == pygame.K_DOWN:
+                        self.camera.pan(0, -40)
+                    elif event.key == pygame.K_LEFTBRACKET:
+                        self.rewind(-1)
+                    elif event.key == pygame.K_RIGHTBRACKET:
+                        self.rewind(1)
+                    elif event.key == pygame.K_ESCAPE:
+                        self.rewind(0)
+                    elif event.key == pygame.K_HOME:
+                        # Back to the default view
+                        self.camera.x = self.camera.y = 0
+                        self.camera.zoom = 1.0
+                    elif event.key == pygame.K_F9:
+                        self.report_profile(self.profiler.toggle(self.frame_timer))
+                    elif event.key == pygame.K_F10:
+                        if not self.frame_timer.toggle():
+                            self.report_profile(self.profiler.dump([], None, self.frame_timer))
             
             if not self.running:
                 break
+            self.frame_timer.mark("events")
                 
             # Process any commands from the tkinter thread
             while not self.pygame_queue.empty():
                 cmd, data = self.pygame_queue.get()
-                if cmd == 'move_ai':
-                    self.ai_agent.move_towards(data)
-                elif cmd == 'ai_speak':
-                    self.ai_agent.say(data)
+                if cmd == 'ai_timeline':
+                    self.scheduler.submit(self.ai_agent, data, preempt=True)
+            self.frame_timer.mark("queue")
             
             # Update
+            self.scheduler.tick()
             self.ai_agent.update()
+            self.frame_timer.mark("update")
             
             # Draw
             screen.fill((32, 32, 32))  # Dark gray background
             
-            # Draw all game objects
-            for obj in self.game_objects:
-                obj.draw(screen)
-            
-            # Draw AI agent
-            self.ai_agent.draw(screen)
+            # Draw the game objects in view and the AI agent, or the world at the decision being rewound to
+            if self.replay_seq is not None:
+                self.renderer.draw(screen, self.camera, self.replay_index, self.replay_agent)
+            else:
+                self.renderer.draw(screen, self.camera, self.world_index, self.ai_agent)
+            self.frame_timer.mark("draw")
             
             pygame.display.flip()
+            self.frame_timer.mark("flip")
+            self.frame_timer.end()
             clock.tick(60)
         
+        # Profiling started from the command line ends with the app
+        self.report_profile(self.profiler.stop(self.frame_timer))
         pygame.quit()
 
+    def report_profile(self, paths: List[str]):
+        """Print where the profiler wrote its results and the frame timing summary"""
+        for path in paths:
+            print(f"Profile written to {path}")
+        if paths and self.profiler.skipped:
+            print(f"{self.profiler.skipped} thread(s) or section(s) were not profiled: another profiler was active")
+        if paths and self.frame_timer.frames:
+            print(format_summary(self.frame_timer.summary()))
+
     def run(self):
         try:
             self.root.mainloop()
@@ -798,6 +865,118 @@ class WorldGUI:
             self.running = False  # Ensure pygame thread stops
             pygame.quit()  # Ensure pygame is properly shut down
 
+def run_viewer(address: str):
+    """Watch a world served by worldServer.py instead of running one here
+
+    Objects can still be dragged; the move is sent to the server, which passes it on to
+    every other viewer.
+    """
+    import asyncio
+    from worldServer import WorldClient
+    
+    client = WorldClient()
+    loop = asyncio.new_event_loop()
+    connection = threading.Thread(target=loop.run_until_complete, args=(client.run(address),), daemon=True)
+    connection.start()
+    
+    pygame.init()
+    camera = Camera(800, 600)
+    screen = pygame.display.set_mode((camera.width, camera.height), pygame.RESIZABLE)
+    renderer = WorldRenderer()
+    agent = AIAgent()
+    clock = pygame.time.Clock()
+    dragged = None
+    panning = False
+    shown_decisions = 0
+    
+    # The connection ends when the server goes away
+    while connection.is_alive():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+            elif event.type == pygame.VIDEORESIZE:
+                screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+                camera.resize(event.w, event.h)
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:
+                    with client.lock:
+                        hits = client.index.within_radius(*camera.screen_to_world(*event.pos), 15)
+                    dragged = hits[0] if hits else None
+                elif event.button in (2, 3):
+                    panning = True
+            elif event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1 and dragged is not None:
+                    loop.call_soon_threadsafe(client.move_object, dragged, dragged.x, dragged.y)
+                    dragged = None
+                elif event.button in (2, 3):
+                    panning = False
+            elif event.type == pygame.MOUSEMOTION:
+                if dragged is not None:
+                    with client.lock:
+                        dragged.x, dragged.y = camera.screen_to_world(*event.pos)
+                        client.index.move(dragged)
+                elif panning:
+                    camera.pan(*event.rel)
+            elif event.type == pygame.MOUSEWHEEL:
+                camera.zoom_at(*pygame.mouse.get_pos(), 1.1 ** event.y)
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT:
+                    camera.pan(40, 0)
+                elif event.key == pygame.K_RIGHT:
+                    camera.pan(-40, 0)
+                elif event.key == pygame.K_UP:
+                    camera.pan(0, 40)
+                elif event.key == pygame.K_DOWN:
+                    camera.pan(0, -40)
+                elif event.key == pygame.K_HOME:
+                    camera.x = camera.y = 0
+                    camera.zoom = 1.0
+        
+        screen.fill((32, 32, 32))
+        # The connection thread updates the world between frames, never while it is drawn
+        with client.lock:
+            agent.x, agent.y = client.agent.x, client.agent.y
+            agent.current_text, agent.text_timer = client.agent.current_text, client.agent.text_timer
+            renderer.draw(screen, camera, client.index, agent)
+            decision = client.decision
+        if client.decisions != shown_decisions and decision is not None:
+            shown_decisions = client.decisions
+            pygame.display.set_caption(f"World Simulation - {address} - focus: {decision['focusObject']}")
+        pygame.display.flip()
+        clock.tick(60)
+    pygame.quit()
+
 if __name__ == "__main__":
-    app = WorldGUI()
-    app.run() 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Rendered fake world")
+    parser.add_argument("--load", help="world file (.fworld or .json) to open on startup")
+    parser.add_argument("--generate", type=int, metavar="N", help="start with N generated objects")
+    parser.add_argument("--seed", type=int, help="seed for --generate")
+    parser.add_argument("--scenario", choices=["best_friend", "fat_man"], help="start with a trolley problem")
+    parser.add_argument("--event-log", help="also append the world's events to this file (JSON lines)")
+    parser.add_argument("--history", type=int, default=100_000,
+                        help="world events kept in memory for rewinding; older ones are only in --event-log")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], help="profile from startup until exit (F9 toggles)")
+    parser.add_argument("--frame-times", action="store_true", help="record per-frame phase timings (F10 toggles)")
+    parser.add_argument("--profile-dir", default="profiles", help="where profiles and frame timings are written")
+    parser.add_argument("--action-lines", type=int, default=1000, help="AI actions kept in the panel")
+    parser.add_argument("--action-log", help="append AI actions that scroll out of the panel to this file")
+    parser.add_argument("--track-memory", type=float, metavar="SECONDS",
+                        help="report the biggest memory growth every this many seconds")
+    parser.add_argument("--connect", metavar="ADDRESS", help="watch a world served by worldServer.py (HOST:PORT or unix:PATH)")
+    args = parser.parse_args()
+    
+    if args.connect:
+        run_viewer(args.connect)
+        raise SystemExit
+    if args.track_memory:
+        MemoryTracker(args.track_memory).start()
+    app = WorldGUI(event_log=args.event_log, profile=args.profile, frame_times=args.frame_times,
+                   profile_dir=args.profile_dir, action_lines=args.action_lines, action_log=args.action_log,
+                   history=args.history)
+    if args.load:
+        app.load_world_file(args.load)
+    elif args.generate or args.scenario:
+        app.generate_world(args.generate or 0, seed=args.seed, scenario=args.scenario)
+    app.run()
@@ -0,0 +1,293 @@
+"""One pooled HTTP transport for every chat session, and a pool of the sessions themselves
+
+Every chat made from one client shares that client's HTTP connections, so make_client
+builds the client once with limits on them: at most max_connections open at a time, up
+to max_keepalive kept warm between requests for keepalive_expiry seconds. For the real
+API the limits go to the httpx client inside genai.Client; FAKEWORLD_BACKEND=mock-http
+uses HttpPool, a small keep-alive pool of its own, against mockModel's HTTP server.
+
+SessionPool hands out chat sessions by key (an agent, a scenario). A new session starts
+from a copy of the briefing exchange rather than briefing the model again, idle sessions
+expire and the least recently used one is dropped when the pool is full.
+
+    python sessionPool.py    # requests per second with and without pooling, on a local mock server
+"""
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+import asyncio
+import json
+import os
+import time
+from promptTemplates import PromptLedger
+
+
+@dataclass
+class PoolLimits:
+    max_connections: int = 10
+    max_keepalive: int = 5  # 0 opens a new connection for every request
+    keepalive_expiry: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "PoolLimits":
+        return cls(int(os.environ.get("FAKEWORLD_MAX_CONNECTIONS", cls.max_connections)),
+                   int(os.environ.get("FAKEWORLD_MAX_KEEPALIVE", cls.max_keepalive)),
+                   float(os.environ.get("FAKEWORLD_KEEPALIVE_EXPIRY", cls.keepalive_expiry)))
+
+
+class HttpPool:
+    """Keep-alive HTTP/1.1 connections to one server, shared by every request through it"""
+
+    def __init__(self, address: str, limits: Optional[PoolLimits] = None):
+        self.host, port = address.rsplit(":", 1)
+        self.port = int(port)
+        self.limits = limits or PoolLimits()
+        self.opened = 0
+        self.reused = 0
+        self._idle: deque = deque()  # (reader, writer, idle since), most recently used last
+        self._loop = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        # Connections and semaphores belong to one event loop and the app creates more than one
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.limits.max_connections)
+            self._idle.clear()
+        return self._slots
+
+    async def _connection(self):
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, since = self._idle.pop()
+            if now - since < self.limits.keepalive_expiry and not reader.at_eof():
+                self.reused += 1
+                return reader, writer, True
+            writer.close()
+        self.opened += 1
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return reader, writer, False
+
+    async def _exchange(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str, body: bytes):
+        keep_alive = self.limits.max_keepalive > 0
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("The server closed the connection")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = await reader.readexactly(int(headers.get("content-length", 0)))
+        keep_alive = keep_alive and headers.get("connection", "").lower() != "close"
+        return int(status_line.split()[1]), keep_alive, payload
+
+    async def request(self, path: str, body: bytes) -> bytes:
+        async with self._semaphore():
+            for attempt in range(2):
+                reader, writer, reused = await self._connection()
+                try:
+                    status, keep_alive, payload = await self._exchange(reader, writer, path, body)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    # The server may have closed an idle connection just as it was reused
+                    if not reused or attempt:
+                        raise
+                except BaseException:
+                    # Cancelled mid-exchange (a caller timing out, say): the connection is in an unknown state
+                    writer.close()
+                    raise
+            if keep_alive and len(self._idle) < self.limits.max_keepalive:
+                self._idle.append((reader, writer, time.monotonic()))
+            else:
+                writer.close()
+        if status != 200:
+            raise ConnectionError(f"HTTP {status} from {path}: {payload[:200]!r}")
+        return payload
+
+    async def close(self):
+        while self._idle:
+            writer = self._idle.pop()[1]
+            writer.close()
+            await writer.wait_closed()
+
+
+def make_client(limits: Optional[PoolLimits] = None):
+    """The AI client for FAKEWORLD_BACKEND, with the limits on the connections all its chats share"""
+    limits = limits or PoolLimits.from_env()
+    backend = os.environ.get("FAKEWORLD_BACKEND")
+    if backend == "mock":
+        from mockModel import MockClient
+        return MockClient()
+    if backend == "mock-http":
+        from mockModel import MockHttpClient
+        return MockHttpClient(os.environ.get("FAKEWORLD_MOCK_ADDRESS", "127.0.0.1:8770"), limits)
+    import httpx
+    from google import genai
+    return genai.Client(api_key=os.environ.get("GOOGLE_GENAI_API_KEY"), http_options={
+        'api_version': 'v1alpha',
+        'async_client_args': {'limits': httpx.Limits(max_connections=limits.max_connections,
+                                                     max_keepalive_connections=limits.max_keepalive,
+                                                     keepalive_expiry=limits.keepalive_expiry)},
+    })
+
+
+@dataclass
+class PooledSession:
+    chat: Any
+    ledger: PromptLedger = field(default_factory=PromptLedger)
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SessionPool:
+    """Chat sessions by key, all made from one client
+
+    Pass the briefing exchange (the first two entries of a briefed chat's history) as
+    briefing_history to never brief again, or the briefing text to brief on first use.
+    """
+
+    def __init__(self, client, model: str, config: Optional[dict] = None, briefing_history: Optional[List] = None,
+                 briefing: Optional[str] = None, max_sessions: int = 64, idle_ttl: float = 600.0):
+        if briefing_history is None and briefing is None:
+            raise ValueError("SessionPool needs the briefing or a briefed history")
+        self.client = client
+        self.model = model
+        self.config = config
+        self.briefing_history = briefing_history
+        self.briefing = briefing
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sessions: "OrderedDict[str, PooledSession]" = OrderedDict()
+        self.stats = {"created": 0, "reused": 0, "expired": 0, "evicted": 0, "briefings": 0}
+        self._briefed: Optional[asyncio.Task] = None
+
+    async def _brief(self):
+        chat = self.client.aio.chats.create(model=self.model, config=self.config)
+        await chat.send_message(self.briefing)
+        self.stats["briefings"] += 1
+        self.briefing_history = chat.get_history()[:2]
+
+    async def get(self, key: str) -> PooledSession:
+        now = time.monotonic()
+        self.expire(now)
+        session = self.sessions.get(key)
+        if session is not None:
+            self.sessions.move_to_end(key)
+            session.last_used = now
+            self.stats["reused"] += 1
+            return session
+        if self.briefing_history is None:
+            # Sessions asked for at the same time all wait for one briefing
+            if self._briefed is None or self._briefed.get_loop() is not asyncio.get_running_loop() or (
+                    self._briefed.done() and self._briefed.exception() is not None):
+                self._briefed = asyncio.ensure_future(self._brief())
+            await asyncio.shield(self._briefed)
+        session = PooledSession(self.client.aio.chats.create(model=self.model, config=self.config,
+                                                             history=list(self.briefing_history)))
+        if self.briefing is not None:
+            session.ledger.start_session(self.briefing, _text(self.briefing_history[-1]))
+        self.sessions[key] = session
+        self.stats["created"] += 1
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.stats["evicted"] += 1
+        return session
+
+    def expire(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        for key in [key for key, session in self.sessions.items() if now - session.last_used > self.idle_ttl]:
+            del self.sessions[key]
+            self.stats["expired"] += 1
+
+    def drop(self, key: str):
+        """Forget a session, so the key starts over from the briefing"""
+        self.sessions.pop(key, None)
+
+
+def _text(content) -> str:
+    # History entries are Content objects from the API and dicts from the mock clients
+    parts = content["parts"] if isinstance(content, dict) else content.parts
+    return "".join((part["text"] if isinstance(part, dict) else part.text) or "" for part in parts)
+
+
+async def benchmark_pooling(agents: int = 8, episodes: int = 3, decisions: int = 10, handshake: float = 0.03,
+                            overhead: float = 0.02, address: str = "127.0.0.1:8771") -> Dict[str, Dict[str, float]]:
+    """Agents deciding concurrently against a local mock HTTP server, with and without pooling
+
+    Every agent starts a new chat for each episode. "fresh" opens a connection per
+    request and briefs every new chat, "keep-alive" pools the connections, "pooled" also
+    starts the chats from a SessionPool's briefing. `handshake` stands in for the
+    connection setup a remote API costs.
+    """
+    from mockModel import MockClient, MockHttpClient, serve_http
+    from promptTemplates import get_template
+    from worldGenerator import WorldGenerator
+    from worldStore import observation
+
+    server = MockClient(overhead=overhead, per_decision=0).server
+    http = await serve_http(address, server, handshake)
+    briefing = get_template().render()
+    world = WorldGenerator(seed=0).generate(10)
+    results = {}
+    for mode, limits in (("fresh", PoolLimits(max_keepalive=0)), ("keep-alive", PoolLimits()),
+                         ("pooled", PoolLimits())):
+        client = MockHttpClient(address, limits)
+        sessions = SessionPool(client, "mock", briefing=briefing) if mode == "pooled" else None
+        latencies = []
+
+        async def agent(index: int):
+            key = f"agent-{index}"
+            for _ in range(episodes):
+                if sessions is None:
+                    chat = client.aio.chats.create(model="mock")
+                    await chat.send_message(briefing)
+                else:
+                    sessions.drop(key)
+                for i in range(decisions):
+                    if sessions is not None:
+                        chat = (await sessions.get(key)).chat
+                    pending = [{"from": world[(index + i) % len(world)].name, "type": "talk", "description": "Hello"}]
+                    started = time.perf_counter()
+                    await chat.send_message(json.dumps(observation(world, pending)))
+                    latencies.append(time.perf_counter() - started)
+
+        connections, requests = server.connections, server.requests
+        started = time.perf_counter()
+        await asyncio.gather(*(agent(index) for index in range(agents)))
+        elapsed = time.perf_counter() - started
+        await client.pool.close()
+        latencies.sort()
+        results[mode] = {
+            "decisions_per_s": len(latencies) / elapsed,
+            "mean_ms": 1000 * sum(latencies) / len(latencies),
+            "p95_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "requests": server.requests - requests,
+            "connections": server.connections - connections,
+        }
+    await asyncio.sleep(0.01)  # Let the server see the connections close
+    http.close()
+    await http.wait_closed()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Measure connection and session pooling against a local mock server")
+    parser.add_argument("--agents", type=int, default=8)
+    parser.add_argument("--episodes", type=int, default=3, help="new chats per agent")
+    parser.add_argument("--decisions", type=int, default=10, help="decisions per episode")
+    parser.add_argument("--handshake", type=float, default=0.03, help="seconds of setup per new connection")
+    parser.add_argument("--overhead", type=float, default=0.02, help="seconds the mock takes per request")
+    args = parser.parse_args()
+    for mode, result in asyncio.run(benchmark_pooling(args.agents, args.episodes, args.decisions, args.handshake,
+                                                      args.overhead)).items():
+        print(f"{mode:>10}: " + "  ".join(f"{key} {value:.1f}" for key, value in result.items()))
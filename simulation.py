@@ -0,0 +1,96 @@
+"""Headless simulation of a world and its AI agent, with no window or GUI toolkit"""
+from typing import Dict, List, Optional, Sequence
+from actionTimeline import Scheduler, plan_actions
+from worldStore import observation
+from worldQuery import WorldIndex
+import math
+
+
+class Agent:
+    """Position, movement and speech state of the AI; pygameWorld.AIAgent adds drawing"""
+
+    def __init__(self, x: float = 400, y: float = 300):
+        self.x = x
+        self.y = y
+        self.target_x = x
+        self.target_y = y
+        self.speed = 2
+        self.current_text = ""
+        self.text_timer = 0
+        self.stopping_distance = 50  # Distance at which AI stops from target
+
+    def move_towards(self, target_obj):
+        self.target_x = target_obj.x
+        self.target_y = target_obj.y
+
+    def has_arrived(self) -> bool:
+        """Check if the AI has stopped next to its target"""
+        dx = self.target_x - self.x
+        dy = self.target_y - self.y
+        return dx * dx + dy * dy <= (self.stopping_distance + 1) ** 2
+
+    def update(self):
+        dx = self.target_x - self.x
+        dy = self.target_y - self.y
+        distance = math.sqrt(dx * dx + dy * dy)
+
+        # Only move if we're further than the stopping distance
+        if distance > self.stopping_distance:
+            # Calculate movement while maintaining speed
+            move_distance = min(self.speed, distance - self.stopping_distance)
+            self.x += (dx / distance) * move_distance
+            self.y += (dy / distance) * move_distance
+
+        if self.text_timer > 0:
+            self.text_timer -= 1
+
+    def say(self, text: str, frames: int = 180):
+        self.current_text = text
+        self.text_timer = frames  # Default shows text for 3 seconds (60 fps * 3)
+
+
+class Simulation:
+    """A world, its pending interactions and one agent, stepped at a fixed frame rate"""
+
+    def __init__(self, objects: Sequence, interactions: Optional[List[Dict[str, str]]] = None,
+                 agent: Optional[Agent] = None, perception_radius: Optional[float] = None):
+        self.objects = list(objects)
+        self.interactions = list(interactions or [])
+        self.agent = agent or Agent()
+        self.scheduler = Scheduler()
+        self.frame = 0
+        self.index = WorldIndex(self.objects)
+        # When set the AI only sees objects this close to it
+        self.perception_radius = perception_radius
+
+    def perceived_objects(self) -> List:
+        if self.perception_radius is None:
+            return self.objects
+        return self.index.within_radius(self.agent.x, self.agent.y, self.perception_radius)
+
+    def observation(self) -> dict:
+        return observation(self.perceived_objects(), self.interactions)
+
+    def apply(self, result) -> int:
+        """Queue the actions for an AI decision, preempting the previous one; returns the action count"""
+        actions = plan_actions(result, self.index.resolve)
+        self.scheduler.submit(self.agent, actions, preempt=True)
+        # The AI has answered the pending interactions
+        self.interactions = []
+        return len(actions)
+
+    @property
+    def idle(self) -> bool:
+        return self.scheduler.timeline(self.agent).idle
+
+    def step(self):
+        self.scheduler.tick()
+        self.agent.update()
+        self.frame += 1
+
+    def run_until_idle(self, max_frames: int = 60 * 60) -> int:
+        """Step until the agent has finished its actions; returns the number of frames stepped"""
+        start = self.frame
+        while not self.idle and self.frame - start < max_frames:
+            self.step()
+        return self.frame - start
@@ -1,49 +1,118 @@
-from typing import Dict, List, TypedDict, Optional
-from AIControl import transmitAndPost
-from pprint import pp
+from typing import Dict, Optional
+from worldCore import Object, AIResponse, World, AISession, describe
+import argparse
 import asyncio
-import time
+import os
 import sys
 
-def typeEffect(text, ex=0.1):
+# Set from the command line; fast mode prints instantly and skips the pauses
+fast = False
+
+async def typeEffect(text, ex=0.1):
+    text = str(text)
+    if fast:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
     for char in text:
-        time.sleep(ex)
+        await asyncio.sleep(ex)
         sys.stdout.write(char)
         sys.stdout.flush()
 
-def async_to_sync(awaitable):
+async def pause(seconds):
+    if not fast:
+        await asyncio.sleep(seconds)
+
+
+class StdinLines:
+    """Reads lines from stdin without blocking the event loop"""
+
+    def __init__(self):
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.threaded = False  # Set once stdin turns out not to be watchable
+        self._blocking: Optional[bool] = None  # Whether stdin blocked before the pipe made it non-blocking
+
+    async def readline(self) -> Optional[str]:
+        if self.reader is None and not self.threaded:
+            loop = asyncio.get_running_loop()
+            reader = asyncio.StreamReader()
+            try:
+                blocking = os.get_blocking(sys.stdin.fileno())
+                # A duplicate, so stdin itself is still open to restore once the loop closes the pipe
+                pipe = os.fdopen(os.dup(sys.stdin.fileno()), "rb")
+                try:
+                    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+                except BaseException:
+                    pipe.close()
+                    raise
+                self.reader = reader
+                self._blocking = blocking
+            except (ValueError, NotImplementedError, OSError):
+                # Windows and redirected regular files can't be watched; read them on a thread instead
+                self.threaded = True
+        if self.threaded:
+            line = await asyncio.to_thread(sys.stdin.readline)
+            return line.rstrip("\n") if line else None
+        line = await self.reader.readline()
+        return line.decode().rstrip("\n") if line else None
+
+    def close(self):
+        """Give stdin back blocking, as the shell and later readers expect it"""
+        if self._blocking is not None:
+            os.set_blocking(sys.stdin.fileno(), self._blocking)
+            self._blocking = None
+
+
+class ScriptLines:
+    """Feeds commands from a file, echoing them as if they were typed"""
+
+    def __init__(self, path: str):
+        with open(path) as f:
+            self.lines = [line.rstrip("\n") for line in f]
+        self.position = 0
+
+    async def readline(self) -> Optional[str]:
+        if self.position >= len(self.lines):
+            return None
+        line = self.lines[self.position]
+        self.position += 1
+        sys.stdout.write(line + "\n")
+        return line
+
+    def close(self):
+        pass
+
+
+class EndOfInput(Exception):
+    pass
+
+
+lines = None
+
+async def ainput(prompt=""):
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    line = await lines.readline()
+    if line is None:
+        raise EndOfInput()
+    return line
+
+async def choose(prompt=">"):
+    res = await ainput(prompt)
     try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        # If there's no event loop in the current thread, create one
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    return loop.run_until_complete(awaitable)
-
-class Object(TypedDict):
-    name: str
-    object_type: str
-    interactions: Dict[str, str]
-
-
-class AIInteractionResponse(TypedDict):
-    with_: str  # Using with_ since 'with' is a Python keyword
-    type: str
-    extraData: Optional[str]
-
-class AIResponse(TypedDict):
-    focusObject: str
-    movementDirectionObject: str 
-    interactions: List[AIInteractionResponse]
+        return int(res)
+    except ValueError:
+        return -1
 
 
-objects: List[Object] = []
-interactions: List[Dict[str, str]] =  []
+world = World()
+ai = AISession()
+ai_tasks = set()
 
-def modifyInteractionsLoop():
+async def modifyInteractionsLoop():
     interactions: Dict[str, str] = {}
     while True:
-        typeEffect(f"""
+        await typeEffect(f"""
 {interactions}
 
 Choose an option:
@@ -51,23 +120,23 @@ Choose an option:
     (2) Remove last interaction
     (0) Save
 """, 0.01)
-        res = input(">")
-        if int(res) == 0:
+        res = await choose()
+        if res == 0:
             break
-        elif int(res) == 1:
-            call = input("What do you want to call this interaction?   ")
-            value = input("What does this interaction do?   ")
+        elif res == 1:
+            call = await ainput("What do you want to call this interaction?   ")
+            value = await ainput("What does this interaction do?   ")
             interactions[call] = value
-        elif int(res) == 2:
-            interactions.pop(input("What is the name of the interaction to be removed?   "))
-            typeEffect("Removed!")
+        elif res == 2:
+            interactions.pop(await ainput("What is the name of the interaction to be removed?   "), None)
+            await typeEffect("Removed!")
     return interactions
 
 
-def createObjectLoop():
+async def createObjectLoop():
     newObject: Object = {}
     while True:
-        typeEffect(f"""
+        await typeEffect(f"""
 {newObject}
 
 Choose an option:
@@ -76,41 +145,52 @@ Choose an option:
     (3) Open Interactions Editor
     (0) Save and add
 """, 0.01)
-        res = input(">")
-        if int(res) == 0:
-            objects.append(newObject)
+        res = await choose()
+        if res == 0:
+            world.objects.append(newObject)
             break
-        elif int(res) == 1:
-            newObject["name"] = input("What do you want to name your new object?   ")
-        elif int(res) == 2:
-            newObject["object_type"] = input("What is the type of your new object(Living or NonLiving)?   ")
-        elif int(res) == 3:
-            newObject["interactions"] = modifyInteractionsLoop()
-
-def presentAIOutput(ai_output: AIResponse):
-    typeEffect("The AI Moves toward " + ai_output["focusObject"] + "\n")
-    time.sleep(1)
-    for interaction in ai_output["interactions"]:
-        if interaction["extraData"]:
-            typeEffect(f"The AI chooses to use '{interaction['type']}' toward {interaction['with_']} and says {interaction['extraData']}\n")
-        else:
-            typeEffect(f"The AI chooses to {interaction['type']} with {interaction['with_']}\n")
-        time.sleep(1)
-    typeEffect("That is it.\n")
-    time.sleep(3)
-
-
-def createInteractionLoop():
+        elif res == 1:
+            newObject["name"] = await ainput("What do you want to name your new object?   ")
+        elif res == 2:
+            newObject["object_type"] = await ainput("What is the type of your new object(Living or NonLiving)?   ")
+        elif res == 3:
+            newObject["interactions"] = await modifyInteractionsLoop()
+
+async def presentAIOutput(ai_output: AIResponse):
+    for line in describe(ai_output):
+        await typeEffect(line + "\n")
+        await pause(1)
+    await typeEffect("That is it.\n")
+    await pause(3)
+
+
+async def createInteractionLoop():
     interaction = {}
-    interaction["from"] = input("What is the object interacting with the AI?   ")
-    interaction["type"] = input("What is the type of interaction?   ")
-    interaction["description"] = input("Describe the interaction with the AI?   ")
+    interaction["from"] = await ainput("What is the object interacting with the AI?   ")
+    interaction["type"] = await ainput("What is the type of interaction?   ")
+    interaction["description"] = await ainput("Describe the interaction with the AI?   ")
     return interaction
-while True:
-    typeEffect(f"""
-{objects}
 
-{interactions}
+async def sendToAI(observation):
+    """Runs in the background so the world can keep being edited while the AI thinks"""
+    try:
+        result = await ai.decide(observation)
+    except Exception as e:
+        await typeEffect(f"\nThe AI request failed: {e}\n")
+        return
+    await typeEffect("\n\n\n\n")
+    await typeEffect("Result: ")
+    await presentAIOutput(result)
+    await typeEffect(result)
+    await typeEffect("\n")
+
+async def main():
+    ai.warm_up()
+    while True:
+        await typeEffect(f"""
+{world.objects}
+
+{world.interactions}
 
 Choose an option:
     (1) Create New Object
@@ -119,22 +199,42 @@ Choose an option:
     (4) Send Input To AI
     (0) Exit
 """, 0.01)
-    res = input(">")
-    if int(res) == 0:
-        break
-    elif int(res) == 1:
-        createObjectLoop()
-    elif int(res) == 2:
-        for i, obj in enumerate(objects):
-            typeEffect(f"({i}) {obj}")
-        typeEffect("Deleted object: ", objects.pop(int(input("Object to delete>"))))
-    elif int(res) == 3:
-        interactions.append(createInteractionLoop())
-    elif int(res) == 4:
-        typeEffect("Sending input to AI...")
-        result = async_to_sync(transmitAndPost({"objects": objects, "interactionsWithYou": interactions}))
-        typeEffect("\n\n\n\n")
-        typeEffect("Result: ")
-        presentAIOutput(result)
-        typeEffect(result)
-        interactions = []
\ No newline at end of file
+        try:
+            res = await choose()
+            if res == 0:
+                break
+            elif res == 1:
+                await createObjectLoop()
+            elif res == 2:
+                for i, obj in enumerate(world.objects):
+                    await typeEffect(f"({i}) {obj}\n")
+                index = await choose("Object to delete>")
+                if 0 <= index < len(world.objects):
+                    await typeEffect(f"Deleted object: {world.objects.pop(index)}\n")
+            elif res == 3:
+                world.interactions.append(await createInteractionLoop())
+            elif res == 4:
+                await typeEffect("Sending input to AI...")
+                # Snapshot the world so later edits don't change what the AI was sent
+                observation = world.take_observation()
+                task = asyncio.create_task(sendToAI(observation))
+                ai_tasks.add(task)
+                task.add_done_callback(ai_tasks.discard)
+        except EndOfInput:
+            break
+    if ai_tasks:
+        await typeEffect("Waiting for the AI to finish...\n")
+        await asyncio.gather(*ai_tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="The fake world in the terminal")
+    parser.add_argument("--fast", action="store_true", help="print instantly without the typing effect or pauses")
+    parser.add_argument("--script", help="read the menu input from this file instead of the keyboard")
+    args = parser.parse_args()
+    fast = args.fast
+    lines = ScriptLines(args.script) if args.script else StdinLines()
+    try:
+        asyncio.run(main())
+    finally:
+        lines.close()
@@ -0,0 +1,188 @@
+"""The world model, AI session and action dispatch shared by all three front ends
+
+terminalWorld, guiWorld and pygameWorld only draw the world and collect input; the
+types, what the AI is sent, how it is asked and how its answer becomes text or actions
+live here. Importing this module is cheap: AIControl (which loads the AI client and
+briefs the model) is only imported when the session is first used or warmed up.
+"""
+from typing import Callable, Dict, List, Optional, TypedDict
+from actionTimeline import plan_actions
+import asyncio
+import threading
+
+
+class Object(TypedDict):
+    name: str
+    object_type: str
+    interactions: Dict[str, str]
+
+
+# "from" is a Python keyword, so this one needs the functional syntax
+Interaction = TypedDict("Interaction", {"from": str, "type": str, "description": str})
+
+
+class AIInteractionResponse(TypedDict):
+    with_: str  # Using with_ since 'with' is a Python keyword
+    type: str
+    extraData: Optional[str]
+
+
+class AIResponse(TypedDict):
+    focusObject: str
+    movementDirectionObject: str
+    interactions: List[AIInteractionResponse]
+
+
+class World:
+    """The objects the AI can see and the interactions waiting for its answer
+
+    Any list-like works for storage, so the Tk front ends pass ObservableLists to keep
+    their panels in sync.
+    """
+
+    def __init__(self, objects: Optional[list] = None, interactions: Optional[list] = None):
+        self.objects: List[Object] = objects if objects is not None else []
+        self.interactions: List[Interaction] = interactions if interactions is not None else []
+
+    def add_object(self, name: str, object_type: str, interactions: Dict[str, str]) -> Object:
+        obj: Object = {"name": name, "object_type": object_type, "interactions": dict(interactions)}
+        self.objects.append(obj)
+        return obj
+
+    def add_interaction(self, source: str, type: str, description: str) -> Interaction:
+        interaction: Interaction = {"from": source, "type": type, "description": description}
+        self.interactions.append(interaction)
+        return interaction
+
+    def observation(self, objects: Optional[list] = None) -> dict:
+        """What the AI is sent; pass objects to show it only some of the world"""
+        return {
+            "objects": [dict(obj) for obj in (self.objects if objects is None else objects)],
+            "interactionsWithYou": [dict(interaction) for interaction in self.interactions],
+        }
+
+    def take_observation(self, objects: Optional[list] = None) -> dict:
+        """The observation, handing the pending interactions over to the AI"""
+        observation = self.observation(objects)
+        self.interactions.clear()
+        return observation
+
+
+class AISession:
+    """Asks the AI for decisions, loading AIControl on first use
+
+    decide() is for code already running an event loop; decide_blocking() is for Tk
+    callbacks and runs every request on one private loop, so the client's connections
+    survive between decisions.
+    """
+
+    def __init__(self):
+        self._transmit: Optional[Callable] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _load(self):
+        with self._lock:
+            if self._transmit is None:
+                from AIControl import transmitAndPost
+                self._transmit = transmitAndPost
+        return self._transmit
+
+    def warm_up(self):
+        """Load and brief the AI on a background thread so the first decision doesn't wait for it"""
+        threading.Thread(target=self._load, name="ai-warm-up", daemon=True).start()
+
+    async def decide(self, observation: dict) -> AIResponse:
+        transmit = self._transmit
+        if transmit is None:
+            # AIControl waits for its briefing on import, which would hold up this loop
+            transmit = await asyncio.to_thread(self._load)
+        return await transmit(observation)
+
+    def decide_blocking(self, observation: dict) -> AIResponse:
+        transmit = self._load()
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(transmit(observation))
+
+
+def describe(result: AIResponse) -> List[str]:
+    """The AI's decision as sentences, one per step"""
+    lines = [f"The AI Moves toward {result['focusObject']}"]
+    for interaction in result["interactions"]:
+        if interaction.get("extraData"):
+            lines.append(f"The AI chooses to use '{interaction['type']}' toward {interaction['with_']} "
+                         f"and says {interaction['extraData']}")
+        else:
+            lines.append(f"The AI chooses to {interaction['type']} with {interaction['with_']}")
+    return lines
+
+
+def dispatch(result: AIResponse, resolve: Callable, log: Callable[[str], None], on_interact=None) -> list:
+    """Turn a decision into timeline actions, reporting names that had to be guessed or couldn't be found"""
+    resolved = {}
+
+    def lookup(name):
+        # Fuzzy matching is the slow part, so each name is resolved once
+        if name not in resolved:
+            resolved[name] = resolve(name)
+        return resolved[name]
+
+    def find_object(name):
+        # Exact, then case-insensitive, then fuzzy, so a slightly off name isn't thrown away
+        obj = lookup(name)
+        if obj is None:
+            log(f"Could not find '{name}' in the world")
+        elif obj.name != name:
+            log(f"Taking '{name}' to mean {obj.name}")
+        return obj
+
+    actions = plan_actions(result, find_object, on_interact)
+    if lookup(result["focusObject"]):
+        log(f"Moving toward {result['focusObject']}")
+    for interaction in result["interactions"]:
+        if lookup(interaction["with_"]):
+            if interaction.get("extraData"):
+                log(f"Speaking to {interaction['with_']}: {interaction['extraData']}")
+            log(f"Using '{interaction['type']}' with {interaction['with_']}")
+    return actions
+
+
+# What a fresh interpreter runs for each startup measurement
+STARTUP_SNIPPETS = {
+    "worldCore": "import worldCore",
+    "terminalWorld": "import terminalWorld",
+    "guiWorld": "import guiWorld",
+    "pygameWorld": "import pygameWorld",
+    # Importing, briefing the AI and getting its first decision
+    "first decision": "import worldCore; world = worldCore.World(); world.add_object('Bob', 'Living', {});"
+                      "worldCore.AISession().decide_blocking(world.observation())",
+}
+
+
+def benchmark_startup(snippets: Optional[Dict[str, str]] = None, runs: int = 5) -> Dict[str, float]:
+    """Median seconds for a fresh interpreter to run each snippet (with the mock AI backend)"""
+    import os
+    import statistics
+    import subprocess
+    import sys
+    import time
+
+    env = dict(os.environ, FAKEWORLD_BACKEND="mock")
+    results = {}
+    for name, code in (snippets or STARTUP_SNIPPETS).items():
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-c", code], env=env,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True)
+            if completed.returncode != 0:
+                break  # Missing GUI libraries or display
+            timings.append(time.perf_counter() - started)
+        results[name] = statistics.median(timings) if timings else float("nan")
+    return results
+
+
+if __name__ == "__main__":
+    for name, seconds in benchmark_startup().items():
+        print(f"{name:>14}: {seconds * 1000:7.1f} ms" if seconds == seconds else f"{name:>14}: unavailable")
@@ -0,0 +1,343 @@
+"""An append-only log of everything that happens to a world, with periodic snapshots
+
+Every change is recorded as a typed event:
+
+    ("session",     {"started": "YYYY-mm-ddTHH:MM:SS"})    a new run started appending to the log file;
+                                                           nothing before it carries over
+    ("reset",       {"interactions": [...]})              the world was emptied (a new world was loaded)
+    ("add",         {"objects": [record, ...]})            objects were added
+    ("remove",      {"ids": [id, ...]})                    objects were removed
+    ("edit",        {"id": id, "fields": {...}})           an object's name, type, look or interactions changed
+    ("move",        {"id": id, "x": x, "y": y})            an object was dragged somewhere else
+    ("interaction", {"interaction": {...}})                something interacted with the AI
+    ("uninteract",  {"index": i})                          a pending interaction was removed
+    ("decision",    {"result": AIResponse, "agent": [x, y]})  the AI decided; pending interactions are answered
+
+Records are plain dicts (name, object_type, x, y, color, shape, interactions) keyed by an
+id the log hands out. A snapshot of the state is kept every `snapshot_every` events (or
+every as many events as there are objects, if that is more), so the world at any point
+is rebuilt from the nearest snapshot by replaying the events after it.
+
+With max_events the log keeps only about that many recent events in memory (and the
+snapshots they need); older ones are dropped a snapshot interval at a time and are only
+in the log file, if there is one.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+import bisect
+import json
+import threading
+import time
+
+KINDS = ("session", "reset", "add", "remove", "edit", "move", "interaction", "uninteract", "decision")
+
+
+class EvictedError(LookupError):
+    """The event was dropped from memory to keep the log within max_events"""
+
+    def __init__(self, seq: int, first: int):
+        super().__init__(f"Event {seq} is no longer in memory (the oldest kept is {first}); "
+                         "the full history is only in the event log file")
+        self.seq = seq
+        self.first = first
+
+
+@dataclass
+class Event:
+    seq: int
+    time: float  # Seconds since the log started
+    kind: str
+    data: Dict[str, Any]
+
+
+@dataclass
+class WorldState:
+    objects: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    interactions: List[Dict[str, str]] = field(default_factory=list)
+    agent: Tuple[float, float] = (400, 300)
+    decisions: int = 0
+
+    def copy(self) -> "WorldState":
+        # Moves and edits change records in place, so each record is copied; the interactions dicts never are
+        return WorldState({object_id: dict(record) for object_id, record in self.objects.items()},
+                          list(self.interactions), self.agent, self.decisions)
+
+    def apply(self, event: Event):
+        data = event.data
+        kind = event.kind
+        if kind == "move":
+            record = self.objects[data["id"]]
+            record["x"], record["y"] = data["x"], data["y"]
+        elif kind == "add":
+            for record in data["objects"]:
+                record = dict(record)
+                self.objects[record.pop("id")] = record
+        elif kind == "remove":
+            for object_id in data["ids"]:
+                self.objects.pop(object_id, None)
+        elif kind == "edit":
+            self.objects[data["id"]].update(data["fields"])
+        elif kind == "interaction":
+            self.interactions.append(data["interaction"])
+        elif kind == "uninteract":
+            del self.interactions[data["index"]]
+        elif kind == "decision":
+            self.interactions = []
+            self.agent = tuple(data["agent"])
+            self.decisions += 1
+        elif kind == "reset":
+            self.objects = {}
+            self.interactions = list(data.get("interactions", []))
+        elif kind == "session":
+            # Ids and times start over in a new session, so nothing of the previous one may remain
+            self.objects = {}
+            self.interactions = []
+            self.agent = WorldState.agent
+            self.decisions = 0
+        else:
+            raise ValueError(f"Unknown event kind {kind!r}")
+
+    def observation(self) -> Dict[str, Any]:
+        """What the AI is sent in this state"""
+        return {
+            "objects": [{"name": record["name"], "object_type": record["object_type"],
+                         "interactions": record["interactions"]} for record in self.objects.values()],
+            "interactionsWithYou": list(self.interactions),
+        }
+
+    def stored_objects(self) -> List:
+        """The objects as worldStore.StoredObject, e.g. to index and render them"""
+        from worldStore import StoredObject
+        return [StoredObject(record["name"], record["object_type"], record["x"], record["y"],
+                             tuple(record["color"]), record["shape"], record["interactions"])
+                for record in self.objects.values()]
+
+
+def _record(obj) -> Dict[str, Any]:
+    return {
+        "name": obj.name,
+        "object_type": obj.object_type,
+        "x": obj.x,
+        "y": obj.y,
+        "color": list(obj.color),
+        "shape": obj.shape,
+        "interactions": dict(obj.interactions),
+    }
+
+
+class EventLog:
+    """Records events for live objects and answers questions about any point in the past
+
+    With a path, events are also appended to that file as JSON lines and can be read
+    back with EventLog.load. Each run appending to the file starts with a "session" event,
+    so several runs in one file read back one after the other rather than mixed together.
+    Sequence numbers keep counting when old events are dropped; asking for the state at a
+    dropped one raises EvictedError.
+    """
+
+    def __init__(self, path: Optional[str] = None, snapshot_every: int = 1000, max_events: Optional[int] = None):
+        self.snapshot_every = snapshot_every
+        self.max_events = max_events
+        self.events: List[Event] = []  # The events still in memory, starting at seq self.first
+        self.first = 0
+        self._count = 0
+        self.state = WorldState()
+        self._snapshots: List[WorldState] = [WorldState()]
+        self._snapshot_seqs: List[int] = [0]  # Events applied in each snapshot
+        self._ids: Dict[int, int] = {}  # id() of a live object -> its id in the log
+        self._next_id = 0
+        self._started = time.monotonic()
+        self._lock = threading.RLock()  # The Tk and pygame threads both record
+        self._file = open(path, "a") if path else None
+        if self._file is not None:
+            self.append("session", {"started": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    def __len__(self) -> int:
+        """Events recorded, including any no longer in memory"""
+        return self._count
+
+    def append(self, kind: str, data: Dict[str, Any], at: Optional[float] = None) -> Event:
+        with self._lock:
+            event = Event(self._count, time.monotonic() - self._started if at is None else at, kind, data)
+            self.state.apply(event)
+            self.events.append(event)
+            self._count += 1
+            if self._file is not None:
+                self._file.write(json.dumps([event.time, kind, data]) + "\n")
+            # Copying a snapshot costs as much as replaying one event per object, so big worlds
+            # snapshot less often; that keeps both memory and rebuild time proportional to the log
+            if self._count - self._snapshot_seqs[-1] >= max(self.snapshot_every, len(self.state.objects)):
+                self._snapshots.append(self.state.copy())
+                self._snapshot_seqs.append(self._count)
+                if self._file is not None:
+                    self._file.flush()
+                self._evict()
+            return event
+
+    def _evict(self):
+        """Drop the oldest snapshot and the events it covers while more than max_events are kept"""
+        if self.max_events is None:
+            return
+        dropped = 0
+        while len(self._snapshot_seqs) > 1 and self._count - self._snapshot_seqs[0] > self.max_events:
+            del self._snapshots[0]
+            del self._snapshot_seqs[0]
+            dropped = self._snapshot_seqs[0] - self.first
+        if dropped:
+            del self.events[:dropped]
+            self.first = self._snapshot_seqs[0]
+
+    def event(self, seq: int) -> Event:
+        with self._lock:
+            if not self.first <= seq < self._count:
+                raise EvictedError(seq, self.first) if 0 <= seq < self.first else IndexError(f"No event {seq}")
+            return self.events[seq - self.first]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Recording changes to live objects
+
+    def object_id(self, obj) -> Optional[int]:
+        return self._ids.get(id(obj))
+
+    def reset(self, interactions: List[Dict[str, str]] = ()):
+        self._ids.clear()
+        self.append("reset", {"interactions": [dict(interaction) for interaction in interactions]})
+
+    def add_objects(self, objects):
+        records = []
+        for obj in objects:
+            object_id = self._ids[id(obj)] = self._next_id
+            self._next_id += 1
+            record = _record(obj)
+            record["id"] = object_id
+            records.append(record)
+        if records:
+            self.append("add", {"objects": records})
+
+    def remove_objects(self, objects):
+        ids = [self._ids.pop(id(obj)) for obj in objects if id(obj) in self._ids]
+        if ids:
+            self.append("remove", {"ids": ids})
+
+    def edit_object(self, obj):
+        object_id = self._ids.get(id(obj))
+        if object_id is None:
+            return
+        record = _record(obj)
+        old = self.state.objects[object_id]
+        fields = {key: value for key, value in record.items() if key not in ("x", "y") and old.get(key) != value}
+        if fields:
+            self.append("edit", {"id": object_id, "fields": fields})
+
+    def move_object(self, obj):
+        object_id = self._ids.get(id(obj))
+        if object_id is not None:
+            self.append("move", {"id": object_id, "x": obj.x, "y": obj.y})
+
+    def add_interaction(self, interaction: Dict[str, str]):
+        self.append("interaction", {"interaction": dict(interaction)})
+
+    def remove_interaction(self, index: int):
+        self.append("uninteract", {"index": index})
+
+    def decision(self, result: Dict[str, Any], agent):
+        self.append("decision", {"result": result, "agent": [agent.x, agent.y]})
+
+    # Reading the past
+
+    def state_at(self, seq: int) -> WorldState:
+        """The world just after event seq (or before any event with seq -1)"""
+        with self._lock:
+            applied = max(0, min(seq + 1, self._count))
+            if applied < self.first:
+                raise EvictedError(seq, self.first)
+            index = bisect.bisect_right(self._snapshot_seqs, applied) - 1
+            state = self._snapshots[index].copy()
+            events = self.events[self._snapshot_seqs[index] - self.first:applied - self.first]
+        for event in events:
+            state.apply(event)
+        return state
+
+    def scan(self, kinds=None, start: int = 0, stop: Optional[int] = None) -> Iterator[Event]:
+        """Events from start up to stop (of those still in memory), optionally only of some kinds"""
+        kinds = set(kinds) if kinds is not None else None
+        first = self.first
+        for event in self.events[max(0, start - first):None if stop is None else max(0, stop - first)]:
+            if kinds is None or event.kind in kinds:
+                yield event
+
+    def decisions(self) -> Iterator[Tuple[Event, WorldState]]:
+        """Each decision with the world as the AI saw it, in one pass over the log
+
+        The state is the one just before the decision (so it still holds the interactions
+        being answered) and is only valid until the iterator moves on. Only the decisions
+        still in memory are included.
+        """
+        with self._lock:
+            state = self._snapshots[0].copy()
+            events = list(self.events)
+        for event in events:
+            if event.kind == "decision":
+                yield event, state
+            state.apply(event)
+
+    def decision_seqs(self) -> List[int]:
+        return [event.seq for event in self.events if event.kind == "decision"]
+
+    @classmethod
+    def load(cls, path: str, snapshot_every: int = 1000) -> "EventLog":
+        log = cls(snapshot_every=snapshot_every)
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    at, kind, data = json.loads(line)
+                    log.append(kind, data, at)
+        for event in log.scan(("add",)):
+            log._next_id = max(log._next_id, max(record["id"] for record in event.data["objects"]) + 1)
+        return log
+
+
+def benchmark(objects: int = 10_000, events: int = 100_000, lookups: int = 200) -> Dict[str, float]:
+    """Time recording a long session, rebuilding past states and scanning the decisions"""
+    import random
+    from worldGenerator import WorldGenerator
+    from simulation import Agent
+
+    rng = random.Random(0)
+    world = WorldGenerator(seed=0).generate(objects)
+    agent = Agent()
+    log = EventLog()
+    results = {}
+
+    started = time.perf_counter()
+    log.reset()
+    log.add_objects(world)
+    for i in range(events):
+        if i % 20 == 0:
+            log.decision({"focusObject": world[i % objects].name, "movementDirectionObject": "", "interactions": []},
+                         agent)
+        else:
+            obj = world[rng.randrange(objects)]
+            obj.x += 1
+            log.move_object(obj)
+    results["record_us_per_event"] = (time.perf_counter() - started) * 1e6 / len(log)
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        log.state_at(rng.randrange(len(log)))
+    results["state_at_ms"] = (time.perf_counter() - started) * 1000 / lookups
+
+    started = time.perf_counter()
+    decisions = sum(1 for _ in log.decisions())
+    results["scan_decisions_s"] = time.perf_counter() - started
+    results["decisions"] = decisions
+    return results
+
+
+if __name__ == "__main__":
+    for name, value in benchmark().items():
+        print(f"{name:>20}: {value:.3f}")
@@ -0,0 +1,262 @@
+"""Indexed lookups over world objects: by name (exact, case-insensitive, fuzzy), by position and by type
+
+Objects only need `name`, `object_type`, `x` and `y` attributes. Name lookups are dict
+hits; fuzzy matching only compares against names that share a word with the query.
+Positions live in a uniform grid, so radius and nearest queries only visit nearby cells.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import difflib
+import heapq
+import math
+import re
+import threading
+
+_ARTICLES = {"the", "a", "an"}
+_WORD = re.compile(r"[^\W_]+")
+
+
+def normalize_name(name: str) -> str:
+    """Fold case, punctuation and leading articles so "The dog!" matches "Dog" """
+    words = _WORD.findall(name.casefold())
+    while len(words) > 1 and words[0] in _ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+class WorldIndex:
+    def __init__(self, objects: Iterable = (), cell_size: float = 64):
+        self.cell_size = cell_size
+        self._lock = threading.RLock()
+        self._by_name: Dict[str, List] = {}
+        self._by_folded: Dict[str, List] = {}
+        self._by_word: Dict[str, Set[str]] = {}
+        self._by_type: Dict[str, Dict[int, object]] = {}
+        self._grid: Dict[Tuple[int, int], List] = {}
+        self._cells: Dict[int, Tuple[int, int]] = {}
+        self._names: Dict[int, Tuple[str, str]] = {}
+        self._bounds: Optional[List[int]] = None  # min x, min y, max x, max y of occupied cells
+        self._fuzzy_cache: Dict[str, Optional[str]] = {}
+        for obj in objects:
+            self.add(obj)
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def add(self, obj):
+        with self._lock:
+            name = obj.name
+            folded = normalize_name(name)
+            self._by_name.setdefault(name, []).append(obj)
+            if folded not in self._by_folded:
+                for word in folded.split():
+                    self._by_word.setdefault(word, set()).add(folded)
+            self._by_folded.setdefault(folded, []).append(obj)
+            self._by_type.setdefault(obj.object_type, {})[id(obj)] = obj
+            self._place(obj, self._cell(obj.x, obj.y))
+            self._names[id(obj)] = (name, obj.object_type)
+            self._fuzzy_cache.clear()
+
+    def extend(self, objects: Iterable):
+        for obj in objects:
+            self.add(obj)
+
+    def remove(self, obj):
+        with self._lock:
+            cell = self._cells.pop(id(obj), None)
+            if cell is None:
+                return
+            # Use the name and type it was indexed under; they may have changed since
+            name, object_type = self._names.pop(id(obj))
+            folded = normalize_name(name)
+            _discard(self._by_name, name, obj)
+            if not _discard(self._by_folded, folded, obj):
+                for word in folded.split():
+                    words = self._by_word.get(word)
+                    if words is not None:
+                        words.discard(folded)
+                        if not words:
+                            del self._by_word[word]
+            objects = self._by_type[object_type]
+            del objects[id(obj)]
+            if not objects:
+                del self._by_type[object_type]
+            _discard(self._grid, cell, obj)
+            self._fuzzy_cache.clear()
+
+    def update(self, obj):
+        """Re-index an object after its name, type or position changed"""
+        with self._lock:
+            self.remove(obj)
+            self.add(obj)
+
+    def move(self, obj):
+        """Re-index an object after its position changed; cheaper than update()"""
+        with self._lock:
+            old_cell = self._cells.get(id(obj))
+            if old_cell is None:
+                return
+            cell = self._cell(obj.x, obj.y)
+            if cell != old_cell:
+                _discard(self._grid, old_cell, obj)
+                self._place(obj, cell)
+
+    def _place(self, obj, cell: Tuple[int, int]):
+        self._grid.setdefault(cell, []).append(obj)
+        self._cells[id(obj)] = cell
+        # Bounds only ever grow; they just limit how far nearest() searches
+        if self._bounds is None:
+            self._bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            bounds = self._bounds
+            bounds[0] = min(bounds[0], cell[0])
+            bounds[1] = min(bounds[1], cell[1])
+            bounds[2] = max(bounds[2], cell[0])
+            bounds[3] = max(bounds[3], cell[1])
+
+    def rebuild(self, objects: Iterable):
+        with self._lock:
+            self.__init__(objects, self.cell_size)
+
+    # Name queries
+
+    def exact(self, name: str):
+        objects = self._by_name.get(name)
+        return objects[0] if objects else None
+
+    def casefold(self, name: str):
+        objects = self._by_folded.get(normalize_name(name))
+        return objects[0] if objects else None
+
+    def fuzzy(self, name: str, cutoff: float = 0.6):
+        folded = normalize_name(name)
+        with self._lock:
+            if folded in self._fuzzy_cache:
+                match = self._fuzzy_cache[folded]
+            else:
+                # Only compare against names sharing a word with the query, unless none do
+                candidates: Set[str] = set()
+                for word in folded.split():
+                    candidates |= self._by_word.get(word, set())
+                if not candidates and len(self._by_folded) <= 5000:
+                    candidates = set(self._by_folded)
+                matches = difflib.get_close_matches(folded, candidates, n=1, cutoff=cutoff)
+                match = matches[0] if matches else None
+                self._fuzzy_cache[folded] = match
+            objects = self._by_folded.get(match) if match is not None else None
+            return objects[0] if objects else None
+
+    def resolve(self, name: Optional[str], fuzzy: bool = True):
+        """Find the object a name refers to, trying exact, case-insensitive, then fuzzy matching"""
+        if not name:
+            return None
+        obj = self.exact(name)
+        if obj is None:
+            obj = self.casefold(name)
+        if obj is None and fuzzy:
+            obj = self.fuzzy(name)
+        return obj
+
+    # Spatial and type queries
+
+    def by_type(self, object_type: str) -> List:
+        return list(self._by_type.get(object_type, {}).values())
+
+    def within_radius(self, x: float, y: float, radius: float) -> List:
+        """Objects within radius of (x, y), nearest first"""
+        with self._lock:
+            min_cell = self._cell(x - radius, y - radius)
+            max_cell = self._cell(x + radius, y + radius)
+            found = []
+            radius_squared = radius * radius
+            for cx in range(min_cell[0], max_cell[0] + 1):
+                for cy in range(min_cell[1], max_cell[1] + 1):
+                    for obj in self._grid.get((cx, cy), ()):
+                        distance = (obj.x - x) ** 2 + (obj.y - y) ** 2
+                        if distance <= radius_squared:
+                            found.append((distance, obj))
+        found.sort(key=lambda item: item[0])
+        return [obj for _, obj in found]
+
+    def within_rect(self, left: float, top: float, right: float, bottom: float) -> List:
+        """Objects whose position lies inside the rectangle, in no particular order"""
+        with self._lock:
+            min_x, min_y = self._cell(left, top)
+            max_x, max_y = self._cell(right, bottom)
+            found = []
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self._grid):
+                # The rectangle spans more cells than are occupied, so walk the occupied ones
+                cells = [(cell, objects) for cell, objects in self._grid.items()
+                         if min_x <= cell[0] <= max_x and min_y <= cell[1] <= max_y]
+            else:
+                cells = [((cx, cy), self._grid[(cx, cy)])
+                         for cx in range(min_x, max_x + 1)
+                         for cy in range(min_y, max_y + 1)
+                         if (cx, cy) in self._grid]
+            for (cx, cy), objects in cells:
+                if min_x < cx < max_x and min_y < cy < max_y:
+                    # Cells fully inside the rectangle need no per object test
+                    found.extend(objects)
+                else:
+                    found.extend(obj for obj in objects
+                                 if left <= obj.x <= right and top <= obj.y <= bottom)
+        return found
+
+    def nearest(self, x: float, y: float, k: int = 1, object_type: Optional[str] = None) -> List:
+        """The k nearest objects to (x, y), optionally of one type, nearest first"""
+        with self._lock:
+            if not self._grid:
+                return []
+            center_x, center_y = self._cell(x, y)
+            best: List[Tuple[float, int, object]] = []  # Max-heap of (-distance, tiebreak, obj)
+            ring = 0
+            max_ring = self._max_ring(center_x, center_y)
+            while ring <= max_ring:
+                for cell in _ring_cells(center_x, center_y, ring):
+                    for obj in self._grid.get(cell, ()):
+                        if object_type is not None and obj.object_type != object_type:
+                            continue
+                        distance = (obj.x - x) ** 2 + (obj.y - y) ** 2
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, id(obj), obj))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, id(obj), obj))
+                # Every cell beyond this ring is at least `ring` cells away
+                if len(best) == k and ring * self.cell_size >= math.sqrt(-best[0][0]):
+                    break
+                ring += 1
+        return [obj for _, _, obj in sorted(best, key=lambda item: -item[0])]
+
+    def _max_ring(self, center_x: int, center_y: int) -> int:
+        min_x, min_y, max_x, max_y = self._bounds
+        return max(abs(min_x - center_x), abs(max_x - center_x),
+                   abs(min_y - center_y), abs(max_y - center_y))
+
+
+def _discard(table: dict, key, obj) -> bool:
+    """Remove obj from table[key]; returns True if other objects remain under that key"""
+    objects = table.get(key)
+    if objects is None:
+        return False
+    for i, other in enumerate(objects):
+        if other is obj:
+            del objects[i]
+            break
+    if objects:
+        return True
+    del table[key]
+    return False
+
+
+def _ring_cells(center_x: int, center_y: int, ring: int):
+    if ring == 0:
+        yield center_x, center_y
+        return
+    for cx in range(center_x - ring, center_x + ring + 1):
+        yield cx, center_y - ring
+        yield cx, center_y + ring
+    for cy in range(center_y - ring + 1, center_y + ring):
+        yield center_x - ring, cy
+        yield center_x + ring, cy
@@ -0,0 +1,334 @@
+"""Camera based rendering of the world
+
+Objects live in world coordinates that never change when the window is resized. The
+Camera maps them to the screen with pan and zoom, the WorldIndex culls everything
+outside the view, and the visible objects are drawn from cached sprites in a single
+Surface.blits call.
+
+Level of detail keeps text, the most expensive thing in a frame, in check: labels are
+hidden when zoomed out and thinned out in crowded areas, and objects too small to see
+are drawn as single pixels or as cluster markers with a count.
+"""
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import math
+import pygame
+
+OBJECT_RADIUS = 15
+LABEL_COLOR = (255, 255, 255)
+MIN_ZOOM = 0.02
+MAX_ZOOM = 8.0
+
+
+@dataclass
+class LevelOfDetail:
+    enabled: bool = True
+    label_min_zoom: float = 0.6  # Below this zoom no labels are drawn
+    label_cell: int = 48  # At most one label per label_cell x label_cell screen pixels
+    point_radius: int = 3  # Objects smaller than this (in pixels) become points or clusters
+    cluster_cell: int = 16  # Points closer than this many pixels merge into a cluster marker
+    speech_width: int = 320  # Speech bubbles wrap at this many pixels
+
+
+class Camera:
+    """Maps world coordinates to the screen; (x, y) is the world point at the top left of the window"""
+
+    def __init__(self, width: int, height: int, x: float = 0, y: float = 0, zoom: float = 1.0):
+        self.width = width
+        self.height = height
+        self.x = x
+        self.y = y
+        self.zoom = zoom
+
+    def resize(self, width: int, height: int):
+        self.width = width
+        self.height = height
+
+    def world_to_screen(self, x: float, y: float) -> Tuple[float, float]:
+        return (x - self.x) * self.zoom, (y - self.y) * self.zoom
+
+    def screen_to_world(self, x: float, y: float) -> Tuple[float, float]:
+        return x / self.zoom + self.x, y / self.zoom + self.y
+
+    def pan(self, dx: float, dy: float):
+        """Move the view by a distance in screen pixels"""
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+
+    def zoom_at(self, screen_x: float, screen_y: float, factor: float):
+        """Zoom keeping the world point under (screen_x, screen_y) fixed"""
+        world_x, world_y = self.screen_to_world(screen_x, screen_y)
+        self.zoom = max(MIN_ZOOM, min(MAX_ZOOM, self.zoom * factor))
+        self.x = world_x - screen_x / self.zoom
+        self.y = world_y - screen_y / self.zoom
+
+    def center_on(self, x: float, y: float):
+        self.x = x - self.width / (2 * self.zoom)
+        self.y = y - self.height / (2 * self.zoom)
+
+    def visible_rect(self, margin: float = 0) -> Tuple[float, float, float, float]:
+        """The world rectangle (left, top, right, bottom) in view, grown by a margin in world units"""
+        return (self.x - margin,
+                self.y - margin,
+                self.x + self.width / self.zoom + margin,
+                self.y + self.height / self.zoom + margin)
+
+
+def shape_points(shape: str, x: float, y: float, radius: float) -> List[Tuple[float, float]]:
+    if shape == "triangle":
+        return [(x, y - radius), (x - radius, y + radius), (x + radius, y + radius)]
+    if shape == "pentagon":
+        return [(x + radius * math.cos(math.radians(i * 72 - 90)),
+                 y + radius * math.sin(math.radians(i * 72 - 90))) for i in range(5)]
+    return []
+
+
+class SpriteCache:
+    """Pre-rendered shapes and labels so a frame is only blits"""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._shapes: Dict[tuple, pygame.Surface] = {}
+        self._labels: Dict[str, pygame.Surface] = {}
+        self._counts: Dict[int, pygame.Surface] = {}
+        self._speech: Tuple[str, Optional[pygame.Surface]] = ("", None)  # Last utterance and its bubble
+        self._font: Optional[pygame.font.Font] = None
+        self._small_font: Optional[pygame.font.Font] = None
+
+    def shape(self, shape: str, color: tuple, radius: int) -> pygame.Surface:
+        key = (shape, color, radius)
+        surface = self._shapes.get(key)
+        if surface is None:
+            if len(self._shapes) >= self.max_entries:
+                self._shapes.clear()
+            size = radius * 2 + 1
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            if shape == "square":
+                pygame.draw.rect(surface, color, pygame.Rect(0, 0, size, size))
+            elif shape in ("triangle", "pentagon"):
+                pygame.draw.polygon(surface, color, shape_points(shape, radius, radius, radius))
+            else:  # Default to circle
+                pygame.draw.circle(surface, color, (radius, radius), radius)
+            self._shapes[key] = surface
+        return surface
+
+    def label(self, text: str) -> pygame.Surface:
+        surface = self._labels.get(text)
+        if surface is None:
+            if len(self._labels) >= self.max_entries:
+                self._labels.clear()
+            if self._font is None:
+                self._font = pygame.font.Font(None, 24)
+            surface = self._labels[text] = self._font.render(text, True, LABEL_COLOR)
+        return surface
+
+    def cluster(self, count: int) -> pygame.Surface:
+        """A marker standing in for `count` objects too small to draw one by one"""
+        # Bucket big counts so the cache stays small
+        shown = count if count < 100 else (count // 100) * 100
+        surface = self._counts.get(shown)
+        if surface is None:
+            if self._small_font is None:
+                self._small_font = pygame.font.Font(None, 16)
+            text = self._small_font.render(str(shown) if count < 100 else f"{shown}+", True, LABEL_COLOR)
+            radius = max(text.get_width(), text.get_height()) // 2 + 3
+            surface = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(surface, (90, 90, 140, 220), (radius, radius), radius)
+            surface.blit(text, (radius - text.get_width() // 2, radius - text.get_height() // 2))
+            self._counts[shown] = surface
+        return surface
+
+
+    def speech(self, text: str, width: int) -> pygame.Surface:
+        """The speech bubble for text; only rendered again when the text changes"""
+        cached_text, bubble = self._speech
+        if bubble is None or cached_text != text:
+            if self._font is None:
+                self._font = pygame.font.Font(None, 24)
+            bubble = render_wrapped(self._font, text, width)
+            self._speech = (text, bubble)
+        return bubble
+
+
+def render_wrapped(font: pygame.font.Font, text: str, width: int,
+                   color: tuple = LABEL_COLOR, background: tuple = (0, 0, 0)) -> pygame.Surface:
+    """Render text wrapped at word boundaries to fit width pixels, on a padded background"""
+    lines: List[str] = []
+    line = ""
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if line and font.size(candidate)[0] > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    lines.append(line)
+
+    rendered = [font.render(line, True, color) for line in lines]
+    line_height = font.get_linesize()
+    surface = pygame.Surface((max(r.get_width() for r in rendered) + 10, line_height * len(rendered) + 10))
+    surface.fill(background)
+    for i, r in enumerate(rendered):
+        surface.blit(r, (5, 5 + i * line_height))
+    return surface
+
+
+def draw_agent(screen: pygame.Surface, agent, sprites: SpriteCache, camera: Optional[Camera] = None,
+               speech_width: int = LevelOfDetail.speech_width):
+    """Draw the AI as a blue pentagon with its speech bubble above it"""
+    # Place the AI on screen through the camera when there is one
+    if camera is not None:
+        x, y = camera.world_to_screen(agent.x, agent.y)
+        radius = max(2, 20 * camera.zoom)
+    else:
+        x, y = agent.x, agent.y
+        radius = 20
+    pygame.draw.polygon(screen, (0, 128, 255), shape_points("pentagon", x, y, radius))
+
+    if agent.text_timer > 0:
+        bubble = sprites.speech(agent.current_text, speech_width)
+        screen.blit(bubble, (x - bubble.get_width() // 2, y - radius - 10 - bubble.get_height()))
+
+
+class WorldRenderer:
+    def __init__(self, lod: Optional[LevelOfDetail] = None):
+        self.lod = lod or LevelOfDetail()
+        self.sprites = SpriteCache()
+        self.visible_count = 0
+        self.labels_drawn = 0
+
+    def draw(self, screen: pygame.Surface, camera: Camera, index, agent=None):
+        """Draw the objects in view, then the agent"""
+        zoom = camera.zoom
+        lod = self.lod
+        radius = max(1, int(round(OBJECT_RADIUS * zoom)))
+        # Grow the culling rectangle so objects and labels poking into the view aren't cut off
+        visible = index.within_rect(*camera.visible_rect(margin=OBJECT_RADIUS + 40 / zoom))
+        self.visible_count = len(visible)
+
+        if lod.enabled and radius < lod.point_radius:
+            self._draw_points(screen, camera, visible)
+        else:
+            self._draw_sprites(screen, camera, visible, radius,
+                               show_labels=not lod.enabled or zoom >= lod.label_min_zoom)
+
+        if agent is not None:
+            draw_agent(screen, agent, self.sprites, camera, lod.speech_width)
+
+    def _draw_sprites(self, screen, camera: Camera, visible, radius: int, show_labels: bool):
+        blits = []
+        shape_sprite = self.sprites.shape
+        label_sprite = self.sprites.label
+        declutter = self.lod.enabled
+        label_cell = self.lod.label_cell
+        taken = set()  # Screen cells that already have a label
+        camera_x, camera_y, zoom = camera.x, camera.y, camera.zoom
+        for obj in visible:
+            screen_x = (obj.x - camera_x) * zoom
+            screen_y = (obj.y - camera_y) * zoom
+            blits.append((shape_sprite(obj.shape, obj.color, radius), (screen_x - radius, screen_y - radius)))
+            if show_labels:
+                if declutter:
+                    cell = (int(screen_x // label_cell), int(screen_y // label_cell))
+                    if cell in taken:
+                        continue
+                    taken.add(cell)
+                label = label_sprite(obj.name)
+                blits.append((label, (screen_x - label.get_width() // 2, screen_y - radius - 15)))
+        self.labels_drawn = len(taken) if declutter else (len(visible) if show_labels else 0)
+        screen.blits(blits, False)
+
+    def _draw_points(self, screen, camera: Camera, visible):
+        # Bin objects into screen cells; lone objects become a pixel, crowded cells a marker
+        cell_size = self.lod.cluster_cell
+        cells: Dict[Tuple[int, int], list] = {}
+        camera_x, camera_y, zoom = camera.x, camera.y, camera.zoom
+        for obj in visible:
+            screen_x = (obj.x - camera_x) * zoom
+            screen_y = (obj.y - camera_y) * zoom
+            key = (int(screen_x // cell_size), int(screen_y // cell_size))
+            entry = cells.get(key)
+            if entry is None:
+                cells[key] = [1, screen_x, screen_y, obj.color]
+            else:
+                entry[0] += 1
+
+        blits = []
+        for count, screen_x, screen_y, color in cells.values():
+            if count == 1:
+                screen.fill(color, (int(screen_x), int(screen_y), 2, 2))
+            else:
+                marker = self.sprites.cluster(count)
+                blits.append((marker, (screen_x - marker.get_width() // 2, screen_y - marker.get_height() // 2)))
+        self.labels_drawn = len(blits)
+        screen.blits(blits, False)
+
+
+def benchmark_lod(frames: int = 60) -> Dict[str, Dict[str, float]]:
+    """Frame time in ms for a few scenes with level of detail on and off"""
+    import os
+    import time
+    from worldGenerator import WorldGenerator
+    from worldQuery import WorldIndex
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    screen = pygame.Surface((800, 600))
+    scenes = {
+        # name: (objects, world side, zoom)
+        "normal view": (200, 800, 1.0),
+        "dense cluster": (5_000, 800, 1.0),
+        "zoomed out": (50_000, 8_000, 0.1),
+    }
+    results = {}
+    for name, (count, side, zoom) in scenes.items():
+        index = WorldIndex(WorldGenerator(seed=count, width=side, height=side).generate(count))
+        camera = Camera(800, 600, zoom=zoom)
+        camera.center_on(side / 2, side / 2)
+        results[name] = {}
+        for label, lod in (("lod", LevelOfDetail()), ("no lod", LevelOfDetail(enabled=False))):
+            renderer = WorldRenderer(lod)
+            renderer.draw(screen, camera, index)  # Warm the sprite cache
+            started = time.perf_counter()
+            for _ in range(frames):
+                screen.fill((32, 32, 32))
+                renderer.draw(screen, camera, index)
+            results[name][label] = (time.perf_counter() - started) * 1000 / frames
+    pygame.quit()
+    return results
+
+
+def benchmark(sizes=(1_000, 10_000, 100_000), frames: int = 120) -> Dict[int, float]:
+    """Average frame time in ms with a fixed 800x600 view as the world grows around it"""
+    import os
+    import time
+    from worldGenerator import WorldGenerator
+    from worldQuery import WorldIndex
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    screen = pygame.Surface((800, 600))
+    results = {}
+    for size in sizes:
+        # Keep the density constant so the view always holds about the same number of objects
+        side = 800 * math.sqrt(size / 1_000)
+        objects = WorldGenerator(seed=size, width=side, height=side).generate(size)
+        index = WorldIndex(objects)
+        camera = Camera(800, 600)
+        camera.center_on(side / 2, side / 2)
+        renderer = WorldRenderer()
+        renderer.draw(screen, camera, index)  # Warm the sprite cache
+        started = time.perf_counter()
+        for _ in range(frames):
+            screen.fill((32, 32, 32))
+            renderer.draw(screen, camera, index)
+        results[size] = (time.perf_counter() - started) * 1000 / frames
+    pygame.quit()
+    return results
+
+
+if __name__ == "__main__":
+    for size, ms in benchmark().items():
+        print(f"{size:>7} objects: {ms:6.2f} ms/frame")
+    for scene, timings in benchmark_lod().items():
+        print(f"{scene:>14}: " + "  ".join(f"{label} {ms:6.2f} ms/frame" for label, ms in timings.items()))
@@ -0,0 +1,511 @@
+"""Run a simulation as a local server that any number of viewers can watch and poke
+
+The server owns the world and the AI agent and steps them at a fixed frame rate whether
+or not anyone is watching. Viewers connect over a Unix socket ("unix:/tmp/world.sock")
+or localhost TCP ("127.0.0.1:8765") and receive newline delimited JSON:
+
+    {"type": "snapshot", "frame": n, "objects": [[id, name, type, x, y, color, shape, interactions], ...],
+     "agent": [x, y, text], "decision": AIResponse or null}
+    {"type": "delta", "frame": n, "t": server time, "moved": [[id, x, y], ...],
+     "agent": [x, y, text], "decision": AIResponse}
+
+A snapshot comes first; after that each broadcast only carries what changed since the
+previous one (objects that moved, the agent if it moved or spoke, a new decision), and
+frames where nothing changed aren't sent at all. Every frame is encoded once and the same
+bytes go to every viewer.
+
+Each viewer has a short queue of frames. A viewer that falls further behind than that
+doesn't slow the simulation or the other viewers down: its queue is dropped and it is
+sent a fresh snapshot once it catches up.
+
+Viewers can send {"type": "interaction", "interaction": {...}} to interact with the AI
+and {"type": "move", "id": id, "x": x, "y": y} to drag an object somewhere else.
+"""
+from typing import Any, Dict, List, Optional, Set
+from dataclasses import dataclass
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+
+from actionTimeline import FPS
+from fallbackPolicy import PendingDecision, load_policy
+from simulation import Agent, Simulation
+from worldQuery import WorldIndex
+from worldStore import StoredObject
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+SEND_BUFFER = 64 * 1024
+
+_RESYNC = object()  # Queued instead of frames when a viewer has to start over from a snapshot
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def _agent_state(agent) -> list:
+    # A tenth of a pixel is plenty for drawing and keeps the frames short
+    return [round(agent.x, 1), round(agent.y, 1), agent.current_text if agent.text_timer > 0 else ""]
+
+
+async def open_server(address: str, handler) -> asyncio.AbstractServer:
+    if address.startswith("unix:"):
+        return await asyncio.start_unix_server(handler, address[len("unix:"):])
+    host, port = address.rsplit(":", 1)
+    return await asyncio.start_server(handler, host, int(port))
+
+
+async def open_connection(address: str, limit: int = 2 ** 24):
+    # The default 64 KiB line limit is smaller than a snapshot of a big world
+    if address.startswith("unix:"):
+        return await asyncio.open_unix_connection(address[len("unix:"):], limit=limit)
+    host, port = address.rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port), limit=limit)
+
+
+@dataclass
+class ServerConfig:
+    broadcast_hz: float = 20  # Frames sent to viewers per simulated second
+    realtime: bool = True  # Step at FPS frames per second; otherwise as fast as possible
+    queue_frames: int = 8  # How far a viewer may fall behind before it is resynced
+    policy: str = "local"  # "local" decides with the mock rules, "model" asks the AI
+    seed: int = 0
+    # With the "model" policy: "rules" or a lookup table (see fallbackPolicy) that answers when the AI
+    # hasn't within `deadline` seconds; its plan is preempted if the AI's answer differs
+    fallback: Optional[str] = None
+    deadline: float = 0.25
+
+
+class Viewer:
+    def __init__(self, writer: asyncio.StreamWriter, queue_frames: int):
+        self.writer = writer
+        self.queue: asyncio.Queue = asyncio.Queue(queue_frames)
+        self.resyncs = 0
+        self.bytes_sent = 0
+
+    def resync(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_RESYNC)
+        self.resyncs += 1
+
+
+class WorldServer:
+    def __init__(self, simulation: Simulation, config: Optional[ServerConfig] = None):
+        self.simulation = simulation
+        self.config = config or ServerConfig()
+        self.objects: Dict[int, Any] = dict(enumerate(simulation.objects))
+        self.viewers: Set[Viewer] = set()
+        self.decision: Optional[Dict[str, Any]] = None
+        self._moved: Set[int] = set()
+        self._new_decision = False
+        self._agent_sent: Optional[list] = None
+        self._snapshot: Optional[bytes] = None  # Cached until the world changes
+        self._deciding: Optional[PendingDecision] = None
+        self._fallback = None
+        if self.config.fallback:
+            agent = simulation.agent
+            self._fallback = load_policy(self.config.fallback, simulation.index, lambda: (agent.x, agent.y))
+        self._ai = None
+        self._rng = random.Random(self.config.seed)
+        self._living = [obj.name for obj in simulation.objects if obj.object_type == "Living"]
+        self.running = False
+        self.stats = {"frames": 0, "broadcasts": 0, "bytes_encoded": 0, "decisions": 0, "late_frames": 0,
+                      # Frames the agent stood still waiting for the AI, and how the fallback policy got on
+                      "waiting_frames": 0, "fallbacks": 0, "preempted": 0, "late_agreed": 0, "model_failures": 0}
+
+    # What viewers are sent
+
+    def snapshot(self) -> bytes:
+        if self._snapshot is None:
+            self._snapshot = _encode({
+                "type": "snapshot",
+                "frame": self.simulation.frame,
+                "objects": [[object_id, obj.name, obj.object_type, obj.x, obj.y, list(obj.color), obj.shape,
+                             obj.interactions] for object_id, obj in self.objects.items()],
+                "agent": _agent_state(self.simulation.agent),
+                "decision": self.decision,
+            })
+        return self._snapshot
+
+    def delta(self) -> Optional[bytes]:
+        """What changed since the last delta, or None if nothing did"""
+        message: Dict[str, Any] = {"type": "delta", "frame": self.simulation.frame, "t": time.monotonic()}
+        if self._moved:
+            message["moved"] = [[object_id, self.objects[object_id].x, self.objects[object_id].y]
+                                for object_id in self._moved]
+            self._moved = set()
+        agent = _agent_state(self.simulation.agent)
+        if agent != self._agent_sent:
+            message["agent"] = self._agent_sent = agent
+            self._snapshot = None
+        if self._new_decision:
+            message["decision"] = self.decision
+            self._new_decision = False
+        return _encode(message) if len(message) > 3 else None
+
+    def broadcast(self):
+        data = self.delta()
+        if data is None:
+            return
+        self.stats["broadcasts"] += 1
+        self.stats["bytes_encoded"] += len(data)
+        for viewer in self.viewers:
+            if viewer.queue.full():
+                viewer.resync()
+            else:
+                viewer.queue.put_nowait(data)
+
+    # Changes from viewers
+
+    def move_object(self, object_id: int, x: float, y: float):
+        obj = self.objects.get(object_id)
+        if obj is None:
+            return
+        obj.x, obj.y = x, y
+        self.simulation.index.move(obj)
+        self._moved.add(object_id)
+        self._snapshot = None
+
+    def add_interaction(self, interaction: Dict[str, str]):
+        self.simulation.interactions.append({key: str(interaction.get(key, ""))
+                                             for key in ("from", "type", "description")})
+
+    def _command(self, message: Dict[str, Any]):
+        if message.get("type") == "move":
+            self.move_object(int(message["id"]), float(message["x"]), float(message["y"]))
+        elif message.get("type") == "interaction":
+            self.add_interaction(message["interaction"])
+
+    # Connections
+
+    async def _serve_viewer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            # Keep the kernel from buffering megabytes for a stalled viewer, so its queue fills instead
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        viewer = Viewer(writer, self.config.queue_frames)
+        viewer.queue.put_nowait(_RESYNC)
+        self.viewers.add(viewer)
+        sender = asyncio.create_task(self._send(viewer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    self._command(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    pass  # A bad command from one viewer shouldn't disturb the world
+        except ConnectionError:
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            sender.cancel()
+            writer.close()
+
+    async def _send(self, viewer: Viewer):
+        try:
+            while True:
+                data = await viewer.queue.get()
+                if data is _RESYNC:
+                    data = self.snapshot()
+                viewer.writer.write(data)
+                viewer.bytes_sent += len(data)
+                # Waits while the socket buffer is full, which is what fills the viewer's queue
+                await viewer.writer.drain()
+        except ConnectionError:
+            pass
+
+    # The simulation
+
+    async def _decide(self, observation: Dict[str, Any]):
+        if self._ai is None:
+            from worldCore import AISession
+            self._ai = AISession()
+        return await self._ai.decide(observation)
+
+    def _apply(self, result: Dict[str, Any]):
+        self.simulation.apply(result)
+        self.decision = result
+        self._new_decision = True
+        self._snapshot = None
+        self.stats["decisions"] += 1
+        # Someone in the world reacts so the next decision has something new to answer
+        if self._living and not self.simulation.interactions:
+            self.simulation.interactions = [{
+                "from": self._rng.choice(self._living),
+                "type": "talk",
+                "description": "They say hello to you"
+            }]
+
+    def step(self):
+        simulation = self.simulation
+        if simulation.idle and self._deciding is None:
+            observation = simulation.observation()
+            if self.config.policy == "model":
+                # The world keeps running while the AI thinks
+                self._deciding = PendingDecision(asyncio.create_task(self._decide(observation)), observation,
+                                                 self._fallback, self.config.deadline, self.stats)
+            else:
+                from mockModel import decide
+                self._apply(decide(observation))
+        if self._deciding is not None:
+            result = self._deciding.poll()
+            if result is not None:
+                self._apply(result)
+            if self._deciding.finished:
+                self._deciding = None
+            elif simulation.idle:
+                self.stats["waiting_frames"] += 1
+        simulation.step()
+        self.stats["frames"] += 1
+
+    async def run(self, frames: Optional[int] = None):
+        """Step the world until stopped (or for a number of frames), broadcasting as it goes"""
+        loop = asyncio.get_running_loop()
+        stride = max(1, round(FPS / self.config.broadcast_hz))
+        next_frame = loop.time()
+        self.running = True
+        while self.running and (frames is None or self.stats["frames"] < frames):
+            self.step()
+            if self.simulation.frame % stride == 0:
+                self.broadcast()
+                if not self.config.realtime:
+                    await asyncio.sleep(0)  # Let the viewers' writers run
+            if self.config.realtime:
+                next_frame += 1 / FPS
+                delay = next_frame - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.stats["late_frames"] += 1
+                    if delay < -0.25:
+                        next_frame = loop.time()  # Too far behind to catch up, don't try
+
+    async def serve(self, address: str = DEFAULT_ADDRESS, frames: Optional[int] = None):
+        server = await open_server(address, self._serve_viewer)
+        async with server:
+            try:
+                await self.run(frames)
+            finally:
+                self.disconnect()
+                await asyncio.sleep(0)  # Let the viewers' handlers see the connections close
+
+    def disconnect(self, abort: bool = False):
+        """Hang up on every viewer; abort drops what is still buffered for them"""
+        for viewer in self.viewers:
+            if abort:
+                viewer.writer.transport.abort()
+            else:
+                viewer.writer.close()
+
+
+class WorldClient:
+    """A viewer's copy of the served world, kept up to date from the server's frames
+
+    apply() holds the lock, so a render thread can hold it while it draws the index.
+    """
+
+    def __init__(self):
+        self.objects: Dict[int, StoredObject] = {}
+        self.index = WorldIndex()
+        self.agent = Agent()
+        self.frame = -1
+        self.decision: Optional[Dict[str, Any]] = None
+        self.decisions = 0
+        self.frames_received = 0
+        self.snapshots = 0
+        self.latencies: List[float] = []  # Seconds from broadcast to arrival, for benchmarks
+        self.lock = threading.Lock()
+        self._ids: Dict[int, int] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    def apply(self, message: Dict[str, Any]):
+        with self.lock:
+            if message["type"] == "snapshot":
+                self.objects = {object_id: StoredObject(name, object_type, x, y, tuple(color), shape, interactions)
+                                for object_id, name, object_type, x, y, color, shape, interactions
+                                in message["objects"]}
+                self.index = WorldIndex(self.objects.values())
+                self._ids = {id(obj): object_id for object_id, obj in self.objects.items()}
+                self.snapshots += 1
+            elif message["frame"] <= self.frame:
+                return  # Already part of the snapshot that replaced it
+            for object_id, x, y in message.get("moved", ()):
+                obj = self.objects.get(object_id)
+                if obj is not None:
+                    obj.x, obj.y = x, y
+                    self.index.move(obj)
+            if message.get("agent") is not None:
+                self.agent.x, self.agent.y, text = message["agent"]
+                self.agent.current_text = text
+                self.agent.text_timer = 1 if text else 0
+            if message.get("decision") is not None:
+                self.decision = message["decision"]
+                self.decisions += 1
+            self.frame = message["frame"]
+            self.frames_received += 1
+
+    async def run(self, address: str = DEFAULT_ADDRESS, record_latency: bool = False):
+        """Follow the server until it goes away"""
+        reader, self._writer = await open_connection(address)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if record_latency and "t" in message:
+                    self.latencies.append(time.monotonic() - message["t"])
+                self.apply(message)
+        finally:
+            self._writer.close()
+            self._writer = None
+
+    def send(self, message: Dict[str, Any]):
+        """Send a command; call from the loop running run()"""
+        if self._writer is not None:
+            self._writer.write(_encode(message))
+
+    def move_object(self, obj, x: float, y: float):
+        object_id = self._ids.get(id(obj))
+        if object_id is not None:
+            self.send({"type": "move", "id": object_id, "x": x, "y": y})
+
+
+def _run_viewers(address: str, count: int, slow: int, ready, results):
+    """Benchmark helper run in its own process: follow the server with count viewers"""
+
+    async def slow_viewer(finished: asyncio.Event):
+        # Reads a little at a time, as a viewer on a struggling machine would
+        reader, writer = await open_connection(address, limit=4096)
+        writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+        received = 0
+        try:
+            while not finished.is_set():
+                data = await reader.read(4096)
+                if not data:
+                    break
+                received += len(data)
+                await asyncio.sleep(0.2)
+        except ConnectionError:
+            pass
+        writer.close()
+        return received
+
+    async def main():
+        clients = [WorldClient() for _ in range(count)]
+        finished = asyncio.Event()
+        slow_tasks = [asyncio.create_task(slow_viewer(finished)) for _ in range(slow)]
+
+        async def wait_for_snapshots():
+            while not all(client.snapshots for client in clients):
+                await asyncio.sleep(0.01)
+            ready.set()
+
+        # Everyone follows the server until it hangs up
+        await asyncio.gather(wait_for_snapshots(), *(client.run(address, record_latency=True) for client in clients),
+                             return_exceptions=True)
+        finished.set()
+        slow_bytes = await asyncio.gather(*slow_tasks)
+        latencies = sorted(latency for client in clients for latency in client.latencies)
+        results.put({
+            "frames_per_viewer": sum(client.frames_received for client in clients) / count,
+            "snapshots_per_viewer": sum(client.snapshots for client in clients) / count,
+            "latency_ms_mean": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_ms_p95": 1000 * latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            "slow_viewer_bytes": sum(slow_bytes),
+        })
+
+    asyncio.run(main())
+
+
+def benchmark_fanout(viewers: int = 50, objects: int = 2000, seconds: float = 5.0, slow: int = 1,
+                     address: str = "127.0.0.1:8766") -> Dict[str, Any]:
+    """Serve a generated world in real time to viewers in another process and measure both ends"""
+    import multiprocessing
+    from worldGenerator import WorldGenerator
+
+    simulation = Simulation(WorldGenerator(seed=0).generate(objects))
+    server = WorldServer(simulation)
+    results = multiprocessing.Queue()
+    ready = multiprocessing.Event()
+
+    async def main():
+        listener = await open_server(address, server._serve_viewer)
+        process = multiprocessing.Process(target=_run_viewers, args=(address, viewers, slow, ready, results))
+        process.start()
+        # Let every viewer connect and load its snapshot before timing the steady state
+        await asyncio.to_thread(ready.wait)
+        frames_before = server.stats["frames"]
+        late_before = server.stats["late_frames"]
+        started = time.perf_counter()
+        await server.run(frames=frames_before + int(seconds * FPS))
+        elapsed = time.perf_counter() - started
+        resyncs = sum(viewer.resyncs for viewer in server.viewers)
+        listener.close()
+        server.disconnect(abort=True)
+        report = await asyncio.to_thread(results.get)
+        await asyncio.to_thread(process.join)
+        frames = server.stats["frames"] - frames_before
+        report.update({
+            "viewers": viewers,
+            "objects": objects,
+            "simulated_fps": frames / elapsed,
+            "late_frames": server.stats["late_frames"] - late_before,
+            "snapshot_bytes": len(server.snapshot()),
+            "delta_bytes_mean": server.stats["bytes_encoded"] / max(1, server.stats["broadcasts"]),
+            "resyncs": resyncs,
+        })
+        return report
+
+    return asyncio.run(main())
+
+
+if __name__ == "__main__":
+    import argparse
+    from worldGenerator import WorldGenerator, trolley_problem
+    from worldStore import load_world
+
+    parser = argparse.ArgumentParser(description="Serve a running world to viewers")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="HOST:PORT, or unix:PATH for a Unix socket")
+    parser.add_argument("--load", help="world file to serve")
+    parser.add_argument("--generate", type=int, default=200, help="generate a world with this many objects")
+    parser.add_argument("--scenario", choices=["best_friend", "fat_man"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--broadcast-hz", type=float, default=20)
+    parser.add_argument("--queue-frames", type=int, default=8)
+    parser.add_argument("--fast", action="store_true", help="step as fast as possible instead of in real time")
+    parser.add_argument("--policy", choices=["local", "model"], default="local")
+    parser.add_argument("--fallback", metavar="POLICY",
+                        help='with --policy model: "rules" or a lookup table, used when the AI misses the deadline')
+    parser.add_argument("--deadline", type=float, default=0.25, help="seconds to wait for the AI before falling back")
+    parser.add_argument("--benchmark", type=int, metavar="VIEWERS", help="measure fan-out to this many viewers")
+    parser.add_argument("--track-memory", type=float, metavar="SECONDS",
+                        help="report the biggest memory growth every this many seconds")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, value in benchmark_fanout(args.benchmark, args.generate).items():
+            print(f"{name:>22}: {value:.2f}" if isinstance(value, float) else f"{name:>22}: {value}")
+    else:
+        if args.load:
+            objects, interactions = load_world(args.load)
+        elif args.scenario:
+            objects, interactions = trolley_problem(args.scenario)
+        else:
+            objects, interactions = WorldGenerator(seed=args.seed).generate(args.generate), []
+        config = ServerConfig(broadcast_hz=args.broadcast_hz, realtime=not args.fast, queue_frames=args.queue_frames,
+                              policy=args.policy, seed=args.seed, fallback=args.fallback, deadline=args.deadline)
+        print(f"Serving {len(objects)} objects on {args.address}")
+        if args.track_memory:
+            from profiling import MemoryTracker
+            MemoryTracker(args.track_memory).start()
+        try:
+            asyncio.run(WorldServer(Simulation(objects, interactions), config).serve(args.address))
+        except KeyboardInterrupt:
+            pass
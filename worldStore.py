@@ -0,0 +1,305 @@
+"""Save and load worlds as JSON (for interchange) or as a compact memory-mapped binary file.
+
+The binary layout is:
+
+    header | metadata (JSON) | fixed-size object records | string blob
+
+Each record holds the position, color, shape/type indices and offsets of the
+name and interactions in the string blob, so a world can be opened without
+decoding anything and objects are only built when they are accessed.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"FWLD"
+VERSION = 2  # 1 stored positions as float32
+BINARY_SUFFIX = ".fworld"
+
+# magic, version, reserved, object count, metadata length, records offset, strings offset
+_HEADER = struct.Struct("<4sHHIIQQ")
+# x, y, name offset, name length, interactions offset, interactions length, r, g, b, shape, type
+# Positions are doubles so a world comes back exactly as the JSON format would return it
+_RECORD = struct.Struct("<ddIIIIBBBBBxxx")
+
+
+@dataclass
+class StoredObject:
+    name: str
+    object_type: str
+    x: float
+    y: float
+    color: tuple
+    shape: str
+    interactions: Dict[str, str]
+
+
+def _fields(obj) -> Dict[str, Any]:
+    """Read the stored fields from a GameObject-like object or an Object dict"""
+    if isinstance(obj, dict):
+        return {
+            "name": obj["name"],
+            "object_type": obj.get("object_type", "NonLiving"),
+            "x": obj.get("x", 0.0),
+            "y": obj.get("y", 0.0),
+            "color": tuple(obj.get("color", (255, 255, 255))),
+            "shape": obj.get("shape", "circle"),
+            "interactions": obj.get("interactions", {}),
+        }
+    return {
+        "name": obj.name,
+        "object_type": obj.object_type,
+        "x": obj.x,
+        "y": obj.y,
+        "color": tuple(obj.color),
+        "shape": obj.shape,
+        "interactions": obj.interactions,
+    }
+
+
+def _is_json(path: str, format: Optional[str]) -> bool:
+    if format is not None:
+        if format not in ("json", "binary"):
+            raise ValueError(f"Unknown world format: {format}")
+        return format == "json"
+    return path.lower().endswith(".json")
+
+
+def save_world(path: str, objects: Sequence, interactions: Sequence[Dict[str, str]] = (),
+               format: Optional[str] = None):
+    """Save objects and pending interactions; the format follows the file suffix unless given"""
+    if _is_json(path, format):
+        data = _save_json(objects, interactions)
+    else:
+        data = _save_binary(objects, interactions)
+    # Write to a temporary file first so a crash never leaves a half written world behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _save_json(objects: Sequence, interactions: Sequence[Dict[str, str]]) -> bytes:
+    records = []
+    for obj in objects:
+        fields = _fields(obj)
+        fields["color"] = list(fields["color"])
+        records.append(fields)
+    return json.dumps({
+        "version": VERSION,
+        "objects": records,
+        "interactions": list(interactions),
+    }).encode("utf-8")
+
+
+def _save_binary(objects: Sequence, interactions: Sequence[Dict[str, str]]) -> bytes:
+    shapes: Dict[str, int] = {}
+    types: Dict[str, int] = {}
+    # Identical interaction dicts are stored once and shared by offset
+    interaction_blobs: Dict[str, Tuple[int, int]] = {}
+    strings = bytearray()
+    records = bytearray()
+
+    for obj in objects:
+        fields = _fields(obj)
+        shape_index = shapes.setdefault(fields["shape"], len(shapes))
+        type_index = types.setdefault(fields["object_type"], len(types))
+        if shape_index > 255 or type_index > 255:
+            raise ValueError("A binary world supports at most 256 shapes and 256 object types")
+
+        name = fields["name"].encode("utf-8")
+        name_offset = len(strings)
+        strings += name
+
+        key = json.dumps(fields["interactions"], sort_keys=True, separators=(",", ":"))
+        if key not in interaction_blobs:
+            blob = key.encode("utf-8")
+            interaction_blobs[key] = (len(strings), len(blob))
+            strings += blob
+        inter_offset, inter_length = interaction_blobs[key]
+
+        r, g, b = fields["color"][:3]
+        records += _RECORD.pack(fields["x"], fields["y"], name_offset, len(name),
+                                inter_offset, inter_length, r, g, b, shape_index, type_index)
+
+    meta = json.dumps({
+        "shapes": list(shapes),
+        "types": list(types),
+        "interactions": list(interactions),
+    }).encode("utf-8")
+    records_offset = _HEADER.size + len(meta)
+    strings_offset = records_offset + len(records)
+    header = _HEADER.pack(MAGIC, VERSION, 0, len(records) // _RECORD.size, len(meta),
+                          records_offset, strings_offset)
+    return b"".join((header, meta, bytes(records), bytes(strings)))
+
+
+class MappedWorld(Sequence):
+    """A read-only, lazily decoded view of a binary world file"""
+
+    def __init__(self, path: str, factory: Callable[..., Any] = StoredObject):
+        self.factory = factory
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty, not a world file")
+        magic, version, _, count, meta_length, records_offset, strings_offset = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a world file")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported world file version {version}")
+
+        meta = json.loads(self._map[_HEADER.size:_HEADER.size + meta_length])
+        self.shapes: List[str] = meta["shapes"]
+        self.types: List[str] = meta["types"]
+        self.interactions: List[Dict[str, str]] = meta["interactions"]
+        self._count = count
+        self._records_offset = records_offset
+        self._strings_offset = strings_offset
+        self._interaction_cache: Dict[int, Dict[str, str]] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("world object index out of range")
+        record = _RECORD.unpack_from(self._map, self._records_offset + index * _RECORD.size)
+        return self._build(record)
+
+    def __iter__(self) -> Iterator:
+        for batch in self.iter_batches():
+            yield from batch
+
+    def iter_batches(self, batch_size: int = 4096) -> Iterator[List]:
+        """Decode objects a batch at a time so callers can load incrementally"""
+        for start in range(0, self._count, batch_size):
+            stop = min(start + batch_size, self._count)
+            view = self._map[self._records_offset + start * _RECORD.size:
+                             self._records_offset + stop * _RECORD.size]
+            yield [self._build(record) for record in _RECORD.iter_unpack(view)]
+
+    def _build(self, record):
+        x, y, name_offset, name_length, inter_offset, inter_length, r, g, b, shape, object_type = record
+        start = self._strings_offset + name_offset
+        name = self._map[start:start + name_length].decode("utf-8")
+        interactions = self._interaction_cache.get(inter_offset)
+        if interactions is None:
+            start = self._strings_offset + inter_offset
+            interactions = json.loads(self._map[start:start + inter_length])
+            self._interaction_cache[inter_offset] = interactions
+        return self.factory(
+            name=name,
+            object_type=self.types[object_type],
+            x=x,
+            y=y,
+            color=(r, g, b),
+            shape=self.shapes[shape],
+            # Objects get their own copy so editing one never changes another
+            interactions=dict(interactions),
+        )
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_world(path: str, factory: Callable[..., Any] = StoredObject,
+               format: Optional[str] = None) -> Tuple[Sequence, List[Dict[str, str]]]:
+    """Load a world, returning (objects, interactions)
+
+    Binary worlds come back as a lazy MappedWorld; JSON worlds are fully decoded.
+    `factory` is called with the stored fields to build each object.
+    """
+    if _is_json(path, format):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        objects = [factory(**{**record, "color": tuple(record["color"])})
+                   for record in data["objects"]]
+        return objects, data.get("interactions", [])
+    world = MappedWorld(path, factory)
+    return world, world.interactions
+
+
+def object_dict(obj) -> Dict[str, Any]:
+    """Build the Object dict the AI sees from a stored or game object"""
+    return {
+        "name": obj.name,
+        "object_type": obj.object_type,
+        "interactions": obj.interactions,
+    }
+
+
+def observation(objects: Sequence, interactions: Sequence[Dict[str, str]] = ()) -> Dict[str, Any]:
+    """Build the JSON payload sent to the AI for a world without going through a GUI"""
+    return {
+        "objects": [object_dict(obj) for obj in objects],
+        "interactionsWithYou": list(interactions),
+    }
+
+
+def benchmark(count: int = 100_000, directory: str = "."):
+    """Compare saving and loading `count` objects through the JSON and binary paths"""
+    shapes = ["circle", "triangle", "square", "pentagon"]
+    objects = [
+        StoredObject(
+            name=f"Object {i}",
+            object_type="Living" if i % 3 == 0 else "NonLiving",
+            x=float(i % 800),
+            y=float(i % 600),
+            color=(255, i % 256, 0),
+            shape=shapes[i % len(shapes)],
+            interactions={"talk": "Say something"} if i % 3 == 0 else {"push": "Push it"},
+        )
+        for i in range(count)
+    ]
+    results = {}
+    for format, suffix in (("json", ".json"), ("binary", BINARY_SUFFIX)):
+        path = os.path.join(directory, f"benchmark_world{suffix}")
+        started = time.perf_counter()
+        save_world(path, objects)
+        saved = time.perf_counter()
+        loaded, _ = load_world(path)
+        opened = time.perf_counter()
+        materialized = list(loaded)
+        done = time.perf_counter()
+        if isinstance(loaded, MappedWorld):
+            loaded.close()
+        assert len(materialized) == count
+        results[format] = {
+            "size_bytes": os.path.getsize(path),
+            "save_s": saved - started,
+            "open_s": opened - saved,
+            "materialize_s": done - opened,
+        }
+        os.remove(path)
+    return results
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    for format, result in benchmark(count).items():
+        print(f"{format:>6}: {result['size_bytes'] / 1e6:7.2f} MB  "
+              f"save {result['save_s'] * 1000:8.1f} ms  "
+              f"open {result['open_s'] * 1000:8.1f} ms  "
+              f"materialize {result['materialize_s'] * 1000:8.1f} ms")